@@ -0,0 +1,192 @@
+import copy
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class LRUCache:
+    """Thread safe in-process LRU cache with a maximum size and a time to live.
+
+    Values are copied in and out of the cache, so callers can mutate what they get.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Get a value, MISSING if it is not cached or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return copy.copy(value)
+
+    def set(self, key, value):
+        """Cache a value, evicting the least recently used values above the maximum size."""
+        value = copy.copy(value)
+        with self._lock:
+            self._set(key, value)
+
+    def add(self, key, value):
+        """Cache a value unless the key is already cached, and get the cached value."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                return copy.copy(entry[0])
+            self._set(key, copy.copy(value))
+        return value
+
+    def _set(self, key, value):
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete_many(self, keys):
+        """Remove the given keys."""
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove all the values."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Get the counters of the cache."""
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class TieredCache:
+    """Read-through cache with an in-process LRU tier in front of a django cache backend tier.
+
+    Either tier is optional. Every key has a generation token, kept in the backend tier when there is
+    one so that all the processes share it, and the values are cached with the token read before
+    they were loaded. Invalidating a key replaces its token, so a value loaded before an invalidation
+    and cached after it is never served once the token is read again. With both tiers a process keeps
+    the tokens it read for the TTL of the LRU tier, so that its hits do not read the backend, and
+    serves the values invalidated by other processes for that long at most, its own invalidations
+    are seen at once. A token which is evicted is replaced by a new one, which only turns the cached
+    values of its key into misses.
+    """
+
+    def __init__(self, key_prefix, local=None, backend=None, backend_ttl=None):
+        self.key_prefix = key_prefix
+        self.local = local
+        self.backend = backend
+        self.backend_ttl = backend_ttl
+        # without a backend tier the tokens are kept by the process and do not expire, with one they are
+        # kept for the TTL of the LRU tier
+        self.local_tokens = LRUCache(max_size=local.max_size, ttl=math.inf if backend is None else local.ttl) if local is not None else None
+        self.backend_hits = 0
+        self.backend_misses = 0
+        self.stale = 0
+
+    def make_key(self, key):
+        return f"{self.key_prefix}:{key}"
+
+    def make_token_key(self, key):
+        return f"{key}:token"
+
+    @staticmethod
+    def new_token():
+        return uuid.uuid4().hex
+
+    def get_token(self, key):
+        """Get the generation token of a cache key, creating it if there is none. None if it can not be read."""
+        token_key = self.make_token_key(key)
+        if self.backend is None:
+            return self.local_tokens.add(token_key, self.new_token())
+        if self.local_tokens is not None:
+            token = self.local_tokens.get(token_key)
+            if token is not MISSING:
+                return token
+        token = self.backend.get(token_key)
+        if token is None:
+            self.backend.add(token_key, self.new_token(), None)
+            token = self.backend.get(token_key)
+        if token is not None and self.local_tokens is not None:
+            self.local_tokens.set(token_key, token)
+        return token
+
+    def get_or_load(self, key, load):
+        """Get a value from the first tier that has it with the current token, or load it with load() and cache it.
+
+        The token is read before the value is loaded, a concurrent invalidation replaces it and the
+        loaded value, cached with the previous token, is never served.
+        """
+        if self.local is None and self.backend is None:
+            return load()
+        key = self.make_key(key)
+        token = self.get_token(key)
+        if self.local is not None:
+            entry = self.local.get(key)
+            if entry is not MISSING:
+                if entry[0] == token:
+                    return copy.copy(entry[1])
+                self.stale += 1
+        if self.backend is not None:
+            entry = self.backend.get(key)
+            if entry is not None and entry[0] == token:
+                self.backend_hits += 1
+                if self.local is not None:
+                    self.local.set(key, entry)
+                return copy.copy(entry[1])
+            self.backend_misses += 1
+        value = load()
+        if token is not None:
+            # the cached value is not the one returned, so that callers can mutate it
+            entry = (token, copy.copy(value))
+            if self.local is not None:
+                self.local.set(key, entry)
+            if self.backend is not None:
+                self.backend.set(key, entry, self.backend_ttl)
+        return value
+
+    def delete_many(self, keys):
+        """Invalidate the given keys in all the tiers of all the processes, replacing their tokens."""
+        keys = [self.make_key(key) for key in keys]
+        if self.local is not None:
+            self.local.delete_many(keys)
+        tokens = {self.make_token_key(key): self.new_token() for key in keys}
+        if self.backend is not None:
+            self.backend.set_many(tokens, None)
+        if self.local_tokens is not None:
+            for token_key, token in tokens.items():
+                self.local_tokens.set(token_key, token)
+
+    def stats(self):
+        """Get the counters of all the tiers."""
+        stats = {"backend_hits": self.backend_hits, "backend_misses": self.backend_misses, "stale": self.stale}
+        if self.local is not None:
+            stats.update({f"local_{name}": value for name, value in self.local.stats().items()})
+        return stats
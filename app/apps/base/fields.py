@@ -0,0 +1,69 @@
+from decimal import Decimal
+from django import forms
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import connection, models
+from django.utils.functional import cached_property
+
+# Fields are defined here
+
+class MinorUnitDecimalField(models.BigIntegerField):
+    """A decimal amount stored as a BIGINT number of minor units, cents with the default decimal_places=2.
+
+    Python values are Decimals with decimal_places places, the database only sees integers, so the
+    increments, sums and comparisons of the database run on integers and a total overflows at
+    about 9.2e16 units instead of at max_digits digits. A value with more decimal places than the
+    field is rejected rather than rounded.
+    """
+    description = "Decimal number stored as an integer number of minor units"
+
+    def __init__(self, *args, decimal_places=2, **kwargs):
+        self.decimal_places = decimal_places
+        # every number of 18 digits fits in a bigint
+        self.max_digits = 18
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.decimal_places != 2:
+            kwargs["decimal_places"] = self.decimal_places
+        return name, path, args, kwargs
+
+    @cached_property
+    def bounds(self):
+        """The smallest and the largest amounts, the bounds of a bigint in units."""
+        min_value, max_value = connection.ops.integer_field_range(self.get_internal_type())
+        return self.from_minor_units(min_value), self.from_minor_units(max_value)
+
+    @cached_property
+    def validators(self):
+        """The bounds of a bigint, in units."""
+        min_value, max_value = self.bounds
+        return [*self.default_validators, *self._validators, MinValueValidator(min_value), MaxValueValidator(max_value)]
+
+    def to_minor_units(self, value):
+        """Convert a decimal amount to an integer number of minor units."""
+        minor_units = Decimal(str(value) if isinstance(value, float) else value).scaleb(self.decimal_places)
+        if minor_units != minor_units.to_integral_value():
+            raise ValueError(f"'{self.name}' has more than {self.decimal_places} decimal places: {value}.")
+        return int(minor_units)
+
+    def from_minor_units(self, value):
+        """Convert an integer number of minor units to a decimal amount."""
+        return Decimal(value).scaleb(-self.decimal_places)
+
+    def from_db_value(self, value, expression, connection):
+        # sums of bigints are numeric on postgres
+        return None if value is None else self.from_minor_units(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, Decimal):
+            return value
+        return forms.DecimalField(max_digits=self.max_digits, decimal_places=self.decimal_places).to_python(value)
+
+    def get_prep_value(self, value):
+        if value is None:
+            return value
+        return self.to_minor_units(value)
+
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{"form_class": forms.DecimalField, "max_digits": self.max_digits, "decimal_places": self.decimal_places, **kwargs})
@@ -0,0 +1,148 @@
+import threading
+from django.conf import settings
+
+# default latency buckets in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# buckets of small counts, queries per request or rows per write
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def is_enabled():
+    """Checks if the metrics are collected, settings.METRICS_ENABLED."""
+    return settings.METRICS_ENABLED
+
+
+def format_labels(names, values, extra=()):
+    """Format label names and values as a prometheus label set."""
+    labels = [*zip(names, values), *extra]
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+class Metric:
+    """Base of the metrics, a named family of series keyed by label values."""
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        """Render the metric in the prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            series = sorted(self._series.items())
+            lines.extend(line for label_values, value in series for line in self.render_series(label_values, value))
+        return lines
+
+
+class Counter(Metric):
+    """A value which only goes up."""
+    type = "counter"
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def render_series(self, label_values, value):
+        yield f"{self.name}{format_labels(self.labels, label_values)} {value}"
+
+
+class Histogram(Metric):
+    """Observations counted in cumulative buckets, with their count and sum."""
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0, 0]
+            bucket_counts = series[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    bucket_counts[index] += 1
+                    break
+            series[1] += 1
+            series[2] += value
+
+    def render_series(self, label_values, value):
+        bucket_counts, count, total = value
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, bucket_counts):
+            cumulative += bucket_count
+            yield f"{self.name}_bucket{format_labels(self.labels, label_values, [('le', bound)])} {cumulative}"
+        yield f"{self.name}_bucket{format_labels(self.labels, label_values, [('le', '+Inf')])} {count}"
+        yield f"{self.name}_count{format_labels(self.labels, label_values)} {count}"
+        yield f"{self.name}_sum{format_labels(self.labels, label_values)} {total}"
+
+
+class Gauge(Metric):
+    """A value read from a callback when the metrics are rendered.
+
+    The callback returns a dict of label values tuples to values.
+    """
+    type = "gauge"
+
+    def __init__(self, name, documentation, labels=(), callback=None):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+
+    def render(self):
+        with self._lock:
+            self._series = dict(self.callback())
+        return super().render()
+
+    def render_series(self, label_values, value):
+        yield f"{self.name}{format_labels(self.labels, label_values)} {value}"
+
+
+class MetricsRegistry:
+    """The metrics of the process, rendered together by the /metrics endpoint.
+
+    Metrics are kept per process, every worker process is scraped on its own.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Register a metric, the registered metric of the same name if there is one."""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DURATION_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def gauge(self, name, documentation, labels=(), callback=None):
+        return self.register(Gauge(name, documentation, labels, callback))
+
+    def clear(self):
+        """Reset the values of all the metrics."""
+        for metric in list(self._metrics.values()):
+            metric.clear()
+
+    def render(self):
+        """Render all the metrics in the prometheus text format."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,166 @@
+import math
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from contextlib import ExitStack
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from app.apps.base import metrics, routers
+
+REQUEST_DURATION = metrics.registry.histogram("http_request_duration_seconds", "Latency of the requests.", ("view", "method"))
+REQUESTS = metrics.registry.counter("http_requests_total", "Number of requests.", ("view", "method", "status"))
+REQUEST_QUERIES = metrics.registry.histogram("http_request_db_queries", "Number of SQL queries of a request.", ("view", "method"), buckets=metrics.COUNT_BUCKETS)
+REQUEST_DB_DURATION = metrics.registry.histogram("http_request_db_duration_seconds", "Time spent in SQL queries by a request.", ("view", "method"))
+
+
+class QueryRecorder:
+    """Database execute wrapper counting the queries and their time."""
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.queries += 1
+
+
+class MetricsMiddleware:
+    """Records the latency, SQL query count and SQL time of every request, per view.
+
+    The middleware is dropped from the stack when settings.METRICS_ENABLED is off, so it costs
+    nothing then. It is async capable, so it does not move the async views to a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not metrics.is_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with self.record_queries(recorder):
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - start, recorder)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with self.record_queries(recorder):
+            response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - start, recorder)
+        return response
+
+    @staticmethod
+    def record_queries(recorder):
+        """Install the recorder on every database connection."""
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    @staticmethod
+    def record(request, response, duration, recorder):
+        """Record the metrics of a request."""
+        match = request.resolver_match
+        view = match.view_name if match is not None else "unresolved"
+        REQUEST_DURATION.observe(duration, view, request.method)
+        REQUESTS.inc(view, request.method, str(response.status_code))
+        REQUEST_QUERIES.observe(recorder.queries, view, request.method)
+        REQUEST_DB_DURATION.observe(recorder.duration, view, request.method)
+
+
+class ReplicaRoutingMiddleware:
+    """Routes the reads of the read only requests to a replica, with read your writes consistency.
+
+    A request with an unsafe method reads and writes on the primary, and once it succeeded its
+    client is pinned to the primary for settings.DATABASE_ROUTING["STICKINESS"] seconds, so that it
+    reads its own writes while the replicas catch up. Browsers are pinned by a cookie, the clients
+    which do not keep cookies send back the X-DB-Primary-Until header of the write, the time until
+    which they are pinned. Both values are signed with the time of the write, a client can not forge
+    them and a value older than the stickiness is ignored whatever time it carries. The middleware
+    is dropped from the stack when there are no replicas.
+    """
+    sync_capable = True
+    async_capable = True
+    COOKIE_NAME = "db_primary"
+    HEADER_NAME = "X-DB-Primary-Until"
+    SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+    SIGNING_SALT = "app.apps.base.middleware.ReplicaRoutingMiddleware"
+
+    def __init__(self, get_response):
+        if not routers.get_replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.signer = signing.TimestampSigner(salt=self.SIGNING_SALT)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        alias = self.get_read_alias(request)
+        with routers.read_from(alias):
+            response = self.get_response(request)
+        return self.pin(request, self.bind_stream(response, alias))
+
+    async def __acall__(self, request):
+        alias = await self.aget_read_alias(request)
+        with routers.read_from(alias):
+            response = await self.get_response(request)
+        return self.pin(request, self.bind_stream(response, alias))
+
+    def get_read_alias(self, request):
+        """Get the replica the reads of a request go to, None for the primary."""
+        if request.method not in self.SAFE_METHODS or self.is_pinned(request):
+            return None
+        return routers.choose_replica()
+
+    async def aget_read_alias(self, request):
+        """Async version of get_read_alias."""
+        if request.method not in self.SAFE_METHODS or self.is_pinned(request):
+            return None
+        return await routers.achoose_replica()
+
+    def is_pinned(self, request):
+        """Check if the client of a request is pinned to the primary, by the cookie or the header."""
+        stickiness = settings.DATABASE_ROUTING["STICKINESS"]
+        for value in (request.COOKIES.get(self.COOKIE_NAME), request.headers.get(self.HEADER_NAME)):
+            if not value:
+                continue
+            try:
+                # the signature expires stickiness seconds after the write, which caps the pin
+                if float(self.signer.unsign(value, max_age=stickiness)) > time.time():
+                    return True
+            except (signing.BadSignature, ValueError):
+                continue
+        return False
+
+    def bind_stream(self, response, alias):
+        """Keep routing the reads of a streaming response, its content is consumed after the middleware returned."""
+        if alias is not None and response.streaming:
+            iterate = routers.aiterate_reading_from if response.is_async else routers.iterate_reading_from
+            response.streaming_content = iterate(response.streaming_content, alias)
+        return response
+
+    def pin(self, request, response):
+        """Pin the client to the primary after a successful write."""
+        if request.method not in self.SAFE_METHODS and response.status_code < 400:
+            stickiness = settings.DATABASE_ROUTING["STICKINESS"]
+            pinned_until = self.signer.sign(str(math.ceil(time.time() + stickiness)))
+            response.set_cookie(self.COOKIE_NAME, pinned_until, max_age=math.ceil(stickiness), httponly=True, samesite="Lax")
+            response[self.HEADER_NAME] = pinned_until
+        return response
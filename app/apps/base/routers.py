@@ -0,0 +1,162 @@
+import random
+import threading
+import time
+from asgiref.sync import sync_to_async
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+# alias the reads of the current request are routed to, None routes them to the primary
+_read_alias = ContextVar("read_alias", default=None)
+
+
+@contextmanager
+def read_from(alias):
+    """Route the reads of the block to a database alias, None for the primary."""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def iterate_reading_from(iterator, alias):
+    """Iterate with the reads routed to an alias, for content consumed after the request left read_from."""
+    iterator = iter(iterator)
+    while True:
+        with read_from(alias):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+async def aiterate_reading_from(iterator, alias):
+    """Async version of iterate_reading_from."""
+    iterator = aiter(iterator)
+    while True:
+        with read_from(alias):
+            try:
+                item = await anext(iterator)
+            except StopAsyncIteration:
+                return
+        yield item
+
+
+def read_from_primary():
+    """Route the reads of the block to the primary, for reads which must see the latest writes."""
+    return read_from(None)
+
+
+class ReplicaLagMonitor:
+    """Replication lag of the replicas, queried at most every settings.DATABASE_ROUTING["LAG_CHECK_INTERVAL"] seconds per process.
+
+    Only postgres replicas report a lag, a replica which can not be queried is infinitely late. The
+    async callers query it in a thread, the database connections can not be used from the event loop.
+    """
+    LAG_SQL = """
+        SELECT CASE
+            WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END
+    """
+
+    def __init__(self):
+        self._lags = {}
+        self._lock = threading.Lock()
+
+    def query_lag(self, alias):
+        """Query the lag in seconds of a replica."""
+        connection = connections[alias]
+        if connection.vendor != "postgresql":
+            return 0.0
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(self.LAG_SQL)
+                return float(cursor.fetchone()[0])
+        except DatabaseError:
+            return float("inf")
+
+    def get_checked_lag(self, alias):
+        """Get the last known lag in seconds of a replica, None when it is due for a check."""
+        with self._lock:
+            lag, checked_at = self._lags.get(alias, (None, None))
+        if checked_at is None or time.monotonic() - checked_at >= settings.DATABASE_ROUTING["LAG_CHECK_INTERVAL"]:
+            return None
+        return lag
+
+    def get_lag(self, alias):
+        """Get the lag in seconds of a replica, queried again when the last check is too old."""
+        lag = self.get_checked_lag(alias)
+        if lag is None:
+            lag = self.query_lag(alias)
+            self.set_lag(alias, lag)
+        return lag
+
+    async def aget_lag(self, alias):
+        """Async version of get_lag."""
+        lag = self.get_checked_lag(alias)
+        if lag is None:
+            lag = await sync_to_async(self.query_lag)(alias)
+            self.set_lag(alias, lag)
+        return lag
+
+    def set_lag(self, alias, lag):
+        """Record the lag of a replica, until the next check."""
+        with self._lock:
+            self._lags[alias] = (lag, time.monotonic())
+
+    def clear(self):
+        with self._lock:
+            self._lags.clear()
+
+
+lag_monitor = ReplicaLagMonitor()
+
+
+def get_replicas():
+    """Get the aliases of the replicas."""
+    return settings.DATABASE_ROUTING["REPLICAS"]
+
+
+def choose_replica():
+    """Choose a random replica lagging at most settings.DATABASE_ROUTING["MAX_LAG"] seconds, None if there is none."""
+    replicas = list(get_replicas())
+    max_lag = settings.DATABASE_ROUTING["MAX_LAG"]
+    if max_lag:
+        replicas = [alias for alias in replicas if lag_monitor.get_lag(alias) <= max_lag]
+    return random.choice(replicas) if replicas else None
+
+
+async def achoose_replica():
+    """Async version of choose_replica."""
+    replicas = list(get_replicas())
+    max_lag = settings.DATABASE_ROUTING["MAX_LAG"]
+    if max_lag:
+        replicas = [alias for alias in replicas if await lag_monitor.aget_lag(alias) <= max_lag]
+    return random.choice(replicas) if replicas else None
+
+
+class PrimaryReplicaRouter:
+    """Routes the writes to the primary and the reads to the alias chosen for the current request.
+
+    Reads go to the primary unless they run inside read_from(alias), which ReplicaRoutingMiddleware
+    sets for the read only requests of the clients which did not write recently, so management
+    commands and writes with their propagation to the ancestors always read from the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas receive the schema through replication
+        return False if db in get_replicas() else None
@@ -1,4 +1,8 @@
 from rest_framework import serializers
+from app.apps.base.fields import MinorUnitDecimalField
+
+# minor unit amounts keep the decimal representation of the API, DRF maps their max_digits and decimal_places
+serializers.ModelSerializer.serializer_field_mapping[MinorUnitDecimalField] = serializers.DecimalField
 
 class DynamicFieldsSerializer(serializers.ModelSerializer):
     """
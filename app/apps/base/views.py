@@ -1,3 +1,9 @@
-from django.shortcuts import render
+from django.http import Http404, HttpResponse
+from app.apps.base import metrics
 
-# Create your views here.
+
+def metrics_view(request):
+    """Render the metrics of the process in the prometheus text format, 404 when they are disabled."""
+    if not metrics.is_enabled():
+        raise Http404
+    return HttpResponse(metrics.registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
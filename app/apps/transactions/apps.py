@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = "app.apps.transactions"
+
+    def ready(self):
+        # a misconfigured transaction cache stops the startup instead of the first retrieve
+        from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+        TransactionRepository.get_cache()
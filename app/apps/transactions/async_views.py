@@ -0,0 +1,100 @@
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse
+from django.views import View
+from rest_framework.exceptions import APIException, NotFound, ValidationError as APIValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from app.apps.transactions.filters import TransactionFilter
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from app.apps.transactions.serializers import TransactionCreateSerializer, TransactionReadSerializer, TransactionRowSerializer
+from app.apps.transactions.services.transaction_service import TransactionService
+from app.apps.transactions.services.transaction_shard_service import TransactionShardService, TreeMovedError
+from app.apps.transactions.views import TreeMoved, get_requested_fields, is_pagination_disabled
+from app.apps.base.pagination import StandardResultsSetPagination, KeysetCursorPagination
+
+
+class AsyncTransactionView(View):
+    """Base of the async transaction views.
+
+    DRF views are synchronous, so under ASGI every request to TransactionViewSet holds a thread of
+    the sync_to_async pool. These views are django async views which read with the async ORM and
+    render the same responses as the matching TransactionViewSet actions.
+    """
+    renderer = JSONRenderer()
+
+    async def dispatch(self, request, *args, **kwargs):
+        """Render the DRF exceptions the same way as the DRF views."""
+        try:
+            try:
+                return await super().dispatch(request, *args, **kwargs)
+            except TreeMovedError:
+                raise TreeMoved
+        except APIException as exc:
+            data = exc.detail if isinstance(exc.detail, (list, dict)) else {"detail": exc.detail}
+            return self.render(data, exc.status_code)
+
+    def render(self, data, status=200):
+        """Render data as a JSON response."""
+        return HttpResponse(self.renderer.render(data), status=status, content_type="application/json")
+
+
+class AsyncTransactionListView(AsyncTransactionView):
+    """Async list and create of transactions."""
+
+    async def get(self, request):
+        """List transactions, with the same fields, filters and pagination as TransactionViewSet.list."""
+        request = Request(request)
+        serializer = TransactionRowSerializer(get_requested_fields(request))
+        filterset = TransactionFilter(request.query_params, queryset=TransactionRepository.get_all_queryset())
+        if not filterset.is_valid():
+            raise APIValidationError(filterset.errors)
+        ordering_columns = [field.lstrip("-") for field in KeysetCursorPagination.ordering]
+        queryset = TransactionShardService.fan_out(filterset.qs.order_by(*KeysetCursorPagination.ordering)).values(*serializer.columns, *ordering_columns)
+        # pagination
+        paginator = KeysetCursorPagination() if request.query_params.get("pagination") == "cursor" else StandardResultsSetPagination()
+        page = await paginator.apaginate_queryset(queryset, request) if not is_pagination_disabled(request, paginator) else None
+        rows = page if page is not None else [row async for row in queryset]
+        if "total_amount" in serializer.fields:
+            await TransactionService.aapply_pending_total_amounts_to_rows(rows)
+        data = serializer.many_to_representation(rows)
+        if page is not None:
+            data = paginator.get_paginated_response(data).data
+        return self.render(data)
+
+    async def post(self, request):
+        """Create a transaction."""
+        request = Request(request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES])
+        serializer = TransactionCreateSerializer(data=request.data)
+        # validating the parent transaction reads the database
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        transaction = await TransactionService.acreate_transaction(serializer.validated_data)
+        return self.render(TransactionReadSerializer(transaction).data, 201)
+
+
+class AsyncTransactionDetailView(AsyncTransactionView):
+    """Async retrieve of a transaction."""
+
+    async def get(self, request, transaction_id):
+        """Retrieve a transaction, with the same fields as TransactionViewSet.retrieve."""
+        request = Request(request)
+        fields = get_requested_fields(request)
+        try:
+            if TransactionRepository.get_cache() is not None:
+                # the cache tiers are synchronous
+                return self.render(await sync_to_async(self.get_cached_data)(transaction_id, fields))
+            serializer = TransactionRowSerializer(fields)
+            row = await TransactionRepository.aget_transaction_row(transaction_id, serializer.columns)
+        except (TransactionRepository.get_model().DoesNotExist, ValueError, ValidationError):
+            raise NotFound
+        if "total_amount" in serializer.fields:
+            await TransactionService.aapply_pending_total_amounts_to_rows([row])
+        return self.render(serializer.to_representation(row))
+
+    def get_cached_data(self, transaction_id, fields):
+        """Get the representation of a transaction read through the transaction cache."""
+        instance = TransactionRepository.get_cached_transaction_by_id(transaction_id)
+        if fields is None or "total_amount" in fields:
+            TransactionService.apply_pending_total_amounts([instance])
+        return TransactionReadSerializer(instance, fields=fields).data
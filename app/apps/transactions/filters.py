@@ -6,5 +6,5 @@ class TransactionFilter(rest_framework.FilterSet):
     """Transaction filter class."""
     class Meta:
         model = TransactionRepository.get_model()
-        fields = ("transaction_type",)
-
+        # created_at ranges only scan the matching partitions of a partitioned table
+        fields = {"transaction_type": ["exact"], "created_at": ["gte", "lt"]}
@@ -0,0 +1,32 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from app.apps.transactions.services.transaction_ingestion_service import TransactionIngestionService
+
+
+class Command(BaseCommand):
+    help = "Creates the queued transactions of the ingest endpoint in batches, one commit per batch."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.TRANSACTIONS_INGESTION["BATCH_SIZE"], help="Maximum number of transactions created per commit.")
+        parser.add_argument("--linger", type=float, default=settings.TRANSACTIONS_INGESTION["LINGER"], help="Seconds waited for the queue to fill after a partial batch.")
+        parser.add_argument("--poll-interval", type=float, default=1, help="Seconds waited when the queue is empty.")
+        parser.add_argument("--once", action="store_true", help="Drain the queue until it is empty and exit.")
+
+    def handle(self, *args, **options):
+        while True:
+            created, failed = TransactionIngestionService.drain_batch(options["batch_size"])
+            if created or failed:
+                self.stdout.write(f"Created {created} transactions, {failed} ingestions failed.")
+            drained = created + failed
+            if options["once"]:
+                if not drained:
+                    return
+            elif not drained:
+                deleted = TransactionIngestionService.delete_processed()
+                if deleted:
+                    self.stdout.write(f"Deleted {deleted} processed ingestions.")
+                time.sleep(options["poll_interval"])
+            elif drained < options["batch_size"]:
+                # a partial batch, give the queue time to fill so that the next commit is shared by more transactions
+                time.sleep(options["linger"])
@@ -0,0 +1,43 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from app.apps.transactions.services.transaction_import_service import TransactionImportService
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk imports transactions from a CSV or NDJSON file with the columns id, parent_transaction, amount, "
+        "transaction_type and created_at. Parents are either part of the file or existing transactions, the rows "
+        "without an id get an id derived from the content of the file and their line."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Path of the CSV or NDJSON file.")
+        parser.add_argument("--format", choices=[TransactionImportService.CSV_FORMAT, TransactionImportService.NDJSON_FORMAT], help="Format of the file, guessed from its extension by default.")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Number of transactions loaded per commit.")
+        parser.add_argument("--resume", action="store_true", help="Skip the transactions loaded by a previous, failed import of the same file.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"]
+        if file_format is None:
+            file_format = TransactionImportService.CSV_FORMAT if os.path.splitext(path)[1].lower() == ".csv" else TransactionImportService.NDJSON_FORMAT
+
+        try:
+            with open(path, newline="", encoding="utf-8") as lines:
+                id_namespace = TransactionImportService.get_id_namespace(lines)
+            with open(path, newline="", encoding="utf-8") as lines:
+                transactions = [
+                    TransactionImportService.parse_row(row, line_number, id_namespace)
+                    for line_number, row in TransactionImportService.read_rows(lines, file_format)
+                ]
+            self.stdout.write(f"Read {len(transactions)} transactions.")
+            transactions, external_amounts = TransactionImportService.plan_import(transactions)
+            TransactionImportService.stamp_created_at(transactions, resume=options["resume"])
+        except (OSError, ValueError) as error:
+            raise CommandError(str(error))
+
+        def progress(loaded, rate):
+            self.stdout.write(f"Loaded {loaded}/{len(transactions)} transactions ({rate:.0f} rows/s).")
+
+        loaded = TransactionImportService.load(transactions, external_amounts, batch_size=options["batch_size"], resume=options["resume"], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f"Imported {loaded} transactions."))
@@ -0,0 +1,37 @@
+from datetime import datetime, timezone as dt_timezone
+from django.core.management.base import BaseCommand, CommandError
+from app.apps.transactions.services.transaction_partition_service import TransactionPartitionService
+
+
+class Command(BaseCommand):
+    help = "Partitions the transactions table by month of created_at and manages its partitions, postgres only."
+
+    def add_arguments(self, parser):
+        actions = parser.add_mutually_exclusive_group(required=True)
+        actions.add_argument("--convert", action="store_true", help="Convert the transactions table to a partitioned table, locks it while the rows are copied.")
+        actions.add_argument("--create-ahead", action="store_true", help="Create the missing partitions of the coming months, meant to run periodically.")
+        actions.add_argument("--detach", metavar="YYYY-MM", help="Detach the partition of a month, it is kept as a regular table to archive.")
+        actions.add_argument("--list", action="store_true", help="List the partitions.")
+        parser.add_argument("--months-ahead", type=int, default=3, help="Months after the current one to create partitions for.")
+        parser.add_argument("--force", action="store_true", help="Detach even if other partitions or pending deltas reference its transactions.")
+
+    def handle(self, *args, **options):
+        try:
+            if options["convert"]:
+                partitions, copied = TransactionPartitionService.convert(months_ahead=options["months_ahead"])
+                self.stdout.write(f"Converted the transactions table to {partitions} monthly partitions, copied {copied} transactions.")
+            elif options["create_ahead"]:
+                created = TransactionPartitionService.create_future_partitions(months_ahead=options["months_ahead"])
+                self.stdout.write(f"Created {len(created)} partitions{': ' + ', '.join(created) if created else ''}.")
+            elif options["detach"]:
+                try:
+                    month_start = datetime.strptime(options["detach"], "%Y-%m").replace(tzinfo=dt_timezone.utc)
+                except ValueError:
+                    raise CommandError(f"--detach expects a YYYY-MM month: {options['detach']}")
+                name = TransactionPartitionService.detach_partition(month_start, force=options["force"])
+                self.stdout.write(f"Detached {name}, archive it then drop it.")
+            else:
+                for name, bound, rows in TransactionPartitionService.get_partitions():
+                    self.stdout.write(f"{name}: {bound}, ~{max(rows, 0)} rows")
+        except ValueError as error:
+            raise CommandError(str(error))
@@ -0,0 +1,45 @@
+import uuid
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from app.apps.transactions.services.transaction_shard_service import TransactionShardService
+
+
+class Command(BaseCommand):
+    help = "Lists the transactions of every shard and moves trees of transactions between shards."
+
+    def add_arguments(self, parser):
+        actions = parser.add_mutually_exclusive_group(required=True)
+        actions.add_argument("--list", action="store_true", help="List the number of transactions of every shard.")
+        actions.add_argument("--move", metavar="ROOT_ID", help="Move the tree of a root transaction, to the shard given with --to.")
+        actions.add_argument("--auto", action="store_true", help="Move trees from the fullest shards to the emptiest ones.")
+        parser.add_argument("--to", metavar="ALIAS", help="Shard the tree of --move is moved to.")
+        parser.add_argument("--max-moves", type=int, default=10, help="Maximum number of trees moved by --auto.")
+        parser.add_argument("--dry-run", action="store_true", help="Print the moves of --auto without moving.")
+        parser.add_argument(
+            "--wait", type=float, default=settings.TRANSACTIONS_SHARDING["DIRECTORY_CACHE_TTL"],
+            help="Seconds waited before the copy of a moved tree is deleted from its previous shard, the directory cache TTL by default.",
+        )
+
+    def handle(self, *args, **options):
+        if not TransactionShardService.is_sharded():
+            raise CommandError("The transactions are not sharded, add shards with DB_SHARDS.")
+        try:
+            if options["list"]:
+                for alias, count in TransactionShardService.count_transactions_by_shard().items():
+                    self.stdout.write(f"{alias}: {count} transactions")
+            elif options["move"]:
+                if not options["to"]:
+                    raise CommandError("--move requires --to.")
+                try:
+                    root_id = uuid.UUID(options["move"])
+                except ValueError:
+                    raise CommandError(f"--move expects the id of a root transaction: {options['move']}")
+                moved = TransactionShardService.move_tree(root_id, options["to"], wait=options["wait"])
+                self.stdout.write(f"Moved {moved} transactions to {options['to']}.")
+            else:
+                for root_id, size, source, target in TransactionShardService.plan_rebalance(options["max_moves"]):
+                    if not options["dry_run"]:
+                        TransactionShardService.move_tree(root_id, target, wait=options["wait"])
+                    self.stdout.write(f"{'Would move' if options['dry_run'] else 'Moved'} the tree {root_id} of {size} transactions from {source} to {target}.")
+        except ValueError as error:
+            raise CommandError(str(error))
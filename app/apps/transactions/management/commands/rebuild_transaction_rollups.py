@@ -0,0 +1,31 @@
+import os
+from datetime import timezone as dt_timezone
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from app.apps.transactions.services.transaction_rollup_service import TransactionRollupService
+
+
+class Command(BaseCommand):
+    help = "Recomputes the hourly and daily transaction rollups of a time window, in parallel chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", help="Start of the window, an ISO datetime. Defaults to 90 days before the end.")
+        parser.add_argument("--end", help="End of the window, an ISO datetime. Defaults to now.")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of chunks aggregated at a time, each with its own connection.")
+        parser.add_argument("--chunk-days", type=int, default=1, help="Days aggregated by a worker at a time.")
+
+    def parse_datetime(self, value, name):
+        """Parse an ISO datetime option, naive datetimes are in UTC."""
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise CommandError(f"--{name} is not a valid ISO datetime: {value}")
+        return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed, dt_timezone.utc)
+
+    def handle(self, *args, **options):
+        end = self.parse_datetime(options["end"], "end") if options["end"] else timezone.now()
+        start = self.parse_datetime(options["start"], "start") if options["start"] else end - TransactionRollupService.DEFAULT_WINDOW
+        if start >= end:
+            raise CommandError("--start must be before --end.")
+        read, written = TransactionRollupService.rebuild_rollups(start, end, workers=options["workers"], chunk_days=options["chunk_days"])
+        self.stdout.write(f"Rebuilt {written} rollups from {read} transactions between {start.isoformat()} and {end.isoformat()}.")
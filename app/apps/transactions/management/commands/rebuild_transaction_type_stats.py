@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from app.apps.transactions.services.transaction_type_stats_service import TransactionTypeStatsService
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the transaction type stats from the transactions in one streaming pass."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Number of rows fetched from the database at a time.")
+
+    def handle(self, *args, **options):
+        read = TransactionTypeStatsService.rebuild_stats(chunk_size=options["chunk_size"])
+        self.stdout.write(f"Rebuilt the transaction type stats from {read} transactions.")
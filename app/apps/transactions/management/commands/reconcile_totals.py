@@ -0,0 +1,27 @@
+import os
+from django.core.management.base import BaseCommand
+from app.apps.transactions.services.total_amount_reconciliation_service import TotalAmountReconciliationService
+
+
+class Command(BaseCommand):
+    help = "Recomputes the total amount of every transaction from its subtree and reports or fixes the mismatches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true", help="Fix the mismatched total amounts.")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes.")
+        parser.add_argument("--partition-rows", type=int, default=100000, help="Rows of whole trees handed to a worker at a time.")
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Rows fetched from the database at a time.")
+        parser.add_argument("--show", type=int, default=20, help="Number of mismatches printed.")
+
+    def handle(self, *args, **options):
+        checked, mismatched, mismatches = TotalAmountReconciliationService.reconcile(
+            workers=options["workers"],
+            max_rows=options["partition_rows"],
+            chunk_size=options["chunk_size"],
+            fix=options["fix"],
+            sample_size=options["show"],
+        )
+        for mismatch in mismatches:
+            self.stdout.write(f"{mismatch.transaction_id}: total amount {mismatch.total_amount}, expected {mismatch.expected_total_amount}")
+        action = "Fixed" if options["fix"] else "Found"
+        self.stdout.write(f"Checked {checked} transactions. {action} {mismatched} mismatched total amounts.")
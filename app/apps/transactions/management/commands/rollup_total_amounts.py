@@ -0,0 +1,19 @@
+import time
+from django.core.management.base import BaseCommand
+from app.apps.transactions.services.transaction_service import TransactionService
+
+
+class Command(BaseCommand):
+    help = "Folds the pending total amount deltas into the total amount of the transactions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of deltas folded per commit.")
+        parser.add_argument("--interval", type=float, default=0, help="Keep running and roll up every interval seconds.")
+
+    def handle(self, *args, **options):
+        while True:
+            folded = TransactionService.rollup_total_amount_deltas(batch_size=options["batch_size"])
+            self.stdout.write(f"Folded {folded} total amount deltas.")
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,96 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:04
+
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 1000
+PATH_SEPARATOR = "/"
+
+
+def backfill_hierarchy_index(apps, schema_editor):
+    """Backfills path, depth and root_id in batches, top down, level by level.
+
+    Roots are filled first, then the children of every level are filled from the rows of the level
+    above, which are read by depth in batches of ids. Every batch resumes after the last id of the
+    previous one, so each level is read once.
+    """
+    Transaction = apps.get_model("transactions", "Transaction")
+    db_alias = schema_editor.connection.alias
+    manager = Transaction.objects.using(db_alias)
+
+    def iterate_batches(queryset):
+        last_id = None
+        while True:
+            batch = queryset.order_by("id")
+            if last_id is not None:
+                batch = batch.filter(id__gt=last_id)
+            batch = list(batch[:BATCH_SIZE])
+            if not batch:
+                return
+            yield batch
+            last_id = batch[-1].id
+
+    for roots in iterate_batches(manager.filter(parent_transaction__isnull=True).only("id")):
+        with transaction.atomic(using=db_alias):
+            for root in roots:
+                root.path = root.id.hex + PATH_SEPARATOR
+                root.depth = 0
+                root.root_id = root.id
+            manager.bulk_update(roots, ["path", "depth", "root_id"])
+
+    depth = 0
+    while True:
+        # the rows which are not filled yet also have a depth of 0, the parents of the first level are the roots
+        parents = manager.filter(parent_transaction__isnull=True) if depth == 0 else manager.filter(depth=depth)
+        filled = 0
+        for batch in iterate_batches(parents.only("id", "path", "depth", "root_id")):
+            parents_by_id = {parent.id: parent for parent in batch}
+            with transaction.atomic(using=db_alias):
+                children = list(manager.filter(parent_transaction__in=list(parents_by_id)).only("id", "parent_transaction"))
+                for child in children:
+                    parent = parents_by_id[child.parent_transaction_id]
+                    child.path = parent.path + child.id.hex + PATH_SEPARATOR
+                    child.depth = parent.depth + 1
+                    child.root_id = parent.root_id
+                manager.bulk_update(children, ["path", "depth", "root_id"], batch_size=BATCH_SIZE)
+            filled += len(children)
+        if not filled:
+            break
+        depth += 1
+
+
+class Migration(migrations.Migration):
+
+    # every backfill batch is committed on its own
+    atomic = False
+
+    dependencies = [
+        ('transactions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='path',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='root_id',
+            field=models.UUIDField(db_index=True, editable=False, null=True),
+        ),
+        # reading a level by depth, dropped once the backfill is done
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['depth', 'id'], name='transaction_depth_backfill_idx'),
+        ),
+        migrations.RunPython(backfill_hierarchy_index, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='transaction_depth_backfill_idx',
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0002_transaction_hierarchy_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionTotalAmountDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='total_amount_deltas', to='transactions.transaction')),
+            ],
+            options={
+                'verbose_name': 'Transaction total amount delta',
+                'verbose_name_plural': 'Transaction total amount deltas',
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0004_transaction_created_at_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionTypeStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_type', models.CharField(max_length=50, unique=True)),
+                ('count', models.PositiveBigIntegerField(default=0)),
+                ('amount_sum', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('min_amount', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('max_amount', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Transaction type stats',
+                'verbose_name_plural': 'Transaction type stats',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['transaction_type', 'amount'], name='transaction_type_amount_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0006_transaction_created_at_id_covering_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_type', models.CharField(max_length=50)),
+                ('bucket_start', models.DateTimeField()),
+                ('count', models.PositiveBigIntegerField(default=0)),
+                ('amount_sum', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+            ],
+            options={
+                'verbose_name': 'Transaction daily rollup',
+                'verbose_name_plural': 'Transaction daily rollups',
+                'indexes': [models.Index(fields=['bucket_start'], name='transaction_daily_bucket_idx')],
+                'constraints': [models.UniqueConstraint(fields=('transaction_type', 'bucket_start'), name='transaction_daily_rollup_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='TransactionHourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_type', models.CharField(max_length=50)),
+                ('bucket_start', models.DateTimeField()),
+                ('count', models.PositiveBigIntegerField(default=0)),
+                ('amount_sum', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+            ],
+            options={
+                'verbose_name': 'Transaction hourly rollup',
+                'verbose_name_plural': 'Transaction hourly rollups',
+                'indexes': [models.Index(fields=['bucket_start'], name='transaction_hourly_bucket_idx')],
+                'constraints': [models.UniqueConstraint(fields=('transaction_type', 'bucket_start'), name='transaction_hourly_rollup_uniq')],
+            },
+        ),
+    ]
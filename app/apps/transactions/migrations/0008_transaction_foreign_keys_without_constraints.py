@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0007_transaction_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='parent_transaction',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='transactions.transaction'),
+        ),
+        migrations.AlterField(
+            model_name='transactiontotalamountdelta',
+            name='transaction',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='total_amount_deltas', to='transactions.transaction'),
+        ),
+    ]
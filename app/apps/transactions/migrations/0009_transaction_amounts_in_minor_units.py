@@ -0,0 +1,56 @@
+import functools
+from django.db import migrations, models
+import app.apps.base.fields
+
+# (model, field) of the amounts converted from numeric(10, 2) to bigint cents
+AMOUNT_FIELDS = [("transaction", "amount"), ("transaction", "total_amount"), ("transactiontotalamountdelta", "amount")]
+
+
+def build_field(model, name, minor_units):
+    """Build the decimal or the minor unit field of an amount."""
+    field = app.apps.base.fields.MinorUnitDecimalField() if minor_units else models.DecimalField(max_digits=10, decimal_places=2)
+    field.set_attributes_from_name(name)
+    field.model = model
+    return field
+
+
+def convert_amount(model_name, name, apps, schema_editor, minor_units):
+    """Convert an amount column and its values between numeric units and bigint cents.
+
+    Postgres converts the column with a single ALTER TYPE rewrite, other databases scale the values
+    in place and then alter the column.
+    """
+    model = apps.get_model("transactions", model_name)
+    old_field, new_field = build_field(model, name, not minor_units), build_field(model, name, minor_units)
+    table, column = schema_editor.quote_name(model._meta.db_table), schema_editor.quote_name(old_field.column)
+    scaled = f"round({column} * 100)" if minor_units else f"{column} / 100.0"
+    if schema_editor.connection.vendor == "postgresql":
+        new_type = new_field.db_type(schema_editor.connection)
+        schema_editor.execute(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE {new_type} USING ({scaled})::{new_type}")
+    else:
+        schema_editor.execute(f"UPDATE {table} SET {column} = {scaled}")
+        schema_editor.alter_field(model, old_field, new_field)
+
+
+def convert_amount_operation(model_name, name):
+    """Convert an amount in the database and alter its field in the state, so the next conversion sees it."""
+    return migrations.SeparateDatabaseAndState(
+        database_operations=[
+            migrations.RunPython(
+                functools.partial(convert_amount, model_name, name, minor_units=True),
+                functools.partial(convert_amount, model_name, name, minor_units=False),
+            ),
+        ],
+        state_operations=[
+            migrations.AlterField(model_name=model_name, name=name, field=app.apps.base.fields.MinorUnitDecimalField()),
+        ],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0008_transaction_foreign_keys_without_constraints'),
+    ]
+
+    operations = [convert_amount_operation(model_name, name) for model_name, name in AMOUNT_FIELDS]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:39
+
+import app.apps.base.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0009_transaction_amounts_in_minor_units'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionIngestion',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('transaction_id', models.UUIDField(unique=True)),
+                ('amount', app.apps.base.fields.MinorUnitDecimalField()),
+                ('transaction_type', models.CharField(max_length=50)),
+                ('parent_transaction_id', models.UUIDField(null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(null=True)),
+            ],
+            options={
+                'verbose_name': 'Transaction ingestion',
+                'verbose_name_plural': 'Transaction ingestions',
+                'indexes': [models.Index(fields=['status', 'id'], name='transaction_ingest_status_idx')],
+            },
+        ),
+    ]
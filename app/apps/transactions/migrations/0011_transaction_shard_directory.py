@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0010_transaction_ingestion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionShardEntry',
+            fields=[
+                ('transaction_id', models.UUIDField(primary_key=True, serialize=False)),
+                ('shard', models.PositiveSmallIntegerField()),
+            ],
+            options={
+                'verbose_name': 'Transaction shard entry',
+                'verbose_name_plural': 'Transaction shard entries',
+            },
+        ),
+    ]
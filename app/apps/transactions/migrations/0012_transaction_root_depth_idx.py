@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0011_transaction_shard_directory'),
+    ]
+
+    # the new index replaces the root_id index
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['root_id', 'depth'], name='transaction_root_depth_idx'),
+        ),
+        # a btree on path fails on the deep chains, 0002 created it on the databases migrated before it
+        # was removed from there
+        migrations.RunSQL("DROP INDEX IF EXISTS transaction_path_idx", migrations.RunSQL.noop),
+        migrations.AlterField(
+            model_name='transaction',
+            name='root_id',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,59 @@
+import functools
+from django.db import migrations, models
+import app.apps.base.fields
+
+# (model, field, max_digits of the numeric column, field options) of the aggregates converted to bigint cents
+AMOUNT_FIELDS = [
+    ("transactiontypestats", "amount_sum", 20, {"default": 0}),
+    ("transactiontypestats", "min_amount", 10, {"null": True}),
+    ("transactiontypestats", "max_amount", 10, {"null": True}),
+    ("transactionhourlyrollup", "amount_sum", 20, {"default": 0}),
+    ("transactiondailyrollup", "amount_sum", 20, {"default": 0}),
+]
+
+
+def build_field(model, name, minor_units, max_digits, options):
+    """Build the decimal or the minor unit field of an aggregate."""
+    field = app.apps.base.fields.MinorUnitDecimalField(**options) if minor_units else models.DecimalField(max_digits=max_digits, decimal_places=2, **options)
+    field.set_attributes_from_name(name)
+    field.model = model
+    return field
+
+
+def convert_amount(model_name, name, max_digits, options, apps, schema_editor, minor_units):
+    """Convert an aggregate column and its values between numeric units and bigint cents, see 0009."""
+    model = apps.get_model("transactions", model_name)
+    old_field = build_field(model, name, not minor_units, max_digits, options)
+    new_field = build_field(model, name, minor_units, max_digits, options)
+    table, column = schema_editor.quote_name(model._meta.db_table), schema_editor.quote_name(old_field.column)
+    scaled = f"round({column} * 100)" if minor_units else f"{column} / 100.0"
+    if schema_editor.connection.vendor == "postgresql":
+        new_type = new_field.db_type(schema_editor.connection)
+        schema_editor.execute(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE {new_type} USING ({scaled})::{new_type}")
+    else:
+        schema_editor.execute(f"UPDATE {table} SET {column} = {scaled}")
+        schema_editor.alter_field(model, old_field, new_field)
+
+
+def convert_amount_operation(model_name, name, max_digits, options):
+    """Convert an aggregate in the database and alter its field in the state."""
+    return migrations.SeparateDatabaseAndState(
+        database_operations=[
+            migrations.RunPython(
+                functools.partial(convert_amount, model_name, name, max_digits, options, minor_units=True),
+                functools.partial(convert_amount, model_name, name, max_digits, options, minor_units=False),
+            ),
+        ],
+        state_operations=[
+            migrations.AlterField(model_name=model_name, name=name, field=app.apps.base.fields.MinorUnitDecimalField(**options)),
+        ],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0012_transaction_root_depth_idx'),
+    ]
+
+    operations = [convert_amount_operation(*amount_field) for amount_field in AMOUNT_FIELDS]
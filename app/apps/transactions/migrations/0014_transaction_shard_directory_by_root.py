@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0013_transaction_aggregates_in_minor_units'),
+    ]
+
+    # the directory had an entry per transaction, the entries of the roots become the entries of their trees
+    # and the ones of the other transactions are only read again if the transaction becomes a root, which
+    # rewrites its entry
+    operations = [
+        migrations.RenameField(
+            model_name='transactionshardentry',
+            old_name='transaction_id',
+            new_name='root_id',
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0014_transaction_shard_directory_by_root'),
+    ]
+
+    # the list pages read modified_at for their ETag and Last-Modified, the new index includes it
+    # before the previous one is dropped
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['created_at', 'id'], include=('amount', 'total_amount', 'modified_at'), name='transaction_list_cov_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='transaction_created_cov_idx',
+        ),
+    ]
@@ -1,18 +1,175 @@
 from django.db import models
+from app.apps.base.fields import MinorUnitDecimalField
 from app.apps.base.models import TimeStampedUUIDModel
 
 # Models are defined here
 class Transaction(TimeStampedUUIDModel):
     """Transaction model."""
-    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # amounts are stored as bigint cents, so the totals of large trees do not overflow
+    amount = MinorUnitDecimalField()
     transaction_type = models.CharField(max_length=50)
-    parent_transaction = models.ForeignKey("self", on_delete=models.CASCADE, null=True, blank=True)
-    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # no database constraint, a foreign key has to reference a unique column and the primary key of the
+    # table partitioned by created_at is (id, created_at), see TransactionPartitionService
+    parent_transaction = models.ForeignKey("self", on_delete=models.CASCADE, null=True, blank=True, db_constraint=False)
+    total_amount = MinorUnitDecimalField()
+    # hierarchy index, path is the hex ids of all the ancestors and the transaction itself, root first,
+    # it grows by 33 bytes a level so it is not indexed, the subtrees are looked up by root_id and depth
+    path = models.TextField(editable=False, default="")
+    depth = models.PositiveIntegerField(editable=False, default=0)
+    root_id = models.UUIDField(editable=False, null=True)
+
+    PATH_SEPARATOR = "/"
 
     class Meta:
         verbose_name = "Transaction"
         verbose_name_plural = "Transactions"
+        indexes = [
+            # the subtree lookups, a tree is read from its root_id and the path prefix filters the rows below depth
+            models.Index(fields=["root_id", "depth"], name="transaction_root_depth_idx"),
+            # keyset pagination of the list endpoint, the included columns let postgres answer
+            # ?fields=amount,total_amount pages with index only scans, modified_at is read for their validators
+            models.Index(fields=["created_at", "id"], include=["amount", "total_amount", "modified_at"], name="transaction_list_cov_idx"),
+            # filtering by type and recomputing the min and max amount of a type
+            models.Index(fields=["transaction_type", "amount"], name="transaction_type_amount_idx"),
+        ]
 
     def __str__(self):
         return f"{self.id} | {self.transaction_type}"
 
+
+class TransactionTotalAmountDelta(models.Model):
+    """Pending change of the total amount of a transaction.
+
+    In the deferred total amount mode, the amounts added to ancestors are appended here instead of
+    updating the ancestor rows, and are folded into Transaction.total_amount by the rollup.
+    """
+    # no database constraint, see Transaction.parent_transaction
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name="total_amount_deltas", db_constraint=False)
+    amount = MinorUnitDecimalField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Transaction total amount delta"
+        verbose_name_plural = "Transaction total amount deltas"
+
+    def __str__(self):
+        return f"{self.transaction_id} | {self.amount}"
+
+class TransactionTypeStats(models.Model):
+    """Aggregates of the transactions of a type, maintained incrementally by TransactionService."""
+    transaction_type = models.CharField(max_length=50, unique=True)
+    count = models.PositiveBigIntegerField(default=0)
+    # bigint cents like the amounts, the sums of the database run on integers
+    amount_sum = MinorUnitDecimalField(default=0)
+    min_amount = MinorUnitDecimalField(null=True)
+    max_amount = MinorUnitDecimalField(null=True)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Transaction type stats"
+        verbose_name_plural = "Transaction type stats"
+
+    def __str__(self):
+        return f"{self.transaction_type} | {self.count}"
+
+
+class TransactionRollup(models.Model):
+    """Count and amount sum of the transactions of a type created in a time bucket.
+
+    The rollups are maintained incrementally by TransactionService, buckets start on UTC hours and days.
+    """
+    transaction_type = models.CharField(max_length=50)
+    bucket_start = models.DateTimeField()
+    count = models.PositiveBigIntegerField(default=0)
+    # bigint cents like the amounts
+    amount_sum = MinorUnitDecimalField(default=0)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return f"{self.bucket_start} | {self.transaction_type} | {self.count}"
+
+
+class TransactionHourlyRollup(TransactionRollup):
+    """Hourly rollup of the transactions."""
+
+    class Meta:
+        verbose_name = "Transaction hourly rollup"
+        verbose_name_plural = "Transaction hourly rollups"
+        constraints = [
+            models.UniqueConstraint(fields=["transaction_type", "bucket_start"], name="transaction_hourly_rollup_uniq"),
+        ]
+        indexes = [
+            # range queries over all the types
+            models.Index(fields=["bucket_start"], name="transaction_hourly_bucket_idx"),
+        ]
+
+
+class TransactionDailyRollup(TransactionRollup):
+    """Daily rollup of the transactions."""
+
+    class Meta:
+        verbose_name = "Transaction daily rollup"
+        verbose_name_plural = "Transaction daily rollups"
+        constraints = [
+            models.UniqueConstraint(fields=["transaction_type", "bucket_start"], name="transaction_daily_rollup_uniq"),
+        ]
+        indexes = [
+            # range queries over all the types
+            models.Index(fields=["bucket_start"], name="transaction_daily_bucket_idx"),
+        ]
+
+
+class TransactionIngestion(models.Model):
+    """A transaction accepted by the ingest endpoint and waiting to be created.
+
+    The queue is drained in batches by the drain_ingestion_queue management command, the transaction
+    is created with the id of its ingestion.
+    """
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [(PENDING, "Pending"), (DONE, "Done"), (FAILED, "Failed")]
+
+    # the queue order
+    id = models.BigAutoField(primary_key=True)
+    transaction_id = models.UUIDField(unique=True)
+    amount = MinorUnitDecimalField()
+    transaction_type = models.CharField(max_length=50)
+    # no foreign key, the parent can be a transaction which is still queued
+    parent_transaction_id = models.UUIDField(null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True)
+
+    class Meta:
+        verbose_name = "Transaction ingestion"
+        verbose_name_plural = "Transaction ingestions"
+        indexes = [
+            # draining the pending ingestions in order and counting them by status
+            models.Index(fields=["status", "id"], name="transaction_ingest_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.transaction_id} | {self.status}"
+
+
+class TransactionShardEntry(models.Model):
+    """Shard of a tree of transactions which is not on the first shard, the shard directory.
+
+    The directory lives on default with the other tables and holds an entry per tree, keyed by the id
+    of its root. A tree without an entry is on the first shard, so that the trees created before
+    sharding need none.
+    """
+    root_id = models.UUIDField(primary_key=True)
+    # position of the shard alias in settings.TRANSACTIONS_SHARDING["SHARDS"]
+    shard = models.PositiveSmallIntegerField()
+
+    class Meta:
+        verbose_name = "Transaction shard entry"
+        verbose_name_plural = "Transaction shard entries"
+
+    def __str__(self):
+        return f"{self.root_id} | {self.shard}"
@@ -0,0 +1,19 @@
+from rest_framework.renderers import JSONRenderer
+
+
+class NDJSONRenderer(JSONRenderer):
+    """Selects the newline delimited JSON export with ?format=ndjson.
+
+    Exports are streamed by the view, the renderer only renders error responses.
+    """
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+
+class CSVRenderer(JSONRenderer):
+    """Selects the CSV export with ?format=csv.
+
+    Exports are streamed by the view, the renderer only renders error responses, as JSON.
+    """
+    media_type = "text/csv"
+    format = "csv"
@@ -0,0 +1,78 @@
+from django.db.models import Sum
+from app.apps.transactions.models import TransactionTotalAmountDelta
+from app.apps.transactions.repositories.transactionshardrepo import TransactionShardRepository
+
+class TransactionTotalAmountDeltaRepository:
+    """Transaction total amount delta repository
+
+    This class contains methods for interacting with database for pending total amount deltas.
+
+    The deltas are stored on the shard of their transaction, the lookups by transaction id are routed
+    through the shard directory and the other methods use the shard set by use_shard.
+
+    Methods defined here:
+    - get_model() -> TransactionTotalAmountDelta
+    - append_deltas(amounts) -> list
+    - get_pending_amounts(transaction_ids) -> dict
+    - aget_pending_amounts(transaction_ids) -> dict
+    - lock_delta_ids(batch_size) -> list
+    - sum_deltas_by_transaction(delta_ids) -> dict
+    - delete_deltas(delta_ids) -> None
+    - count_deltas() -> int
+    """
+
+    BULK_BATCH_SIZE = 1000
+
+    @classmethod
+    def get_model(cls):
+        """Get the model."""
+        return TransactionTotalAmountDelta
+
+    @classmethod
+    def append_deltas(cls, amounts):
+        """Append a delta for every transaction id in amounts."""
+        deltas = [
+            TransactionTotalAmountDelta(transaction_id=transaction_id, amount=amount)
+            for transaction_id, amount in amounts.items()
+        ]
+        return TransactionTotalAmountDelta.objects.bulk_create(deltas, batch_size=cls.BULK_BATCH_SIZE)
+
+    @classmethod
+    def get_pending_amounts(cls, transaction_ids):
+        """Get the sum of the pending deltas keyed by transaction id, for transactions with pending deltas."""
+        pending_amounts = {}
+        for alias, shard_ids in TransactionShardRepository.group_by_shard(transaction_ids).items():
+            queryset = TransactionTotalAmountDelta.objects.db_manager(alias).filter(transaction_id__in=shard_ids)
+            pending_amounts.update(queryset.values("transaction_id").annotate(amount=Sum("amount")).values_list("transaction_id", "amount"))
+        return pending_amounts
+
+    @classmethod
+    async def aget_pending_amounts(cls, transaction_ids):
+        """Async version of get_pending_amounts."""
+        pending_amounts = {}
+        for alias, shard_ids in (await TransactionShardRepository.agroup_by_shard(transaction_ids)).items():
+            queryset = TransactionTotalAmountDelta.objects.db_manager(alias).filter(transaction_id__in=shard_ids)
+            pending_amounts.update({transaction_id: amount async for transaction_id, amount in queryset.values("transaction_id").annotate(amount=Sum("amount")).values_list("transaction_id", "amount")})
+        return pending_amounts
+
+    @classmethod
+    def lock_delta_ids(cls, batch_size):
+        """Lock and get the ids of the oldest deltas, skipping deltas locked by a concurrent rollup."""
+        queryset = TransactionTotalAmountDelta.objects.select_for_update(skip_locked=True).order_by("id")
+        return list(queryset.values_list("id", flat=True)[:batch_size])
+
+    @classmethod
+    def sum_deltas_by_transaction(cls, delta_ids):
+        """Get the sum of the given deltas keyed by transaction id."""
+        queryset = TransactionTotalAmountDelta.objects.filter(id__in=delta_ids)
+        return dict(queryset.values("transaction_id").annotate(amount=Sum("amount")).values_list("transaction_id", "amount"))
+
+    @classmethod
+    def delete_deltas(cls, delta_ids):
+        """Delete the given deltas."""
+        TransactionTotalAmountDelta.objects.filter(id__in=delta_ids).delete()
+
+    @classmethod
+    def count_deltas(cls):
+        """Get the number of pending deltas of every shard."""
+        return sum(TransactionTotalAmountDelta.objects.db_manager(alias).count() for alias in TransactionShardRepository.get_shards())
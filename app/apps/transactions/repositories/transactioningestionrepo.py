@@ -0,0 +1,68 @@
+from django.db.models import Count, Min
+from app.apps.transactions.models import TransactionIngestion
+
+class TransactionIngestionRepository:
+    """Transaction ingestion repository
+
+    This class contains methods for interacting with database for the ingestion queue.
+
+    Methods defined here:
+    - get_model() -> TransactionIngestion
+    - enqueue(**fields) -> TransactionIngestion
+    - get_ingestion(transaction_id) -> TransactionIngestion
+    - get_queued_ids(transaction_ids, statuses) -> set
+    - lock_pending(batch_size) -> list
+    - set_status(ingestion_ids, status, processed_at, error) -> int
+    - count_by_status(statuses) -> dict
+    - get_oldest_pending_created_at() -> datetime
+    - delete_processed_before(processed_before) -> int
+    """
+
+    @classmethod
+    def get_model(cls):
+        """Get the model."""
+        return TransactionIngestion
+
+    @classmethod
+    def enqueue(cls, **fields):
+        """Add a pending ingestion to the queue."""
+        return TransactionIngestion.objects.create(**fields)
+
+    @classmethod
+    def get_ingestion(cls, transaction_id):
+        """Get the ingestion of a transaction id."""
+        return TransactionIngestion.objects.get(transaction_id=transaction_id)
+
+    @classmethod
+    def get_queued_ids(cls, transaction_ids, statuses=(TransactionIngestion.PENDING,)):
+        """Get the subset of the transaction ids with an ingestion in one of the statuses."""
+        return set(
+            TransactionIngestion.objects.filter(transaction_id__in=transaction_ids, status__in=statuses).values_list("transaction_id", flat=True)
+        )
+
+    @classmethod
+    def lock_pending(cls, batch_size):
+        """Lock the oldest pending ingestions, skipping the ones locked by other workers."""
+        queryset = TransactionIngestion.objects.filter(status=TransactionIngestion.PENDING).order_by("id")
+        return list(queryset.select_for_update(skip_locked=True)[:batch_size])
+
+    @classmethod
+    def set_status(cls, ingestion_ids, status, processed_at, error=""):
+        """Set the status of ingestions."""
+        return TransactionIngestion.objects.filter(id__in=ingestion_ids).update(status=status, processed_at=processed_at, error=error)
+
+    @classmethod
+    def count_by_status(cls, statuses):
+        """Count the ingestions of the given statuses, keyed by status."""
+        queryset = TransactionIngestion.objects.filter(status__in=statuses).values("status").annotate(count=Count("id")).order_by()
+        return {status: count for status, count in queryset.values_list("status", "count")}
+
+    @classmethod
+    def get_oldest_pending_created_at(cls):
+        """Get the creation time of the oldest pending ingestion, None if there is none."""
+        return TransactionIngestion.objects.filter(status=TransactionIngestion.PENDING).aggregate(oldest=Min("created_at"))["oldest"]
+
+    @classmethod
+    def delete_processed_before(cls, processed_before):
+        """Delete the done and failed ingestions processed before a time."""
+        return TransactionIngestion.objects.filter(processed_at__lt=processed_before).exclude(status=TransactionIngestion.PENDING).delete()[0]
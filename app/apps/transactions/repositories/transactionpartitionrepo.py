@@ -0,0 +1,142 @@
+from django.db import connection
+from app.apps.transactions.models import Transaction, TransactionTotalAmountDelta
+
+class TransactionPartitionRepository:
+    """Transaction partition repository
+
+    This class contains the postgres statements which partition the transactions table by range of
+    created_at and manage its partitions.
+
+    Methods defined here:
+    - is_supported() -> bool
+    - get_table_name() -> str
+    - is_partitioned() -> bool
+    - get_partitions() -> list
+    - get_referencing_constraints() -> list
+    - convert_to_partitioned(partitions, default_partition) -> int
+    - create_partition(name, start, end) -> bool
+    - count_external_references(name) -> tuple
+    - detach_partition(name) -> None
+    """
+
+    @classmethod
+    def is_supported(cls):
+        """Check if the database supports declarative partitioning."""
+        return connection.vendor == "postgresql"
+
+    @classmethod
+    def get_table_name(cls):
+        """Get the name of the transactions table."""
+        return Transaction._meta.db_table
+
+    @classmethod
+    def is_partitioned(cls):
+        """Check if the transactions table is a partitioned table."""
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [cls.get_table_name()])
+            row = cursor.fetchone()
+        return row is not None and row[0] == "p"
+
+    @classmethod
+    def get_partitions(cls):
+        """Get the (name, bound, estimated rows) of the partitions, by name."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname",
+                [cls.get_table_name()],
+            )
+            return cursor.fetchall()
+
+    @classmethod
+    def get_referencing_constraints(cls):
+        """Get the names of the foreign key constraints which reference the transactions table."""
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT conname FROM pg_constraint WHERE contype = 'f' AND confrelid = to_regclass(%s)", [cls.get_table_name()])
+            return [row[0] for row in cursor.fetchall()]
+
+    @classmethod
+    def convert_to_partitioned(cls, partitions, default_partition):
+        """Replace the transactions table with a table partitioned by range of created_at, holding the same rows.
+
+        The table is locked and renamed, the partitioned table is created with the same columns,
+        defaults and checks, the rows are copied, the old table is dropped, then the primary key
+        (id, created_at) and the indexes of the model, under their django names, are created on
+        the partitioned table and all its partitions. Has to run in a transaction.
+
+        Args:
+            partitions (list): The (name, start, end) of the range partitions.
+            default_partition (str): The name of the partition of the rows outside of all the ranges.
+
+        Returns:
+            int: The number of copied rows.
+        """
+        quote = connection.ops.quote_name
+        table = cls.get_table_name()
+        old_table = f"{table}_unpartitioned"
+        with connection.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {quote(table)} IN ACCESS EXCLUSIVE MODE")
+            cursor.execute(f"ALTER TABLE {quote(table)} RENAME TO {quote(old_table)}")
+            cursor.execute(f"CREATE TABLE {quote(table)} (LIKE {quote(old_table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE ({quote('created_at')})")
+            for name, start, end in partitions:
+                cls.create_partition(name, start, end)
+            cursor.execute(f"CREATE TABLE {quote(default_partition)} PARTITION OF {quote(table)} DEFAULT")
+            cursor.execute(f"INSERT INTO {quote(table)} SELECT * FROM {quote(old_table)}")
+            copied = cursor.rowcount
+            cursor.execute(f"DROP TABLE {quote(old_table)}")
+            # a unique constraint of a partitioned table has to include the partition key
+            cursor.execute(f"ALTER TABLE {quote(table)} ADD PRIMARY KEY ({quote('id')}, {quote('created_at')})")
+        with connection.schema_editor(atomic=False) as schema_editor:
+            for statement in schema_editor._model_indexes_sql(Transaction):
+                schema_editor.execute(statement)
+        return copied
+
+    @classmethod
+    def create_partition(cls, name, start, end):
+        """Create the partition of the rows created in [start, end) if it does not exist.
+
+        Returns:
+            bool: Whether the partition was created.
+        """
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s) IS NULL", [name])
+            if not cursor.fetchone()[0]:
+                return False
+            # the bounds are literals, a partition bound can not be a query parameter
+            cursor.execute(
+                f"CREATE TABLE {quote(name)} PARTITION OF {quote(cls.get_table_name())} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            )
+        return True
+
+    @classmethod
+    def count_external_references(cls, name):
+        """Count the references to the rows of a partition which would dangle once it is detached.
+
+        Returns:
+            tuple: The number of transactions of other partitions whose parent is in the partition and
+            the number of pending total amount deltas of the transactions of the partition.
+        """
+        quote = connection.ops.quote_name
+        table = quote(cls.get_table_name())
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT count(*) FROM {table} child JOIN {quote(name)} parent ON child.parent_transaction_id = parent.id "
+                f"WHERE child.tableoid <> to_regclass(%s)",
+                [name],
+            )
+            children = cursor.fetchone()[0]
+            cursor.execute(
+                f"SELECT count(*) FROM {quote(TransactionTotalAmountDelta._meta.db_table)} delta "
+                f"JOIN {quote(name)} archived ON delta.transaction_id = archived.id"
+            )
+            deltas = cursor.fetchone()[0]
+        return children, deltas
+
+    @classmethod
+    def detach_partition(cls, name):
+        """Detach a partition, it is kept as a regular table."""
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {quote(cls.get_table_name())} DETACH PARTITION {quote(name)}")
@@ -1,19 +1,80 @@
+import csv
+import io
+import itertools
+import uuid
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import connections, router, transaction as db_transaction
+from django.db.models import Case, Count, F, Sum, TextField, Value, When
+from django.db.models.functions import Concat, Substr, Trunc
+from django.dispatch import receiver
+from django.utils import timezone
+from app.apps.base.cache import LRUCache, TieredCache
+from app.apps.base.routers import read_from_primary
 from app.apps.transactions.models import Transaction
+from app.apps.transactions.repositories.transactionshardrepo import TransactionShardRepository
 
 class TransactionRepository:
     """Transaction repository
     
     This class contains methods for interacting with database for transactions.
+
+    The lookups by id are routed to the shard of the transaction through the shard directory, the
+    methods taking a transaction use the shard it was loaded from, the other writes go to the shard
+    set by use_shard. The queries over all the transactions read every shard in turn.
     
     Methods defined here:
     - get_model() -> Transaction
     - get_all_queryset() -> QuerySet
+    - build_transaction(**fields) -> Transaction
     - create_transaction(**fields) -> Transaction
+    - bulk_create_transactions(transactions) -> list
+    - copy_transaction_rows(rows) -> None
     - update_transaction(transaction, **fields) -> Transaction
-    - get_transaction_by_id(transaction_id) -> Transaction
+    - get_transaction_by_id(transaction_id, fields) -> Transaction
+    - get_cache() -> TieredCache
+    - reset_cache() -> None
+    - aget_transaction_row(transaction_id, columns) -> dict
+    - get_cached_transaction_by_id(transaction_id, fields) -> Transaction
+    - invalidate_cached_transactions(transaction_ids) -> None
+    - get_cache_stats() -> dict
+    - get_transactions_in_bulk(transaction_ids) -> dict
     - bulk_update_transactions(transactions, fields) -> None
+    - build_hierarchy_fields(transaction_id, parent_transaction) -> dict
+    - move_subtree(transaction, parent_transaction) -> Transaction
+    - get_tree_manager(transaction) -> Manager
+    - get_transaction_for_update(transaction_id) -> Transaction
+    - lock_hierarchy(transaction_ids, shared) -> dict
+    - get_subtree_queryset(transaction) -> QuerySet
+    - get_subtree_ids(transaction) -> list
+    - get_ancestor_ids(transaction) -> list
+    - get_ancestors(transaction) -> QuerySet
+    - get_descendants(transaction) -> QuerySet
+    - get_subtree(transaction, max_depth) -> QuerySet
+    - get_subtree_sum(transaction) -> Decimal
+    - increment_total_amount(transaction_ids, amount) -> int
+    - increment_total_amounts(amounts, touch) -> int
+    - update_transactions_and_total_amounts(values, amounts, modified_at) -> int
+    - iterate_types_and_amounts(chunk_size) -> iterator
+    - aggregate_by_type_and_hour(start, end) -> list
+    - get_existing_ids(transaction_ids) -> set
+    - iterate_hierarchy_rows(chunk_size) -> iterator
+    - get_tree_sizes(limit) -> list
+    - lock_tree(root_id) -> list
+    - delete_tree(root_id) -> int
     """
 
+    BULK_BATCH_SIZE = 1000
+    _cache = None
+    # columns written by copy_transaction_rows, in order
+    COPY_COLUMNS = ("id", "created_at", "modified_at", "amount", "transaction_type", "parent_transaction", "total_amount", "path", "depth", "root_id")
+
     @classmethod
     def get_model(cls):
         """Get the model."""
@@ -25,14 +86,31 @@ class TransactionRepository:
         return Transaction.objects.all()
 
     @classmethod
-    def create_transaction(cls, **fields):
-        """Create a transaction."""
+    def build_transaction(cls, **fields):
+        """Build an unsaved transaction with its hierarchy fields, with a new id unless one is given."""
         amount = fields.get("amount")
         transaction_type = fields.get("transaction_type")
         total_amount = fields.get("total_amount")
         parent_transaction = fields.get("parent_transaction")
-        transaction = Transaction.objects.create(amount=amount, transaction_type=transaction_type, total_amount=total_amount, parent_transaction=parent_transaction)
+        transaction_id = fields.get("id") or uuid.uuid4()
+        hierarchy_fields = cls.build_hierarchy_fields(transaction_id, parent_transaction)
+        return Transaction(id=transaction_id, amount=amount, transaction_type=transaction_type, total_amount=total_amount, parent_transaction=parent_transaction, **hierarchy_fields)
+
+    @classmethod
+    def create_transaction(cls, **fields):
+        """Create a transaction."""
+        transaction = cls.build_transaction(**fields)
+        transaction.save(force_insert=True)
+        TransactionShardRepository.record_new_transactions([(transaction.id, transaction.root_id)], transaction._state.db)
         return transaction
+
+    @classmethod
+    def bulk_create_transactions(cls, transactions):
+        """Bulk create transactions, parents have to come before their children."""
+        transactions = Transaction.objects.bulk_create(transactions, batch_size=cls.BULK_BATCH_SIZE)
+        if transactions:
+            TransactionShardRepository.record_new_transactions([(transaction.id, transaction.root_id) for transaction in transactions], transactions[0]._state.db)
+        return transactions
     
     @classmethod
     def update_transaction(cls, transaction, **fields):
@@ -40,15 +118,381 @@ class TransactionRepository:
         # update the transaction
         for field, value in fields.items():
             setattr(transaction, field, value)
-        transaction.save()
+        # only write the given fields so that concurrent updates of other columns are not overwritten
+        transaction.save(update_fields=[*fields.keys(), "modified_at"])
         return transaction
 
     @classmethod
-    def get_transaction_by_id(cls, transaction_id):
-        """Get a transaction by id."""
-        return Transaction.objects.get(id=transaction_id)
+    def copy_transaction_rows(cls, rows):
+        """Insert raw transaction rows, tuples of the COPY_COLUMNS values, bypassing the model.
+
+        Postgres loads the rows with COPY, other databases with a single executemany INSERT.
+        Field defaults such as auto_now_add are not applied, the rows have to be complete.
+        """
+        alias = router.db_for_write(Transaction)
+        connection = connections[alias]
+        root_index = cls.COPY_COLUMNS.index("root_id")
+        transaction_roots = [(row[0], row[root_index]) for row in rows]
+        fields = [Transaction._meta.get_field(column) for column in cls.COPY_COLUMNS]
+        table = connection.ops.quote_name(Transaction._meta.db_table)
+        columns = ", ".join(connection.ops.quote_name(field.column) for field in fields)
+        # the amounts are written as minor units
+        rows = [
+            [field.get_db_prep_save(value, connection) for field, value in zip(fields, row)]
+            for row in rows
+        ]
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(rows)
+                sql = f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)"
+                raw_cursor = cursor.cursor
+                if hasattr(raw_cursor, "copy_expert"):
+                    # psycopg2
+                    buffer.seek(0)
+                    raw_cursor.copy_expert(sql, buffer)
+                else:
+                    # psycopg 3
+                    with raw_cursor.copy(sql) as copy:
+                        copy.write(buffer.getvalue())
+            else:
+                placeholders = ", ".join(["%s"] * len(fields))
+                cursor.executemany(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", rows)
+        TransactionShardRepository.record_new_transactions(transaction_roots, alias)
+
+    @classmethod
+    def get_transaction_by_id(cls, transaction_id, fields=None):
+        """Get a transaction by id, only loading the given fields if any."""
+        manager = Transaction.objects.db_manager(TransactionShardRepository.get_shard(transaction_id))
+        queryset = manager.only(*fields) if fields else manager
+        return queryset.get(id=transaction_id)
     
+    @classmethod
+    async def aget_transaction_row(cls, transaction_id, columns):
+        """Get the given columns of a transaction as a dict, with the async ORM."""
+        manager = Transaction.objects.db_manager(await TransactionShardRepository.aget_shard(transaction_id))
+        return await manager.values(*columns).aget(id=transaction_id)
+
+    @classmethod
+    def get_cache(cls):
+        """Get the transaction cache configured by settings.TRANSACTIONS_CACHE, None if it is disabled.
+
+        Raises ImproperlyConfigured when the backend tier is a LocMemCache, the processes would not share its tokens.
+        """
+        if cls._cache is None:
+            cache_settings = settings.TRANSACTIONS_CACHE
+            if not cache_settings["ENABLED"]:
+                return None
+            local = None
+            if cache_settings["LOCAL_MAX_SIZE"]:
+                local = LRUCache(max_size=cache_settings["LOCAL_MAX_SIZE"], ttl=cache_settings["LOCAL_TTL"])
+            backend = caches[cache_settings["BACKEND"]] if cache_settings["BACKEND"] else None
+            if isinstance(backend, LocMemCache):
+                raise ImproperlyConfigured(
+                    f"The transaction cache backend {cache_settings['BACKEND']!r} is a LocMemCache, which is not shared by the worker processes. "
+                    "Configure a shared backend such as redis in settings.CACHES, or an empty TRANSACTIONS_CACHE_BACKEND for a single process."
+                )
+            cls._cache = TieredCache("transaction", local=local, backend=backend, backend_ttl=cache_settings["BACKEND_TTL"])
+        return cls._cache
+
+    @classmethod
+    def reset_cache(cls):
+        """Drop the transaction cache, it is rebuilt from the settings on next use."""
+        cls._cache = None
+
+    @classmethod
+    def get_cached_transaction_by_id(cls, transaction_id, fields=None):
+        """Get a transaction by id through the transaction cache.
+
+        The fields are only applied when the cache is disabled, the cache holds whole transactions. Misses
+        are read from the primary, a lagging replica would cache a transaction its writer already invalidated.
+        A miss which races with an invalidation is not served afterwards, see TieredCache.
+        """
+        cache = cls.get_cache()
+        if cache is None:
+            return cls.get_transaction_by_id(transaction_id, fields)
+        # normalize the id so that every spelling of it maps to the same key
+        transaction_id = uuid.UUID(str(transaction_id))
+
+        def load():
+            with read_from_primary():
+                return cls.get_transaction_by_id(transaction_id)
+        return cache.get_or_load(transaction_id.hex, load)
+
+    @classmethod
+    def invalidate_cached_transactions(cls, transaction_ids):
+        """Remove transactions from the cache once the current database transaction commits.
+
+        Invalidating before the commit would let a concurrent read cache the previous values again.
+        """
+        cache = cls.get_cache()
+        if cache is None or not transaction_ids:
+            return
+        keys = [transaction_id.hex for transaction_id in transaction_ids]
+        db_transaction.on_commit(lambda: cache.delete_many(keys))
+
+    @classmethod
+    def get_cache_stats(cls):
+        """Get the hit, miss and eviction counters of the transaction cache."""
+        cache = cls.get_cache()
+        return cache.stats() if cache is not None else {}
+
+    @classmethod
+    def get_transactions_in_bulk(cls, transaction_ids):
+        """Get a dict of transactions by id with a single query per shard."""
+        transactions = {}
+        for alias, shard_ids in TransactionShardRepository.group_by_shard(transaction_ids).items():
+            transactions.update(Transaction.objects.db_manager(alias).in_bulk(shard_ids))
+        return transactions
+
     @classmethod
     def bulk_update_transactions(cls, transactions, fields):
         """Bulk update transactions."""
         Transaction.objects.bulk_update(transactions, fields)
+
+    @classmethod
+    def build_hierarchy_fields(cls, transaction_id, parent_transaction):
+        """Get the path, depth and root_id of a transaction placed under the given parent."""
+        if parent_transaction is None:
+            return {"path": transaction_id.hex + Transaction.PATH_SEPARATOR, "depth": 0, "root_id": transaction_id}
+        return {
+            "path": parent_transaction.path + transaction_id.hex + Transaction.PATH_SEPARATOR,
+            "depth": parent_transaction.depth + 1,
+            "root_id": parent_transaction.root_id,
+        }
+
+    @classmethod
+    def move_subtree(cls, transaction, parent_transaction):
+        """Moves the hierarchy fields of a transaction and all its descendants under another parent.
+
+        The subtree becomes a tree of its own if the parent is None. The path, depth, root_id and
+        modified_at of the whole subtree are rewritten by a single UPDATE, the parent_transaction
+        column of the transaction is not changed.
+        """
+        hierarchy_fields = cls.build_hierarchy_fields(transaction.id, parent_transaction)
+        cls.get_subtree_queryset(transaction).update(
+            path=Concat(Value(hierarchy_fields["path"]), Substr("path", len(transaction.path) + 1), output_field=TextField()),
+            depth=F("depth") + (hierarchy_fields["depth"] - transaction.depth),
+            root_id=hierarchy_fields["root_id"],
+            modified_at=timezone.now(),
+        )
+        for field, value in hierarchy_fields.items():
+            setattr(transaction, field, value)
+        return transaction
+
+    @classmethod
+    def get_tree_manager(cls, transaction):
+        """Get the manager of the transactions of the shard a transaction was loaded from."""
+        return Transaction.objects.db_manager(TransactionShardRepository.get_shard_of(transaction))
+
+    @classmethod
+    def get_transaction_for_update(cls, transaction_id):
+        """Get a transaction and lock its row until the end of the database transaction."""
+        return Transaction.objects.db_manager(TransactionShardRepository.get_shard(transaction_id)).select_for_update().get(id=transaction_id)
+
+    @classmethod
+    def lock_hierarchy(cls, transaction_ids, shared=False):
+        """Lock transactions of the current shard in id order and get their (path, depth, root_id) by id.
+
+        A shared lock is a FOR KEY SHARE lock on postgres, which only conflicts with the exclusive
+        locks and not with the updates of the total amounts. The other databases take exclusive locks.
+        """
+        if not transaction_ids:
+            return {}
+        queryset = Transaction.objects.select_for_update().filter(id__in=transaction_ids).order_by("id").values_list("id", "path", "depth", "root_id")
+        connection = connections[queryset.db]
+        if shared and connection.vendor == "postgresql":
+            query = queryset.query.clone()
+            query.select_for_update = False
+            sql, params = query.get_compiler(using=queryset.db).as_sql()
+            with connection.cursor() as cursor:
+                cursor.execute(f"{sql} FOR KEY SHARE", params)
+                rows = cursor.fetchall()
+        else:
+            rows = list(queryset)
+        return {transaction_id: (path, depth, root_id) for transaction_id, path, depth, root_id in rows}
+
+    @classmethod
+    def get_subtree_queryset(cls, transaction):
+        """Get a transaction and all its descendants.
+
+        The rows are found with the (root_id, depth) index, the path prefix only filters the rows of the tree.
+        """
+        return cls.get_tree_manager(transaction).filter(root_id=transaction.root_id, depth__gte=transaction.depth, path__startswith=transaction.path)
+
+    @classmethod
+    def get_subtree_ids(cls, transaction):
+        """Get the ids of a transaction and all its descendants."""
+        return list(cls.get_subtree_queryset(transaction).values_list("id", flat=True))
+
+    @classmethod
+    def get_ancestor_ids(cls, transaction):
+        """Get the ids of the ancestors of a transaction from its path, root first."""
+        return [uuid.UUID(hex_id) for hex_id in transaction.path.split(Transaction.PATH_SEPARATOR)[:-2]]
+
+    @classmethod
+    def get_ancestors(cls, transaction):
+        """Get the ancestors of a transaction, root first."""
+        return cls.get_tree_manager(transaction).filter(id__in=cls.get_ancestor_ids(transaction)).order_by("depth")
+
+    @classmethod
+    def get_descendants(cls, transaction):
+        """Get all the descendants of a transaction."""
+        return cls.get_subtree_queryset(transaction).filter(depth__gt=transaction.depth)
+
+    @classmethod
+    def get_subtree(cls, transaction, max_depth=None):
+        """Get a transaction and its descendants up to max_depth levels below it, parents before children."""
+        queryset = cls.get_subtree_queryset(transaction)
+        if max_depth is not None:
+            queryset = queryset.filter(depth__lte=transaction.depth + max_depth)
+        return queryset.order_by("path")
+
+    @classmethod
+    def get_subtree_sum(cls, transaction):
+        """Get the sum of the amounts of a transaction and all its descendants."""
+        queryset = cls.get_subtree_queryset(transaction)
+        return queryset.aggregate(subtree_sum=Sum("amount"))["subtree_sum"]
+
+    @classmethod
+    def increment_total_amount(cls, transaction_ids, amount):
+        """Atomically adds amount to the total amount of the given transactions in a single UPDATE, touching their modified_at."""
+        if not transaction_ids:
+            return 0
+        total_amount_field = Transaction._meta.get_field("total_amount")
+        return Transaction.objects.filter(id__in=transaction_ids).update(
+            total_amount=F("total_amount") + Value(amount, output_field=total_amount_field),
+            modified_at=timezone.now(),
+        )
+
+    @classmethod
+    def increment_total_amounts(cls, amounts, touch=True):
+        """Atomically adds a different amount to the total amount of each transaction.
+
+        Args:
+            amounts (dict): The amount to be added keyed by transaction id.
+            touch (bool): Whether modified_at is set, False when the effective total amount does not change.
+
+        Every transaction is updated exactly once, with one UPDATE statement per batch of ids.
+        """
+        transaction_ids = list(amounts)
+        total_amount_field = Transaction._meta.get_field("total_amount")
+        # auto_now only fires on save(), the validators of the conditional GETs rely on modified_at
+        extra_updates = {"modified_at": timezone.now()} if touch else {}
+        updated = 0
+        for start in range(0, len(transaction_ids), cls.BULK_BATCH_SIZE):
+            batch = transaction_ids[start:start + cls.BULK_BATCH_SIZE]
+            increment = Case(
+                *[When(id=transaction_id, then=Value(amounts[transaction_id], output_field=total_amount_field)) for transaction_id in batch],
+                output_field=total_amount_field,
+            )
+            updated += Transaction.objects.filter(id__in=batch).update(total_amount=F("total_amount") + increment, **extra_updates)
+        return updated
+
+    @classmethod
+    def update_transactions_and_total_amounts(cls, values, amounts, modified_at=None):
+        """Sets field values and adds amounts to the total amount of transactions.
+
+        Args:
+            values (dict): The field values to set, a dict of field to value keyed by transaction id.
+            amounts (dict): The amount to be added to the total amount keyed by transaction id.
+            modified_at (datetime): The modified_at of every updated transaction, now by default.
+
+        Every transaction is updated exactly once, with one UPDATE statement per batch of ids.
+        """
+        modified_at = modified_at or timezone.now()
+        transaction_ids = list(values.keys() | amounts.keys())
+        fields = sorted({field for transaction_values in values.values() for field in transaction_values})
+        total_amount_field = Transaction._meta.get_field("total_amount")
+        updated = 0
+        for start in range(0, len(transaction_ids), cls.BULK_BATCH_SIZE):
+            batch = transaction_ids[start:start + cls.BULK_BATCH_SIZE]
+            updates = {}
+            for field in fields:
+                model_field = Transaction._meta.get_field(field)
+                whens = [
+                    When(id=transaction_id, then=Value(values[transaction_id][field], output_field=model_field))
+                    for transaction_id in batch if field in values.get(transaction_id, ())
+                ]
+                if whens:
+                    updates[field] = Case(*whens, default=F(field), output_field=model_field)
+            whens = [When(id=transaction_id, then=Value(amounts[transaction_id], output_field=total_amount_field)) for transaction_id in batch if transaction_id in amounts]
+            if whens:
+                increment = Case(*whens, default=Value(Decimal(0), output_field=total_amount_field), output_field=total_amount_field)
+                updates["total_amount"] = F("total_amount") + increment
+            updated += Transaction.objects.filter(id__in=batch).update(**updates, modified_at=modified_at)
+        return updated
+
+    @classmethod
+    def iterate_types_and_amounts(cls, chunk_size=2000):
+        """Stream the (transaction_type, amount) of all transactions, shard by shard."""
+        return itertools.chain.from_iterable(
+            Transaction.objects.db_manager(alias).values_list("transaction_type", "amount").iterator(chunk_size=chunk_size)
+            for alias in TransactionShardRepository.get_shards()
+        )
+
+    @classmethod
+    def aggregate_by_type_and_hour(cls, start, end):
+        """Get the (transaction_type, hour, count, amount sum) of the transactions created in [start, end), hours in UTC."""
+        shards = TransactionShardRepository.get_shards()
+        amount_field = Transaction._meta.get_field("amount")
+        aggregates = defaultdict(lambda: [0, 0])
+        for alias in shards:
+            queryset = (
+                Transaction.objects.db_manager(alias).filter(created_at__gte=start, created_at__lt=end)
+                .annotate(hour=Trunc("created_at", "hour", tzinfo=dt_timezone.utc))
+                .values_list("transaction_type", "hour")
+                .annotate(count=Count("id"), amount_sum=Sum("amount"))
+                .order_by()
+            )
+            if len(shards) == 1:
+                return list(queryset)
+            for transaction_type, hour, count, amount_sum in queryset:
+                aggregates[transaction_type, hour][0] += count
+                aggregates[transaction_type, hour][1] += amount_field.to_minor_units(amount_sum)
+        return [(transaction_type, hour, count, amount_field.from_minor_units(amount_sum)) for (transaction_type, hour), (count, amount_sum) in aggregates.items()]
+
+    @classmethod
+    def get_existing_ids(cls, transaction_ids):
+        """Get the subset of the given ids which exist, with a single query per shard."""
+        existing_ids = set()
+        for alias, shard_ids in TransactionShardRepository.group_by_shard(transaction_ids).items():
+            existing_ids.update(Transaction.objects.db_manager(alias).filter(id__in=shard_ids).values_list("id", flat=True))
+        return existing_ids
+
+    @classmethod
+    def iterate_hierarchy_rows(cls, chunk_size=5000):
+        """Stream the (id, parent id, amount, total amount, root id, depth) of all transactions, tree by tree.
+
+        A tree is never split between shards, so the shards are streamed one after the other.
+        """
+        return itertools.chain.from_iterable(
+            Transaction.objects.db_manager(alias).order_by("root_id")
+            .values_list("id", "parent_transaction_id", "amount", "total_amount", "root_id", "depth")
+            .iterator(chunk_size=chunk_size)
+            for alias in TransactionShardRepository.get_shards()
+        )
+
+    @classmethod
+    def get_tree_sizes(cls, limit=None):
+        """Get the (root id, number of transactions) of the trees, largest first."""
+        queryset = Transaction.objects.values_list("root_id").annotate(size=Count("id")).order_by("-size", "root_id")
+        return list(queryset[:limit] if limit is not None else queryset)
+
+    @classmethod
+    def lock_tree(cls, root_id):
+        """Lock the rows of a tree and get them as tuples of the COPY_COLUMNS values, parents first."""
+        columns = [Transaction._meta.get_field(column).attname for column in cls.COPY_COLUMNS]
+        return list(Transaction.objects.select_for_update().filter(root_id=root_id).order_by("path").values_list(*columns))
+
+    @classmethod
+    def delete_tree(cls, root_id):
+        """Delete the rows of a tree."""
+        return Transaction.objects.filter(root_id=root_id).delete()[0]
+
+
+@receiver(setting_changed)
+def reset_transaction_cache(setting, **kwargs):
+    """Rebuild the transaction cache when its settings change."""
+    if setting == "TRANSACTIONS_CACHE":
+        TransactionRepository.reset_cache()
@@ -0,0 +1,65 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from app.apps.transactions.models import TransactionDailyRollup, TransactionHourlyRollup
+
+class TransactionRollupRepository:
+    """Transaction rollup repository
+
+    This class contains methods for interacting with database for the hourly and daily transaction rollups.
+
+    Methods defined here:
+    - get_model(grain) -> TransactionRollup
+    - get_rollups(grain, start, end, transaction_types) -> QuerySet
+    - add_to_rollup(grain, transaction_type, bucket_start, count, amount_sum) -> None
+    - lock_rollups(grain, start, end) -> None
+    - replace_rollups(grain, start, end, rollups) -> int
+    """
+
+    HOUR = "hour"
+    DAY = "day"
+    MODELS = {HOUR: TransactionHourlyRollup, DAY: TransactionDailyRollup}
+
+    @classmethod
+    def get_model(cls, grain):
+        """Get the model of a grain."""
+        return cls.MODELS[grain]
+
+    @classmethod
+    def get_rollups(cls, grain, start, end, transaction_types=None):
+        """Get the non empty rollups of the buckets starting in [start, end), by bucket then type."""
+        queryset = cls.MODELS[grain].objects.filter(bucket_start__gte=start, bucket_start__lt=end, count__gt=0)
+        if transaction_types:
+            queryset = queryset.filter(transaction_type__in=transaction_types)
+        return queryset.order_by("bucket_start", "transaction_type").values("bucket_start", "transaction_type", "count", "amount_sum")
+
+    @classmethod
+    def add_to_rollup(cls, grain, transaction_type, bucket_start, count, amount_sum):
+        """Atomically adds a count and an amount to a rollup, creating it if needed.
+
+        Only positive counts create a rollup, removing transactions from a bucket which has no
+        rollup, as one outside of the rebuilt window, is a no-op.
+        """
+        model = cls.MODELS[grain]
+        queryset = model.objects.filter(transaction_type=transaction_type, bucket_start=bucket_start)
+        # the amount is converted to minor units by the field, so the database adds integers
+        fields = {"count": F("count") + count, "amount_sum": F("amount_sum") + Value(amount_sum, output_field=model._meta.get_field("amount_sum"))}
+        if queryset.update(**fields) or count <= 0:
+            return
+        try:
+            with transaction.atomic():
+                model.objects.create(transaction_type=transaction_type, bucket_start=bucket_start, count=count, amount_sum=amount_sum)
+        except IntegrityError:
+            # created by a concurrent transaction
+            queryset.update(**fields)
+
+    @classmethod
+    def lock_rollups(cls, grain, start, end):
+        """Lock the rollups of the buckets starting in [start, end)."""
+        list(cls.MODELS[grain].objects.select_for_update().filter(bucket_start__gte=start, bucket_start__lt=end).values_list("id", flat=True))
+
+    @classmethod
+    def replace_rollups(cls, grain, start, end, rollups):
+        """Replace the rollups of the buckets starting in [start, end) with the given ones and return their number."""
+        model = cls.MODELS[grain]
+        model.objects.filter(bucket_start__gte=start, bucket_start__lt=end).delete()
+        return len(model.objects.bulk_create(rollups, batch_size=1000))
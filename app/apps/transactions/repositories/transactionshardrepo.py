@@ -0,0 +1,224 @@
+import uuid
+from collections import defaultdict
+from contextlib import nullcontext
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS, transaction as db_transaction
+from django.dispatch import receiver
+from app.apps.base.cache import MISSING, LRUCache
+from app.apps.transactions.models import Transaction, TransactionShardEntry
+from app.apps.transactions.routers import get_current_shard, get_shards, use_shard
+
+class TransactionShardRepository:
+    """Transaction shard repository
+
+    This class contains methods for interacting with the shard directory, which maps the root id of
+    every tree which is not on the first shard to its shard. The directory is always read from and
+    written to default. The shard of a transaction is the one of its root, a lookup finds the root id
+    of the transaction on the shards and its shard in the directory, and is cached per process by
+    transaction id for DIRECTORY_CACHE_TTL seconds.
+
+    When there is a single shard the transactions are not sharded, the shard of a transaction is
+    None so that the queries are left to the other routers.
+
+    Methods defined here:
+    - get_model() -> TransactionShardEntry
+    - get_shards() -> list
+    - is_sharded() -> bool
+    - get_cache() -> LRUCache
+    - reset_cache() -> None
+    - get_shards_in_bulk(transaction_ids) -> dict
+    - get_shard(transaction_id) -> str
+    - aget_shard(transaction_id) -> str
+    - get_shard_of(transaction) -> str
+    - group_by_shard(transaction_ids) -> dict
+    - agroup_by_shard(transaction_ids) -> dict
+    - use_shard_of(transaction_id) -> context manager
+    - forget(transaction_ids) -> None
+    - get_shards_of_trees(root_ids) -> dict
+    - record_new_transactions(transaction_roots, alias) -> None
+    - set_shard(root_ids, alias, transaction_ids) -> None
+    - remove_trees(root_ids) -> None
+    """
+
+    BULK_BATCH_SIZE = 1000
+    _cache = None
+
+    @classmethod
+    def get_model(cls):
+        """Get the model."""
+        return TransactionShardEntry
+
+    @classmethod
+    def get_shards(cls):
+        """Get the aliases of the shards, [None] when the transactions are not sharded."""
+        return list(get_shards()) if cls.is_sharded() else [None]
+
+    @classmethod
+    def is_sharded(cls):
+        """Checks if there is more than one shard."""
+        return len(get_shards()) > 1
+
+    @classmethod
+    def get_cache(cls):
+        """Get the per process cache of the directory lookups."""
+        if cls._cache is None:
+            sharding = settings.TRANSACTIONS_SHARDING
+            cls._cache = LRUCache(max_size=sharding["DIRECTORY_CACHE_SIZE"], ttl=sharding["DIRECTORY_CACHE_TTL"])
+        return cls._cache
+
+    @classmethod
+    def reset_cache(cls):
+        """Drop the directory cache, it is rebuilt from the settings on next use."""
+        cls._cache = None
+
+    @classmethod
+    def get_shards_in_bulk(cls, transaction_ids):
+        """Get the shard aliases keyed by transaction id, with a single query for the ids which are not cached.
+
+        Inside use_shard(alias) every id is mapped to the alias, the operations of a tree stay on its
+        shard. Ids which are not valid UUIDs or not found on any shard are mapped to the first shard, where
+        they are not found either, without caching them.
+        """
+        current = get_current_shard()
+        if current is not None:
+            return {transaction_id: current for transaction_id in transaction_ids}
+        shards = get_shards()
+        cache = cls.get_cache()
+        result, missing = {}, []
+        for transaction_id in transaction_ids:
+            try:
+                key = uuid.UUID(str(transaction_id)).hex
+            except ValueError:
+                result[transaction_id] = shards[0]
+                continue
+            index = cache.get(key)
+            if index is MISSING:
+                missing.append((transaction_id, key))
+            else:
+                result[transaction_id] = shards[index]
+        if missing:
+            root_ids = {}
+            for alias in shards:
+                queryset = Transaction.objects.using(alias).filter(id__in=[key for _, key in missing])
+                root_ids.update((transaction_id.hex, root_id) for transaction_id, root_id in queryset.values_list("id", "root_id"))
+            tree_shards = cls.get_shards_of_trees(set(root_ids.values()))
+            for transaction_id, key in missing:
+                if key not in root_ids:
+                    result[transaction_id] = shards[0]
+                    continue
+                alias = tree_shards[root_ids[key]]
+                cache.set(key, shards.index(alias))
+                result[transaction_id] = alias
+        return result
+
+    @classmethod
+    def get_shard(cls, transaction_id):
+        """Get the shard alias of a transaction id, None when the transactions are not sharded."""
+        if not cls.is_sharded():
+            return None
+        try:
+            transaction_id = uuid.UUID(str(transaction_id))
+        except ValueError:
+            return get_shards()[0]
+        return cls.get_shards_in_bulk([transaction_id])[transaction_id]
+
+    @classmethod
+    async def aget_shard(cls, transaction_id):
+        """Async version of get_shard."""
+        if not cls.is_sharded():
+            return None
+        return await sync_to_async(cls.get_shard)(transaction_id)
+
+    @classmethod
+    def get_shard_of(cls, transaction):
+        """Get the shard alias of a loaded transaction, None when the transactions are not sharded."""
+        if not cls.is_sharded():
+            return None
+        if transaction._state.db in get_shards():
+            return transaction._state.db
+        return cls.get_shard(transaction.id)
+
+    @classmethod
+    def group_by_shard(cls, transaction_ids):
+        """Group transaction ids by shard alias, a single None group when the transactions are not sharded."""
+        if not cls.is_sharded():
+            return {None: list(transaction_ids)}
+        groups = defaultdict(list)
+        for transaction_id, alias in cls.get_shards_in_bulk(transaction_ids).items():
+            groups[alias].append(transaction_id)
+        return dict(groups)
+
+    @classmethod
+    async def agroup_by_shard(cls, transaction_ids):
+        """Async version of group_by_shard."""
+        if not cls.is_sharded():
+            return {None: list(transaction_ids)}
+        return await sync_to_async(cls.group_by_shard)(transaction_ids)
+
+    @classmethod
+    def use_shard_of(cls, transaction_id):
+        """Route the transactions of the block to the shard of a transaction id, a no-op when they are not sharded."""
+        if not cls.is_sharded():
+            return nullcontext()
+        return use_shard(cls.get_shard(transaction_id))
+
+    @classmethod
+    def forget(cls, transaction_ids):
+        """Drop the cached shards of transactions, their next lookup reads the directory."""
+        cls.get_cache().delete_many([uuid.UUID(str(transaction_id)).hex for transaction_id in transaction_ids])
+
+    @classmethod
+    def get_shards_of_trees(cls, root_ids):
+        """Get the shard aliases of trees keyed by root id, read from the directory without the cache."""
+        shards = get_shards()
+        queryset = TransactionShardEntry.objects.using(DEFAULT_DB_ALIAS).filter(root_id__in=root_ids)
+        indexes = dict(queryset.values_list("root_id", "shard"))
+        return {root_id: shards[indexes.get(root_id, 0)] for root_id in root_ids}
+
+    @classmethod
+    def record_new_transactions(cls, transaction_roots, alias):
+        """Record the shard of new transactions, given as (transaction id, root id) pairs.
+
+        Only the new roots get an entry, the trees created on the first shard need none.
+        """
+        if not cls.is_sharded():
+            return
+        transaction_roots = list(transaction_roots)
+        root_ids = [transaction_id for transaction_id, root_id in transaction_roots if transaction_id == root_id] if alias != get_shards()[0] else []
+        cls.set_shard(root_ids, alias, [transaction_id for transaction_id, _ in transaction_roots])
+
+    @classmethod
+    def set_shard(cls, root_ids, alias, transaction_ids=()):
+        """Record the shard of trees by the ids of their roots, removing their entries when it is the first shard.
+
+        The directory cache of the process is updated for the roots and the given transactions of their
+        trees once the write commits on default.
+        """
+        shards = get_shards()
+        index = shards.index(alias)
+        root_ids = list(root_ids)
+        if index == 0:
+            cls.remove_trees(root_ids)
+        elif root_ids:
+            TransactionShardEntry.objects.db_manager(DEFAULT_DB_ALIAS).bulk_create(
+                [TransactionShardEntry(root_id=root_id, shard=index) for root_id in root_ids],
+                batch_size=cls.BULK_BATCH_SIZE, update_conflicts=True, unique_fields=["root_id"], update_fields=["shard"],
+            )
+        cache = cls.get_cache()
+        transaction_ids = [*root_ids, *transaction_ids]
+        db_transaction.on_commit(lambda: [cache.set(transaction_id.hex, index) for transaction_id in transaction_ids], using=DEFAULT_DB_ALIAS)
+
+    @classmethod
+    def remove_trees(cls, root_ids):
+        """Remove the entries of trees, when they are on the first shard or their roots were moved under other trees."""
+        if root_ids:
+            TransactionShardEntry.objects.db_manager(DEFAULT_DB_ALIAS).filter(root_id__in=root_ids).delete()
+
+
+@receiver(setting_changed)
+def reset_directory_cache(setting, **kwargs):
+    """Rebuild the directory cache when the sharding settings change."""
+    if setting == "TRANSACTIONS_SHARDING":
+        TransactionShardRepository.reset_cache()
@@ -0,0 +1,106 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max, Min, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.utils import timezone
+from app.apps.transactions.models import Transaction, TransactionTypeStats
+from app.apps.transactions.repositories.transactionshardrepo import TransactionShardRepository
+
+class TransactionTypeStatsRepository:
+    """Transaction type stats repository
+
+    This class contains methods for interacting with database for transaction type stats.
+
+    Methods defined here:
+    - get_model() -> TransactionTypeStats
+    - get_all_queryset() -> QuerySet
+    - get_stats_by_type(transaction_type) -> TransactionTypeStats
+    - add_to_stats(transaction_type, count, amount_sum, min_amount, max_amount) -> None
+    - subtract_from_stats(transaction_type, count, amount_sum) -> TransactionTypeStats
+    - recompute_bounds(transaction_type) -> None
+    - lock_all_stats() -> dict
+    - save_all_stats(stats, transaction_types_to_delete) -> None
+    """
+
+    @classmethod
+    def get_model(cls):
+        """Get the model."""
+        return TransactionTypeStats
+
+    @classmethod
+    def get_all_queryset(cls):
+        """Get the stats of all the transaction types."""
+        return TransactionTypeStats.objects.all()
+
+    @classmethod
+    def get_stats_by_type(cls, transaction_type):
+        """Get the stats of a transaction type, None if there are none."""
+        return TransactionTypeStats.objects.filter(transaction_type=transaction_type).first()
+
+    @classmethod
+    def add_to_stats(cls, transaction_type, count, amount_sum, min_amount, max_amount):
+        """Atomically adds transactions to the stats of their type, creating the stats if needed."""
+        queryset = TransactionTypeStats.objects.filter(transaction_type=transaction_type)
+        # the values are converted to minor units by the fields, so the database computes on integers
+        values = {
+            field: Value(value, output_field=TransactionTypeStats._meta.get_field(field))
+            for field, value in (("amount_sum", amount_sum), ("min_amount", min_amount), ("max_amount", max_amount))
+        }
+        fields = {
+            "count": F("count") + count,
+            "amount_sum": F("amount_sum") + values["amount_sum"],
+            # Least and Greatest return null on some databases if any argument is null
+            "min_amount": Least(Coalesce(F("min_amount"), values["min_amount"]), values["min_amount"]),
+            "max_amount": Greatest(Coalesce(F("max_amount"), values["max_amount"]), values["max_amount"]),
+            # auto_now is only applied by save()
+            "modified_at": timezone.now(),
+        }
+        if queryset.update(**fields):
+            return
+        try:
+            with transaction.atomic():
+                TransactionTypeStats.objects.create(transaction_type=transaction_type, count=count, amount_sum=amount_sum, min_amount=min_amount, max_amount=max_amount)
+        except IntegrityError:
+            # created by a concurrent transaction
+            queryset.update(**fields)
+
+    @classmethod
+    def subtract_from_stats(cls, transaction_type, count, amount_sum):
+        """Atomically removes transactions from the stats of their type and returns the updated stats."""
+        queryset = TransactionTypeStats.objects.filter(transaction_type=transaction_type)
+        queryset.update(
+            count=F("count") - count, amount_sum=F("amount_sum") - Value(amount_sum, output_field=TransactionTypeStats._meta.get_field("amount_sum")), modified_at=timezone.now(),
+        )
+        return queryset.first()
+
+    @classmethod
+    def recompute_bounds(cls, transaction_type):
+        """Recompute the min and max amount of a type with the (transaction_type, amount) index of every shard."""
+        shard_bounds = [
+            Transaction.objects.db_manager(alias).filter(transaction_type=transaction_type).aggregate(min_amount=Min("amount"), max_amount=Max("amount"))
+            for alias in TransactionShardRepository.get_shards()
+        ]
+        min_amounts = [bounds["min_amount"] for bounds in shard_bounds if bounds["min_amount"] is not None]
+        max_amounts = [bounds["max_amount"] for bounds in shard_bounds if bounds["max_amount"] is not None]
+        TransactionTypeStats.objects.filter(transaction_type=transaction_type).update(
+            min_amount=min(min_amounts, default=None), max_amount=max(max_amounts, default=None), modified_at=timezone.now(),
+        )
+
+    @classmethod
+    def lock_all_stats(cls):
+        """Lock the stats of all the transaction types and get them keyed by type."""
+        return {stats.transaction_type: stats for stats in TransactionTypeStats.objects.select_for_update()}
+
+    @classmethod
+    def save_all_stats(cls, stats, transaction_types_to_delete):
+        """Save existing and new stats and delete the stats of the given types.
+
+        The stats of a new type can have been created by a concurrent transaction since the existing
+        stats were locked, they are overwritten.
+        """
+        fields = ["count", "amount_sum", "min_amount", "max_amount", "modified_at"]
+        TransactionTypeStats.objects.filter(transaction_type__in=transaction_types_to_delete).delete()
+        TransactionTypeStats.objects.bulk_update([type_stats for type_stats in stats if type_stats.pk is not None], fields)
+        TransactionTypeStats.objects.bulk_create(
+            [type_stats for type_stats in stats if type_stats.pk is None],
+            update_conflicts=True, unique_fields=["transaction_type"], update_fields=fields,
+        )
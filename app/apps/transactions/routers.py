@@ -0,0 +1,63 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+
+# shard the transactions of the current tree are read from and written to, None lets the next router decide
+_shard_alias = ContextVar("transaction_shard", default=None)
+
+
+@contextmanager
+def use_shard(alias):
+    """Route the transactions and their deltas of the block to a shard, None for the next router."""
+    token = _shard_alias.set(alias)
+    try:
+        yield
+    finally:
+        _shard_alias.reset(token)
+
+
+def get_current_shard():
+    """Get the shard set by use_shard, None outside of it."""
+    return _shard_alias.get()
+
+
+def get_shards():
+    """Get the aliases of the shards, the first one is default."""
+    return settings.TRANSACTIONS_SHARDING["SHARDS"]
+
+
+class TransactionShardRouter:
+    """Routes the transactions and their total amount deltas to the shard of the tree they belong to.
+
+    Inside use_shard(alias) they go to the alias, otherwise the instance an access starts from keeps
+    its database, so that related transactions are read from the same shard. Every other query is
+    left to the next router, the transactions which are not looked up by shard are on default.
+    """
+    SHARDED_MODELS = {"transaction", "transactiontotalamountdelta"}
+
+    def is_sharded(self, model):
+        return model._meta.app_label == "transactions" and model._meta.model_name in self.SHARDED_MODELS
+
+    def db_for_model(self, model, **hints):
+        if not self.is_sharded(model):
+            return None
+        alias = _shard_alias.get()
+        if alias is not None:
+            return alias
+        instance = hints.get("instance")
+        if instance is not None and len(get_shards()) > 1 and instance._state.db in get_shards():
+            return instance._state.db
+        return None
+
+    db_for_read = db_for_model
+    db_for_write = db_for_model
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # a tree never spans two shards
+        if obj1._state.db in get_shards() and obj2._state.db in get_shards():
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # every shard has the whole schema, the tables other than the transactions stay empty on the shards
+        return None
@@ -1,13 +1,27 @@
+from decimal import Decimal
 from rest_framework import serializers
 from django.core.validators import MinValueValidator
 from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from app.apps.transactions.repositories.transactionshardrepo import TransactionShardRepository
+from app.apps.transactions.repositories.transactiontypestatsrepo import TransactionTypeStatsRepository
+from app.apps.transactions.repositories.transactionrolluprepo import TransactionRollupRepository
+from app.apps.transactions.repositories.transactioningestionrepo import TransactionIngestionRepository
+from app.apps.transactions.utils import topological_order
 from app.apps.base.serializers import DynamicFieldsSerializer
 
+class TransactionRelatedField(serializers.PrimaryKeyRelatedField):
+    """Primary key related field reading the transaction from the shard of its tree."""
+
+    def to_internal_value(self, data):
+        with TransactionShardRepository.use_shard_of(data):
+            return super().to_internal_value(data)
+
+
 class TransactionCreateSerializer(serializers.ModelSerializer):
     """Transaction create serializer."""
     amount = serializers.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.00)])
     transaction_type = serializers.CharField(max_length=50)
-    parent_transaction = serializers.PrimaryKeyRelatedField(queryset=TransactionRepository.get_all_queryset(), required=False)
+    parent_transaction = TransactionRelatedField(queryset=TransactionRepository.get_all_queryset(), required=False)
 
     class Meta:
         model = TransactionRepository.get_model()
@@ -20,24 +34,224 @@ class TransactionCreateSerializer(serializers.ModelSerializer):
         return attrs
     
 
+class TransactionBatchCreateListSerializer(serializers.ListSerializer):
+    """Validates a batch of transactions, resolving all the referenced parents with a single query."""
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        errors = [{} for _ in attrs]
+        temp_ids = [item.get("temp_id") for item in attrs]
+        temp_id_set = set(temp_ids)
+        seen_temp_ids = set()
+        for error, item in zip(errors, attrs):
+            temp_id = item.get("temp_id")
+            if temp_id is not None and temp_id in seen_temp_ids:
+                error["temp_id"] = ["Duplicate temp_id in the batch."]
+            seen_temp_ids.add(temp_id)
+            parent_temp_id = item.get("parent_temp_id")
+            if parent_temp_id is None:
+                continue
+            if "parent_transaction" in item:
+                error["parent_temp_id"] = ["Only one of parent_transaction and parent_temp_id can be set."]
+            elif parent_temp_id not in temp_id_set:
+                error["parent_temp_id"] = [f"Invalid temp_id \"{parent_temp_id}\" - object does not exist."]
+
+        parent_ids = {item["parent_transaction"] for item in attrs if item.get("parent_transaction") is not None}
+        parents = TransactionRepository.get_transactions_in_bulk(parent_ids)
+        for error, item in zip(errors, attrs):
+            parent_id = item.get("parent_transaction")
+            if parent_id is None:
+                continue
+            if parent_id not in parents:
+                error["parent_transaction"] = [f"Invalid pk \"{parent_id}\" - object does not exist."]
+            else:
+                item["parent_transaction"] = parents[parent_id]
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        try:
+            topological_order(temp_ids, [item.get("parent_temp_id") for item in attrs])
+        except ValueError as error:
+            raise serializers.ValidationError({"non_field_errors": [str(error)]})
+        return attrs
+
+
+class TransactionBatchCreateSerializer(TransactionCreateSerializer):
+    """Transaction batch create serializer.
+
+    Items can reference each other as parents with temp_id and parent_temp_id. Existing parents
+    are looked up once for the whole batch by TransactionBatchCreateListSerializer.
+    """
+    temp_id = serializers.CharField(max_length=100, required=False)
+    parent_temp_id = serializers.CharField(max_length=100, required=False)
+    parent_transaction = serializers.UUIDField(required=False)
+
+    class Meta:
+        model = TransactionRepository.get_model()
+        fields = ("temp_id", "amount", "transaction_type", "parent_transaction", "parent_temp_id")
+        list_serializer_class = TransactionBatchCreateListSerializer
+
+
 class TransactionUpdateSerializer(serializers.ModelSerializer):
     amount = serializers.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.00)], required=False)
     transaction_type = serializers.CharField(max_length=50, required=False)
+    # moves the transaction with its subtree, null makes it a root
+    parent_transaction = TransactionRelatedField(queryset=TransactionRepository.get_all_queryset(), required=False, allow_null=True)
 
     class Meta:
         model = TransactionRepository.get_model()
-        fields = ("amount", "transaction_type",)
+        fields = ("amount", "transaction_type", "parent_transaction")
 
-    def validate(self, attrs):
-        super().validate(attrs)
+    def validate_parent_transaction(self, parent_transaction):
         instance = self.context.get("instance")
-        # check if the amount is being updated
-        if "amount" in attrs:
-            difference_in_amount = attrs["amount"] - instance.amount
-            attrs["total_amount"] = instance.total_amount + difference_in_amount
+        # the path of a descendant starts with the path of the transaction
+        if parent_transaction is not None and parent_transaction.path.startswith(instance.path):
+            raise serializers.ValidationError("A transaction can not be moved under itself or one of its descendants.")
+        # a tree is never split between shards
+        if parent_transaction is not None and TransactionShardRepository.get_shard_of(parent_transaction) != TransactionShardRepository.get_shard_of(instance):
+            raise serializers.ValidationError("The parent transaction is on another shard, its tree has to be moved to the shard first.")
+        return parent_transaction
+
+class TransactionBatchUpdateListSerializer(serializers.ListSerializer):
+    """Validates a batch of updates, loading all the updated transactions with a single query."""
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        errors = [{} for _ in attrs]
+        transactions = TransactionRepository.get_transactions_in_bulk({item["id"] for item in attrs})
+        seen_ids = set()
+        for error, item in zip(errors, attrs):
+            transaction_id = item.pop("id")
+            if transaction_id in seen_ids:
+                error["id"] = ["Duplicate id in the batch."]
+            elif transaction_id not in transactions:
+                error["id"] = [f"Invalid pk \"{transaction_id}\" - object does not exist."]
+            else:
+                item["transaction"] = transactions[transaction_id]
+            seen_ids.add(transaction_id)
+        if any(errors):
+            raise serializers.ValidationError(errors)
         return attrs
 
+
+class TransactionBatchUpdateSerializer(TransactionUpdateSerializer):
+    """Transaction batch update serializer.
+
+    The updated transactions are looked up once for the whole batch by TransactionBatchUpdateListSerializer.
+    """
+    id = serializers.UUIDField()
+    # subtrees are only moved one at a time, by the update of a single transaction
+    parent_transaction = None
+
+    class Meta:
+        model = TransactionRepository.get_model()
+        fields = ("id", "amount", "transaction_type")
+        list_serializer_class = TransactionBatchUpdateListSerializer
+
+
 class TransactionReadSerializer(DynamicFieldsSerializer):
     class Meta:
         model = TransactionRepository.get_model()
-        fields = "__all__"
\ No newline at end of file
+        # path is an internal hierarchy index, depth and root_id expose the same information
+        exclude = ("path",)
+
+
+class TransactionRowSerializer:
+    """Fast path of TransactionReadSerializer for transactions read with values().
+
+    The representation of every field is compiled once from the fields of TransactionReadSerializer,
+    so rows are turned into the same dicts without running DRF's per field machinery on every value.
+    """
+
+    def __init__(self, fields=None):
+        model = TransactionRepository.get_model()
+        read_fields = TransactionReadSerializer(fields=fields).fields
+        self.fields = list(read_fields)
+        # the values() key of every field, the foreign keys are read as their id column
+        self.columns = [model._meta.get_field(field.source).attname for field in read_fields.values()]
+        self.accessors = [
+            (name, column, self.compile_field(field))
+            for name, column, field in zip(self.fields, self.columns, read_fields.values())
+        ]
+
+    @staticmethod
+    def compile_field(field):
+        """Get a function rendering a non null value the same way as the field, None if values are kept as is."""
+        if isinstance(field, serializers.DecimalField):
+            exponent = Decimal(1).scaleb(-field.decimal_places)
+            return lambda value: format(value.quantize(exponent), "f")
+        if isinstance(field, serializers.DateTimeField):
+            timezone = field.timezone if hasattr(field, "timezone") else field.default_timezone()
+
+            def to_iso_8601(value):
+                value = value.astimezone(timezone).isoformat() if timezone is not None else value.isoformat()
+                return value[:-6] + "Z" if value.endswith("+00:00") else value
+            return to_iso_8601
+        if isinstance(field, (serializers.UUIDField, serializers.PrimaryKeyRelatedField)):
+            return str
+        return None
+
+    def to_representation(self, row):
+        """Render a row read with values(self.columns)."""
+        data = {}
+        for name, column, render in self.accessors:
+            value = row[column]
+            data[name] = render(value) if render is not None and value is not None else value
+        return data
+
+    def many_to_representation(self, rows):
+        """Render a list of rows."""
+        return [self.to_representation(row) for row in rows]
+
+
+class TransactionTypeStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TransactionTypeStatsRepository.get_model()
+        fields = ("transaction_type", "count", "amount_sum", "min_amount", "max_amount")
+
+
+class TransactionRollupQuerySerializer(serializers.Serializer):
+    """Validates the query parameters of the rollups endpoint."""
+    grain = serializers.ChoiceField(choices=list(TransactionRollupRepository.MODELS), default=TransactionRollupRepository.DAY)
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    # comma separated types
+    transaction_type = serializers.CharField(required=False)
+
+    def validate_transaction_type(self, transaction_type):
+        return [value.strip() for value in transaction_type.split(",") if value.strip()]
+
+    def validate(self, attrs):
+        if "start" in attrs and "end" in attrs and attrs["start"] >= attrs["end"]:
+            raise serializers.ValidationError({"end": ["end must be after start."]})
+        return attrs
+
+
+class TransactionRollupSerializer(serializers.Serializer):
+    """Transaction rollup serializer, for the rows of TransactionRollupService.get_rollups."""
+    bucket_start = serializers.DateTimeField()
+    transaction_type = serializers.CharField()
+    count = serializers.IntegerField()
+    amount_sum = serializers.DecimalField(max_digits=20, decimal_places=2)
+
+
+class TransactionIngestSerializer(serializers.Serializer):
+    """Validates a transaction of the ingest endpoint, its parent can be a transaction which is still queued."""
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.00)])
+    transaction_type = serializers.CharField(max_length=50)
+    parent_transaction = serializers.UUIDField(required=False)
+
+    def validate_parent_transaction(self, parent_transaction):
+        # the queue is checked first, an ingestion drained in between is then found as a transaction
+        if not (TransactionIngestionRepository.get_queued_ids([parent_transaction]) or TransactionRepository.get_existing_ids([parent_transaction])):
+            raise serializers.ValidationError(f"Invalid pk \"{parent_transaction}\" - object does not exist.")
+        return parent_transaction
+
+
+class TransactionIngestionSerializer(serializers.ModelSerializer):
+    """Transaction ingestion serializer, the id is the id of the transaction."""
+    id = serializers.UUIDField(source="transaction_id")
+
+    class Meta:
+        model = TransactionIngestionRepository.get_model()
+        fields = ("id", "status", "error", "created_at", "processed_at")
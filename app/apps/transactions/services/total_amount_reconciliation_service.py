@@ -0,0 +1,141 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from django.db import transaction
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from app.apps.transactions.services.transaction_service import TransactionService
+from app.apps.transactions.utils import find_total_mismatches
+
+
+class TotalAmountMismatch:
+    """A transaction whose stored total amount differs from the sum of its subtree."""
+
+    __slots__ = ("transaction_id", "total_amount", "expected_total_amount")
+
+    def __init__(self, transaction_id, total_amount, expected_total_amount):
+        self.transaction_id = transaction_id
+        self.total_amount = total_amount
+        self.expected_total_amount = expected_total_amount
+
+
+class TotalAmountReconciliationService:
+    """Total amount reconciliation service
+
+    This class contains methods to recompute the total amount of every transaction from the
+    amounts of its subtree and to report or fix the stored totals which drifted.
+
+    The transactions are streamed tree by tree into partitions of whole trees held in compact
+    arrays, amounts in minor units. The subtree sums of the partitions are computed by a pool of worker
+    processes, which never touch the database, while the main process keeps streaming. At most
+    two partitions per worker are held in memory at a time.
+
+    Methods defined here:
+    - __get_amount_fields() -> tuple
+    - iterate_partitions(max_rows, chunk_size) -> iterator
+    - reconcile(workers, max_rows, chunk_size, fix, sample_size) -> tuple
+    """
+
+    @classmethod
+    def iterate_partitions(cls, max_rows=100000, chunk_size=5000):
+        """Yields partitions of whole trees of at least max_rows rows, except the last one.
+
+        A partition is a (ids, parent_indexes, depths, amounts, totals) tuple, where ids is a list
+        and the rest are arrays. A tree is never split, so a partition grows past max_rows to hold
+        a tree bigger than it.
+        """
+        ids, parent_ids, depths, amounts, totals = [], [], array("l"), array("q"), array("q")
+        amount_field, total_amount_field = cls.__get_amount_fields()
+        current_root_id = None
+        for transaction_id, parent_id, amount, total_amount, root_id, depth in TransactionRepository.iterate_hierarchy_rows(chunk_size):
+            if root_id != current_root_id and len(ids) >= max_rows:
+                yield cls.__build_partition(ids, parent_ids, depths, amounts, totals)
+                ids, parent_ids, depths, amounts, totals = [], [], array("l"), array("q"), array("q")
+            current_root_id = root_id
+            ids.append(transaction_id)
+            parent_ids.append(parent_id)
+            depths.append(depth)
+            amounts.append(amount_field.to_minor_units(amount))
+            totals.append(total_amount_field.to_minor_units(total_amount))
+        if ids:
+            yield cls.__build_partition(ids, parent_ids, depths, amounts, totals)
+
+    @classmethod
+    def __get_amount_fields(cls):
+        """Get the amount and total amount fields, which convert the amounts to and from minor units."""
+        model = TransactionRepository.get_model()
+        return model._meta.get_field("amount"), model._meta.get_field("total_amount")
+
+    @classmethod
+    def __build_partition(cls, ids, parent_ids, depths, amounts, totals):
+        """Replaces the parent ids of a partition with the indexes of the parents in it."""
+        indexes = {transaction_id: index for index, transaction_id in enumerate(ids)}
+        parent_indexes = array("l", (indexes.get(parent_id, -1) for parent_id in parent_ids))
+        return ids, parent_indexes, depths, amounts, totals
+
+    @classmethod
+    def reconcile(cls, workers=1, max_rows=100000, chunk_size=5000, fix=False, sample_size=20):
+        """Compares the stored total amount of every transaction with the sum of its subtree.
+
+        In deferred mode the pending deltas are rolled up first. The mismatches of a partition are
+        fixed as soon as its sums are known, in a database transaction of their own, so memory and
+        transactions stay bounded by the partition size. The fixes are applied as increments by the
+        difference, so writes made after a transaction was read are kept. The report is only exact
+        while no transaction is written.
+
+        Args:
+            workers (int): Number of worker processes, the sums are computed in process with 1.
+            max_rows (int): Rows per partition.
+            chunk_size (int): Rows fetched from the database at a time.
+            fix (bool): Whether to fix the mismatched total amounts.
+            sample_size (int): Number of mismatches returned.
+
+        Returns:
+            tuple: The number of checked transactions, the number of mismatched total amounts and
+            the first sample_size TotalAmountMismatch.
+        """
+        if TransactionService.is_total_amount_deferred():
+            TransactionService.rollup_total_amount_deltas()
+        checked, mismatched, sample = 0, 0, []
+
+        def collect(partition, indexed_mismatches):
+            nonlocal mismatched
+            mismatches = cls.__collect_mismatches(partition, indexed_mismatches)
+            mismatched += len(mismatches)
+            sample.extend(mismatches[:max(sample_size - len(sample), 0)])
+            if fix and mismatches:
+                cls.__fix_mismatches(mismatches)
+
+        partitions = cls.iterate_partitions(max_rows, chunk_size)
+        if workers <= 1:
+            for partition in partitions:
+                checked += len(partition[0])
+                collect(partition, find_total_mismatches(partition[1:]))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                pending = []
+                for partition in partitions:
+                    checked += len(partition[0])
+                    pending.append((partition, executor.submit(find_total_mismatches, partition[1:])))
+                    # bounds the partitions held in memory
+                    if len(pending) >= workers * 2:
+                        partition, future = pending.pop(0)
+                        collect(partition, future.result())
+                for partition, future in pending:
+                    collect(partition, future.result())
+        return checked, mismatched, sample
+
+    @classmethod
+    def __collect_mismatches(cls, partition, indexed_mismatches):
+        """Maps the (index, subtree sum) results of a partition to TotalAmountMismatch."""
+        ids, totals = partition[0], partition[4]
+        total_amount_field = cls.__get_amount_fields()[1]
+        return [
+            TotalAmountMismatch(ids[index], total_amount_field.from_minor_units(totals[index]), total_amount_field.from_minor_units(subtree_sum))
+            for index, subtree_sum in indexed_mismatches
+        ]
+
+    @classmethod
+    def __fix_mismatches(cls, mismatches):
+        """Adds the missing amount to every mismatched total amount."""
+        amounts = {mismatch.transaction_id: mismatch.expected_total_amount - mismatch.total_amount for mismatch in mismatches}
+        with transaction.atomic():
+            TransactionService.increment_total_amounts(amounts)
@@ -0,0 +1,257 @@
+import csv
+import datetime
+import hashlib
+import json
+import time
+import uuid
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from app.apps.transactions.repositories.transactionshardrepo import TransactionShardRepository
+from app.apps.transactions.services.transaction_service import TransactionService
+from app.apps.transactions.services.transaction_rollup_service import TransactionRollupService
+from app.apps.transactions.services.transaction_shard_service import TransactionShardService
+from app.apps.transactions.services.transaction_type_stats_service import TransactionTypeStatsService
+from app.apps.transactions.utils import iterate_in_chunks, topological_order
+
+
+class ImportedTransaction:
+    """A transaction read from an import file, with the fields computed by the import."""
+    __slots__ = ("id", "parent_id", "amount", "transaction_type", "created_at", "total_amount", "path", "depth", "root_id", "shard")
+
+    def __init__(self, id, parent_id, amount, transaction_type, created_at):
+        self.id = id
+        self.parent_id = parent_id
+        self.amount = amount
+        self.transaction_type = transaction_type
+        self.created_at = created_at
+        self.total_amount = amount
+
+    def to_copy_row(self):
+        """Get the values of TransactionRepository.COPY_COLUMNS."""
+        return (self.id, self.created_at, self.created_at, self.amount, self.transaction_type, self.parent_id, self.total_amount, self.path, self.depth, self.root_id)
+
+
+class TransactionImportService:
+    """Transaction import service
+
+    This class contains methods to bulk import historical transactions. All the rows are read once,
+    ordered parents first and their total amounts and hierarchy fields are computed in memory, then
+    they are loaded in batches with TransactionRepository.copy_transaction_rows, on the shard of
+    their tree.
+
+    Methods defined here:
+    - get_id_namespace(lines) -> UUID
+    - read_rows(lines, file_format) -> iterator
+    - get_max_amount() -> Decimal
+    - parse_row(row, line_number, id_namespace) -> ImportedTransaction
+    - plan_import(transactions) -> tuple
+    - stamp_created_at(transactions, resume) -> datetime
+    - load(transactions, external_amounts, batch_size, resume, progress) -> int
+    """
+
+    CSV_FORMAT = "csv"
+    NDJSON_FORMAT = "ndjson"
+    MAX_TRANSACTION_TYPE_LENGTH = 50
+
+    @classmethod
+    def get_id_namespace(cls, lines):
+        """Get the namespace of the ids derived for the rows without one, from a hash of the content of the file.
+
+        The rows of the same file get the same ids on every import, so that a resumed import skips the
+        rows without an id which it already loaded.
+        """
+        digest = hashlib.sha256()
+        for line in lines:
+            digest.update(line.encode())
+        return uuid.UUID(bytes=digest.digest()[:16])
+
+    @classmethod
+    def get_max_amount(cls):
+        """Get the largest amount, the upper bound of the bigint minor units of the amount field."""
+        return TransactionRepository.get_model()._meta.get_field("amount").bounds[1]
+
+    @classmethod
+    def read_rows(cls, lines, file_format):
+        """Yields the (line number, dict) of every row of a CSV or NDJSON file, streaming it."""
+        if file_format == cls.CSV_FORMAT:
+            for index, row in enumerate(csv.DictReader(lines)):
+                # the header is line 1
+                yield index + 2, row
+            return
+        for index, line in enumerate(lines):
+            if not line.strip():
+                continue
+            try:
+                yield index + 1, json.loads(line)
+            except json.JSONDecodeError as error:
+                raise ValueError(f"Line {index + 1}: invalid JSON, {error}.")
+
+    @classmethod
+    def parse_row(cls, row, line_number, id_namespace=None):
+        """Validate a row and convert it to an ImportedTransaction.
+
+        A row without an id gets the id derived from its line number in id_namespace, a random one
+        when there is no namespace. A row without created_at is left without one, see stamp_created_at.
+        Amounts with more decimal places than the amount field are rejected.
+        """
+        try:
+            if row.get("id"):
+                transaction_id = uuid.UUID(str(row["id"]))
+            else:
+                transaction_id = uuid.uuid5(id_namespace, str(line_number)) if id_namespace is not None else uuid.uuid4()
+            parent_id = uuid.UUID(str(row["parent_transaction"])) if row.get("parent_transaction") else None
+            amount = Decimal(str(row["amount"]))
+            transaction_type = str(row["transaction_type"])
+            created_at = parse_datetime(str(row["created_at"])) if row.get("created_at") else None
+        except KeyError as error:
+            raise ValueError(f"Line {line_number}: missing {error.args[0]}.")
+        except (InvalidOperation, TypeError, ValueError) as error:
+            raise ValueError(f"Line {line_number}: {error}.")
+        max_amount = cls.get_max_amount()
+        if not amount.is_finite() or not 0 <= amount <= max_amount:
+            raise ValueError(f"Line {line_number}: amount has to be between 0 and {max_amount}.")
+        try:
+            TransactionRepository.get_model()._meta.get_field("amount").to_minor_units(amount)
+        except ValueError as error:
+            raise ValueError(f"Line {line_number}: {error}")
+        if not transaction_type or len(transaction_type) > cls.MAX_TRANSACTION_TYPE_LENGTH:
+            raise ValueError(f"Line {line_number}: transaction_type has to have 1 to {cls.MAX_TRANSACTION_TYPE_LENGTH} characters.")
+        if row.get("created_at") and created_at is None:
+            raise ValueError(f"Line {line_number}: invalid created_at.")
+        if created_at is not None and timezone.is_naive(created_at):
+            created_at = timezone.make_aware(created_at, datetime.timezone.utc)
+        return ImportedTransaction(transaction_id, parent_id, amount, transaction_type, created_at)
+
+    @classmethod
+    def plan_import(cls, transactions):
+        """Order the transactions parents first and compute their total amount, hierarchy fields and shard.
+
+        Parents which are not part of the import have to exist. The total amount of every imported
+        subtree is added once to each of its existing ancestors.
+
+        Returns:
+            tuple: The ordered transactions and, for every imported transaction whose parent is not
+            imported, the amounts to add to existing ancestors keyed by transaction id.
+        """
+        keys = [transaction.id for transaction in transactions]
+        if len(set(keys)) != len(keys):
+            raise ValueError("The import contains duplicate ids.")
+        try:
+            order = topological_order(keys, [transaction.parent_id for transaction in transactions])
+        except ValueError as error:
+            raise ValueError(f"The import can not be ordered: {error}")
+        transactions = [transactions[index] for index in order]
+
+        imported = {transaction.id: transaction for transaction in transactions}
+        external_parent_ids = {transaction.parent_id for transaction in transactions if transaction.parent_id is not None and transaction.parent_id not in imported}
+        external_parents = {}
+        for batch in iterate_in_chunks(external_parent_ids, TransactionRepository.BULK_BATCH_SIZE):
+            external_parents.update(TransactionRepository.get_transactions_in_bulk(batch))
+        missing_parent_ids = external_parent_ids - set(external_parents)
+        if missing_parent_ids:
+            raise ValueError(f"Unknown parent transactions: {', '.join(str(parent_id) for parent_id in sorted(missing_parent_ids))}.")
+
+        # parents come first, so their hierarchy fields are known when their children are reached
+        for imported_transaction in transactions:
+            parent = imported.get(imported_transaction.parent_id) or external_parents.get(imported_transaction.parent_id)
+            hierarchy_fields = TransactionRepository.build_hierarchy_fields(imported_transaction.id, parent)
+            imported_transaction.path = hierarchy_fields["path"]
+            imported_transaction.depth = hierarchy_fields["depth"]
+            imported_transaction.root_id = hierarchy_fields["root_id"]
+            if imported_transaction.parent_id in imported:
+                imported_transaction.shard = imported[imported_transaction.parent_id].shard
+            else:
+                imported_transaction.shard = TransactionShardService.get_shard_for_new_transaction(imported_transaction.id, parent)
+
+        # children come last, so a total amount is complete once it is pushed to the parent
+        external_amounts = {}
+        for imported_transaction in reversed(transactions):
+            parent_id = imported_transaction.parent_id
+            if parent_id is None:
+                continue
+            if parent_id in imported:
+                imported[parent_id].total_amount += imported_transaction.total_amount
+                continue
+            parent = external_parents[parent_id]
+            external_amounts[imported_transaction.id] = {
+                ancestor_id: imported_transaction.total_amount
+                for ancestor_id in (*TransactionRepository.get_ancestor_ids(parent), parent.id)
+            }
+        return transactions, external_amounts
+
+    @classmethod
+    def stamp_created_at(cls, transactions, resume=False):
+        """Set the created_at of the transactions without one to the time of the import.
+
+        The time is taken once per import, a resumed import reuses the created_at of the stamped
+        transactions which a previous run loaded, so they all get the same created_at.
+
+        Returns:
+            datetime: The created_at of the stamped transactions, None when there are none.
+        """
+        stamped = [imported_transaction for imported_transaction in transactions if imported_transaction.created_at is None]
+        if not stamped:
+            return None
+        now = None
+        if resume:
+            for batch in iterate_in_chunks([imported_transaction.id for imported_transaction in stamped], TransactionRepository.BULK_BATCH_SIZE):
+                loaded = TransactionRepository.get_transactions_in_bulk(batch)
+                if loaded:
+                    now = min(loaded_transaction.created_at for loaded_transaction in loaded.values())
+                    break
+        now = now or timezone.now()
+        for imported_transaction in stamped:
+            imported_transaction.created_at = now
+        return now
+
+    @classmethod
+    def load(cls, transactions, external_amounts, batch_size=5000, resume=False, progress=None):
+        """Load planned transactions in batches, every batch in its own database transaction.
+
+        Every batch also adds the totals of its imported subtrees to their existing ancestors and
+        updates the type stats and the rollups, so a failed import can be resumed with resume=True,
+        which skips the transactions which already exist.
+
+        Args:
+            progress (callable): Called after every batch with the number of loaded transactions and the rate per second.
+
+        Returns:
+            int: The number of loaded transactions.
+        """
+        loaded = 0
+        started_at = time.monotonic()
+        total_amount_field = TransactionRepository.get_model()._meta.get_field("total_amount")
+        for batch in iterate_in_chunks(transactions, batch_size):
+            with transaction.atomic():
+                shard_batches = defaultdict(list)
+                for imported_transaction in batch:
+                    shard_batches[imported_transaction.shard].append(imported_transaction)
+                batch = []
+                for alias, shard_batch in shard_batches.items():
+                    with TransactionShardService.on_shard(alias):
+                        if resume:
+                            # checked on the shard, a batch can have committed there and not on default
+                            existing_ids = TransactionRepository.get_existing_ids([imported_transaction.id for imported_transaction in shard_batch])
+                            TransactionShardRepository.record_new_transactions(
+                                [(imported_transaction.id, imported_transaction.root_id) for imported_transaction in shard_batch if imported_transaction.id in existing_ids], alias,
+                            )
+                            shard_batch = [imported_transaction for imported_transaction in shard_batch if imported_transaction.id not in existing_ids]
+                        TransactionRepository.copy_transaction_rows([imported_transaction.to_copy_row() for imported_transaction in shard_batch])
+                    batch.extend(shard_batch)
+                # summed on minor units
+                ancestor_amounts = defaultdict(int)
+                for imported_transaction in batch:
+                    for ancestor_id, amount in external_amounts.get(imported_transaction.id, {}).items():
+                        ancestor_amounts[ancestor_id] += total_amount_field.to_minor_units(amount)
+                if ancestor_amounts:
+                    TransactionService.increment_total_amounts({ancestor_id: total_amount_field.from_minor_units(amount) for ancestor_id, amount in ancestor_amounts.items()})
+                TransactionTypeStatsService.record_created_transactions(batch)
+                TransactionRollupService.record_created_transactions(batch)
+            loaded += len(batch)
+            if progress is not None:
+                progress(loaded, loaded / max(time.monotonic() - started_at, 1e-9))
+        return loaded
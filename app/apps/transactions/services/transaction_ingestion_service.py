@@ -0,0 +1,188 @@
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from app.apps.base import metrics
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from app.apps.transactions.repositories.transactioningestionrepo import TransactionIngestionRepository
+from app.apps.transactions.services.transaction_service import TransactionService
+from app.apps.transactions.services.transaction_shard_service import TreeMovedError
+
+Ingestion = TransactionIngestionRepository.get_model()
+
+QUEUE_DEPTH = metrics.registry.gauge(
+    "transactions_ingestion_queue_depth", "Number of pending and failed ingestions.", ("status",),
+    callback=lambda: {
+        (status,): count
+        for status, count in {Ingestion.PENDING: 0, Ingestion.FAILED: 0, **TransactionIngestionRepository.count_by_status([Ingestion.PENDING, Ingestion.FAILED])}.items()
+    },
+)
+QUEUE_LAG = metrics.registry.gauge(
+    "transactions_ingestion_queue_lag_seconds", "Age of the oldest pending ingestion.",
+    callback=lambda: {(): TransactionIngestionService.get_queue_lag()},
+)
+
+
+class TransactionIngestionService:
+    """Transaction ingestion service
+
+    This class contains methods of the asynchronous ingestion path, enabled by
+    settings.TRANSACTIONS_INGESTION["ENABLED"]. The ingest endpoint only validates a transaction and
+    inserts it in the ingestion queue table, it takes no lock on the ancestors. A worker drains
+    the queue in batches and creates every batch with TransactionService.bulk_create_transactions,
+    so a single commit creates the batch and updates every shared ancestor once.
+
+    A queued transaction can have a parent which is still queued, ingestions are drained in the
+    order they were queued, so the parent is created in the same batch or in an earlier one.
+
+    Methods defined here:
+    - get_model() -> TransactionIngestion
+    - is_enabled() -> bool
+    - ingest(data) -> TransactionIngestion
+    - get_ingestion(transaction_id) -> TransactionIngestion
+    - drain_batch(batch_size) -> tuple
+    - __create_one_by_one(items, ingestions) -> tuple
+    - get_queue_depth() -> int
+    - get_queue_lag() -> float
+    - delete_processed(retention) -> int
+    """
+
+    @classmethod
+    def get_model(cls):
+        """Get the model."""
+        return Ingestion
+
+    @classmethod
+    def is_enabled(cls):
+        """Checks if the ingestion endpoints are enabled."""
+        return settings.TRANSACTIONS_INGESTION["ENABLED"]
+
+    @classmethod
+    def ingest(cls, data):
+        """Queues a validated transaction and returns its ingestion, the id of the transaction is assigned now."""
+        with transaction.atomic():
+            if not settings.TRANSACTIONS_INGESTION["SYNCHRONOUS_COMMIT"] and connection.vendor == "postgresql":
+                # the commit does not wait for the WAL flush, a crash can lose the last acknowledged ingestions
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL synchronous_commit TO OFF")
+            parent = data.get("parent_transaction")
+            return TransactionIngestionRepository.enqueue(
+                transaction_id=uuid.uuid4(),
+                amount=data["amount"],
+                transaction_type=data["transaction_type"],
+                parent_transaction_id=parent,
+            )
+
+    @classmethod
+    def get_ingestion(cls, transaction_id):
+        """Get the ingestion of a transaction."""
+        return TransactionIngestionRepository.get_ingestion(transaction_id)
+
+    @classmethod
+    @transaction.atomic
+    def drain_batch(cls, batch_size=None):
+        """Creates the transactions of the oldest pending ingestions in a single commit.
+
+        Ingestions locked by another worker are skipped. An ingestion whose parent is pending in a
+        batch of another worker stays pending, one whose parent does not exist or failed fails. When
+        the batch can not be created its items are retried one at a time and the ones which still
+        can not be created fail with their error, so that they do not block the queue.
+
+        Returns:
+            tuple: The number of created transactions and the number of failed ingestions.
+        """
+        ingestions = TransactionIngestionRepository.lock_pending(batch_size or settings.TRANSACTIONS_INGESTION["BATCH_SIZE"])
+        if not ingestions:
+            return 0, 0
+        batch_ids = {ingestion.transaction_id for ingestion in ingestions}
+        parent_ids = {ingestion.parent_transaction_id for ingestion in ingestions if ingestion.parent_transaction_id is not None} - batch_ids
+        parents = TransactionRepository.get_transactions_in_bulk(parent_ids)
+        pending_parent_ids = TransactionIngestionRepository.get_queued_ids(parent_ids - parents.keys())
+
+        items, created, failed, created_ids, waiting_ids = [], [], [], set(), set()
+        for ingestion in ingestions:
+            parent_id = ingestion.parent_transaction_id
+            item = {"id": ingestion.transaction_id, "temp_id": ingestion.transaction_id, "amount": ingestion.amount, "total_amount": ingestion.amount, "transaction_type": ingestion.transaction_type}
+            if parent_id in pending_parent_ids or parent_id in waiting_ids:
+                waiting_ids.add(ingestion.transaction_id)
+                continue
+            if parent_id in parents:
+                item["parent_transaction"] = parents[parent_id]
+            elif parent_id is not None:
+                if parent_id not in created_ids:
+                    failed.append(ingestion)
+                    continue
+                item["parent_temp_id"] = parent_id
+            items.append(item)
+            created.append(ingestion)
+            created_ids.add(ingestion.transaction_id)
+
+        errors = defaultdict(list, {"The parent transaction does not exist.": failed})
+        if items:
+            try:
+                with transaction.atomic():
+                    TransactionService.bulk_create_transactions(items)
+            except Exception:
+                # any error of a single item would fail the batch again on every drain and block the queue
+                created, item_errors = cls.__create_one_by_one(items, created)
+                for ingestion, error in item_errors.items():
+                    errors[error].append(ingestion)
+        now = timezone.now()
+        TransactionIngestionRepository.set_status([ingestion.id for ingestion in created], Ingestion.DONE, now)
+        for error, failed in errors.items():
+            TransactionIngestionRepository.set_status([ingestion.id for ingestion in failed], Ingestion.FAILED, now, error)
+        return len(created), sum(len(failed) for failed in errors.values())
+
+    @classmethod
+    def __create_one_by_one(cls, items, ingestions):
+        """Creates the items of a batch which failed one at a time, each in a savepoint of its own.
+
+        The items are in queue order, so a parent in the batch is created or failed before its children.
+        The items of a tree moved to another shard since its parent was read stay pending with their
+        children, the next drain reads the parent again.
+
+        Returns:
+            tuple: The ingestions of the created items and the error of every failed ingestion.
+        """
+        created, errors, transactions, waiting_ids = [], {}, {}, set()
+        for item, ingestion in zip(items, ingestions):
+            parent_id = item.get("parent_temp_id")
+            item = {field: value for field, value in item.items() if field != "parent_temp_id"}
+            if parent_id is not None:
+                if parent_id in waiting_ids:
+                    waiting_ids.add(ingestion.transaction_id)
+                    continue
+                if parent_id not in transactions:
+                    errors[ingestion] = "The parent transaction failed."
+                    continue
+                item["parent_transaction"] = transactions[parent_id]
+            try:
+                with transaction.atomic():
+                    transactions[ingestion.transaction_id] = TransactionService.bulk_create_transactions([item])[0]
+            except TreeMovedError:
+                waiting_ids.add(ingestion.transaction_id)
+                continue
+            except Exception as error:
+                errors[ingestion] = f"{error.__class__.__name__}: {error}"
+                continue
+            created.append(ingestion)
+        return created, errors
+
+    @classmethod
+    def get_queue_depth(cls):
+        """Get the number of pending ingestions."""
+        return TransactionIngestionRepository.count_by_status([Ingestion.PENDING]).get(Ingestion.PENDING, 0)
+
+    @classmethod
+    def get_queue_lag(cls):
+        """Get the age in seconds of the oldest pending ingestion, 0 if there is none."""
+        oldest = TransactionIngestionRepository.get_oldest_pending_created_at()
+        return (timezone.now() - oldest).total_seconds() if oldest is not None else 0
+
+    @classmethod
+    def delete_processed(cls, retention=None):
+        """Deletes the done and failed ingestions processed more than retention seconds ago."""
+        retention = settings.TRANSACTIONS_INGESTION["RETENTION"] if retention is None else retention
+        return TransactionIngestionRepository.delete_processed_before(timezone.now() - timedelta(seconds=retention))
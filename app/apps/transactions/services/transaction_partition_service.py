@@ -0,0 +1,141 @@
+from datetime import timezone as dt_timezone
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from app.apps.transactions.repositories.transactionpartitionrepo import TransactionPartitionRepository
+
+class TransactionPartitionService:
+    """Transaction partition service
+
+    This class contains methods to partition the transactions table of postgres by month of
+    created_at, to create the partitions of the coming months ahead of time and to detach the
+    partitions of old months for archiving. Queries filtered on created_at, as the list and the
+    export with ?created_at__gte= and ?created_at__lt=, only scan the partitions of their range.
+
+    The primary key of a partitioned table has to include the partition key, so it is (id,
+    created_at) and id alone is not a valid foreign key target. The references to transactions,
+    parent_transaction and the total amount deltas, have no database constraint and are kept valid
+    by the application: parents are validated when a transaction is written, deletes cascade in
+    django and a partition is only detached when no other partition references its rows.
+
+    Methods defined here:
+    - get_month_start(value) -> datetime
+    - add_months(month_start, months) -> datetime
+    - get_partition_name(month_start) -> str
+    - get_month_ranges(start, end) -> list
+    - check_supported() -> None
+    - convert(months_ahead) -> tuple
+    - create_future_partitions(months_ahead) -> list
+    - detach_partition(month_start, force) -> str
+    - get_partitions() -> list
+    """
+
+    DEFAULT_PARTITION_SUFFIX = "default"
+
+    @classmethod
+    def get_month_start(cls, value):
+        """Get the start of the UTC month of a datetime."""
+        return value.astimezone(dt_timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    @classmethod
+    def add_months(cls, month_start, months):
+        """Get the start of the month months after a month start."""
+        month_index = month_start.year * 12 + month_start.month - 1 + months
+        return month_start.replace(year=month_index // 12, month=month_index % 12 + 1)
+
+    @classmethod
+    def get_partition_name(cls, month_start):
+        """Get the name of the partition of a month, transactions_transaction_p2026_03 for march 2026."""
+        return f"{TransactionPartitionRepository.get_table_name()}_p{month_start.year}_{month_start.month:02d}"
+
+    @classmethod
+    def get_month_ranges(cls, start, end):
+        """Get the (name, start, end) of the partitions of the months from the month of start to the month of end, included."""
+        month_start, last_month_start = cls.get_month_start(start), cls.get_month_start(end)
+        ranges = []
+        while month_start <= last_month_start:
+            next_month_start = cls.add_months(month_start, 1)
+            ranges.append((cls.get_partition_name(month_start), month_start, next_month_start))
+            month_start = next_month_start
+        return ranges
+
+    @classmethod
+    def check_supported(cls):
+        """Raise a ValueError if the database has no declarative partitioning."""
+        if not TransactionPartitionRepository.is_supported():
+            raise ValueError("Partitioning the transactions table requires postgres.")
+
+    @classmethod
+    def convert(cls, months_ahead=3):
+        """Converts the transactions table to a table partitioned by month, in one database transaction.
+
+        There is a partition per month from the oldest transaction to months_ahead months from now
+        and a default partition. The table is locked while the rows are copied, so it has to run
+        in a maintenance window.
+
+        Returns:
+            tuple: The number of range partitions and the number of copied rows.
+        """
+        cls.check_supported()
+        with transaction.atomic():
+            if TransactionPartitionRepository.is_partitioned():
+                raise ValueError("The transactions table is already partitioned.")
+            constraints = TransactionPartitionRepository.get_referencing_constraints()
+            if constraints:
+                raise ValueError(f"Foreign keys reference the transactions table, apply the migrations first: {', '.join(constraints)}.")
+            now = timezone.now()
+            bounds = TransactionRepository.get_all_queryset().aggregate(oldest=Min("created_at"), newest=Max("created_at"))
+            ranges = cls.get_month_ranges(bounds["oldest"] or now, cls.add_months(cls.get_month_start(max(now, bounds["newest"] or now)), months_ahead))
+            default_partition = f"{TransactionPartitionRepository.get_table_name()}_{cls.DEFAULT_PARTITION_SUFFIX}"
+            copied = TransactionPartitionRepository.convert_to_partitioned(ranges, default_partition)
+        return len(ranges), copied
+
+    @classmethod
+    def create_future_partitions(cls, months_ahead=3):
+        """Creates the missing partitions from the current month to months_ahead months from now.
+
+        Meant to run periodically, so the rows of a new month never land in the default partition.
+
+        Returns:
+            list: The names of the created partitions.
+        """
+        cls.check_supported()
+        if not TransactionPartitionRepository.is_partitioned():
+            raise ValueError("The transactions table is not partitioned, convert it first.")
+        now = timezone.now()
+        with transaction.atomic():
+            return [
+                name for name, start, end in cls.get_month_ranges(now, cls.add_months(cls.get_month_start(now), months_ahead))
+                if TransactionPartitionRepository.create_partition(name, start, end)
+            ]
+
+    @classmethod
+    def detach_partition(cls, month_start, force=False):
+        """Detaches the partition of a month, which stays in the database as a regular table to archive.
+
+        The detach is refused while transactions of other partitions have their parent in it or its
+        transactions have pending total amount deltas, unless force is True.
+
+        Returns:
+            str: The name of the detached table.
+        """
+        cls.check_supported()
+        name = cls.get_partition_name(cls.get_month_start(month_start))
+        if name not in {partition[0] for partition in TransactionPartitionRepository.get_partitions()}:
+            raise ValueError(f"There is no partition {name}.")
+        with transaction.atomic():
+            children, deltas = TransactionPartitionRepository.count_external_references(name)
+            if (children or deltas) and not force:
+                raise ValueError(
+                    f"{children} transactions of other partitions have their parent in {name} and its transactions have {deltas} "
+                    "pending total amount deltas, roll up the deltas or detach with force."
+                )
+            TransactionPartitionRepository.detach_partition(name)
+        return name
+
+    @classmethod
+    def get_partitions(cls):
+        """Get the (name, bound, estimated rows) of the partitions."""
+        cls.check_supported()
+        return TransactionPartitionRepository.get_partitions()
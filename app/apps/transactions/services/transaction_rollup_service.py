@@ -0,0 +1,142 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta, timezone as dt_timezone
+from django.db import connection, transaction
+from django.utils import timezone
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from app.apps.transactions.repositories.transactionrolluprepo import TransactionRollupRepository
+
+class TransactionRollupService:
+    """Transaction rollup service
+
+    This class contains methods to maintain and read the count and amount sum of the transactions
+    of every type per hour and per day of creation, in UTC. The rollups are updated by
+    TransactionService in the same atomic block as the transactions, so amount over time queries
+    read a few rows per bucket instead of grouping the transactions table. The sums are computed
+    on integer minor units.
+
+    Methods defined here:
+    - get_bucket_start(grain, created_at) -> datetime
+    - __record_changes(changes) -> None
+    - record_created_transactions(transactions) -> None
+    - record_updated_transaction(transaction_type, amount, transaction) -> None
+    - record_updated_transactions(previous_values, transactions) -> None
+    - get_rollups(grain, start, end, transaction_types) -> QuerySet
+    - rebuild_rollups(start, end, workers, chunk_days) -> tuple
+    """
+
+    GRAINS = (TransactionRollupRepository.HOUR, TransactionRollupRepository.DAY)
+    DEFAULT_WINDOW = timedelta(days=90)
+
+    @classmethod
+    def get_bucket_start(cls, grain, created_at):
+        """Get the start of the UTC hour or day of a datetime."""
+        bucket_start = created_at.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+        if grain == TransactionRollupRepository.DAY:
+            bucket_start = bucket_start.replace(hour=0)
+        return bucket_start
+
+    @classmethod
+    def __record_changes(cls, changes):
+        """Adds (transaction_type, created_at, count, amount) changes to the rollups, with one update per changed rollup.
+
+        The rollups are updated in a fixed order, so concurrent writers lock them in the same order.
+        """
+        amount_field = TransactionRepository.get_model()._meta.get_field("amount")
+        changes = [(transaction_type, created_at, count, amount_field.to_minor_units(amount)) for transaction_type, created_at, count, amount in changes]
+        for grain in cls.GRAINS:
+            rollups = defaultdict(lambda: [0, 0])
+            for transaction_type, created_at, count, amount in changes:
+                rollup = rollups[(transaction_type, cls.get_bucket_start(grain, created_at))]
+                rollup[0] += count
+                rollup[1] += amount
+            for (transaction_type, bucket_start), (count, amount_sum) in sorted(rollups.items()):
+                if count or amount_sum:
+                    TransactionRollupRepository.add_to_rollup(grain, transaction_type, bucket_start, count, amount_field.from_minor_units(amount_sum))
+
+    @classmethod
+    def record_created_transactions(cls, transactions):
+        """Adds new transactions to the rollups of their type and creation time."""
+        cls.__record_changes([(transaction.transaction_type, transaction.created_at, 1, transaction.amount) for transaction in transactions])
+
+    @classmethod
+    def record_updated_transaction(cls, transaction_type, amount, transaction):
+        """Moves an updated transaction from its previous type and amount to the current ones."""
+        cls.record_updated_transactions([(transaction_type, amount)], [transaction])
+
+    @classmethod
+    def record_updated_transactions(cls, previous_values, transactions):
+        """Moves updated transactions from their previous (type, amount) to the current ones."""
+        changes = []
+        for (transaction_type, amount), transaction in zip(previous_values, transactions):
+            if transaction_type == transaction.transaction_type and amount == transaction.amount:
+                continue
+            changes.append((transaction_type, transaction.created_at, -1, -amount))
+            changes.append((transaction.transaction_type, transaction.created_at, 1, transaction.amount))
+        cls.__record_changes(changes)
+
+    @classmethod
+    def get_rollups(cls, grain, start=None, end=None, transaction_types=None):
+        """Get the rollups of a grain in [start, end), by default the last DEFAULT_WINDOW."""
+        end = end or timezone.now()
+        start = start or end - cls.DEFAULT_WINDOW
+        return TransactionRollupRepository.get_rollups(grain, start, end, transaction_types)
+
+    @classmethod
+    def rebuild_rollups(cls, start, end, workers=1, chunk_days=1):
+        """Recomputes the rollups of both grains in a window from the transactions.
+
+        The window is widened to whole UTC days. It is split in chunks of chunk_days days whose
+        hourly rollups are aggregated by the database, in parallel by a pool of threads with one
+        connection each, and the daily rollups are summed from the hourly ones.
+
+        The existing rollups of the window are locked first, so concurrent writers wait for the
+        rebuild and then apply their change on top of it. With workers > 1 the chunks are read by
+        other connections, which only see committed transactions.
+
+        Returns:
+            tuple: The number of transactions read and the number of rollups written.
+        """
+        start = cls.get_bucket_start(TransactionRollupRepository.DAY, start)
+        end = cls.get_bucket_start(TransactionRollupRepository.DAY, end - timedelta(microseconds=1)) + timedelta(days=1)
+        chunks, chunk_start = [], start
+        while chunk_start < end:
+            chunks.append((chunk_start, min(chunk_start + timedelta(days=chunk_days), end)))
+            chunk_start += timedelta(days=chunk_days)
+
+        with transaction.atomic():
+            for grain in cls.GRAINS:
+                TransactionRollupRepository.lock_rollups(grain, start, end)
+            if workers <= 1:
+                hourly_rows = [row for chunk in chunks for row in TransactionRepository.aggregate_by_type_and_hour(*chunk)]
+            else:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    hourly_rows = [row for rows in executor.map(cls.__aggregate_chunk, chunks) for row in rows]
+
+            amount_field = TransactionRepository.get_model()._meta.get_field("amount")
+            daily_rows = defaultdict(lambda: [0, 0])
+            for transaction_type, hour, count, amount_sum in hourly_rows:
+                rollup = daily_rows[(transaction_type, cls.get_bucket_start(TransactionRollupRepository.DAY, hour))]
+                rollup[0] += count
+                rollup[1] += amount_field.to_minor_units(amount_sum)
+            rows = {
+                TransactionRollupRepository.HOUR: hourly_rows,
+                TransactionRollupRepository.DAY: [(transaction_type, day, count, amount_field.from_minor_units(amount_sum)) for (transaction_type, day), (count, amount_sum) in daily_rows.items()],
+            }
+            written = 0
+            for grain, grain_rows in rows.items():
+                model = TransactionRollupRepository.get_model(grain)
+                rollups = [
+                    model(transaction_type=transaction_type, bucket_start=bucket_start, count=count, amount_sum=amount_sum)
+                    for transaction_type, bucket_start, count, amount_sum in grain_rows
+                ]
+                written += TransactionRollupRepository.replace_rollups(grain, start, end, rollups)
+        return sum(row[2] for row in hourly_rows), written
+
+    @classmethod
+    def __aggregate_chunk(cls, chunk):
+        """Aggregates the hourly rows of a chunk in a worker thread, closing the connection of the thread."""
+        try:
+            return TransactionRepository.aggregate_by_type_and_hour(*chunk)
+        finally:
+            connection.close()
@@ -1,17 +1,150 @@
+import uuid
+from collections import defaultdict
+from asgiref.sync import sync_to_async
+from app.apps.base import metrics
 from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from app.apps.transactions.repositories.totalamountdeltarepo import TransactionTotalAmountDeltaRepository
+from app.apps.transactions.repositories.transactionshardrepo import TransactionShardRepository
+from app.apps.transactions.services.transaction_rollup_service import TransactionRollupService
+from app.apps.transactions.services.transaction_shard_service import TransactionShardService
+from app.apps.transactions.services.transaction_type_stats_service import TransactionTypeStatsService
+from app.apps.transactions.utils import iterate_in_chunks, topological_order
+from django.conf import settings
 from django.db import transaction
+from django.utils import timezone
+
+PROPAGATION_DEPTH = metrics.registry.histogram(
+    "transactions_total_amount_propagation_depth", "Number of transactions whose total amount is changed by a write.", ("mode",), buckets=metrics.COUNT_BUCKETS
+)
+PROPAGATION_ROWS = metrics.registry.counter(
+    "transactions_total_amount_propagation_rows_total", "Rows written to propagate total amounts, updated transactions or appended deltas.", ("mode",)
+)
+CACHE_EVENTS = metrics.registry.gauge(
+    "transactions_cache_events", "Counters of the transaction cache tiers.", ("event",),
+    callback=lambda: {(event,): value for event, value in TransactionRepository.get_cache_stats().items()},
+)
 
 class TransactionService:
     """Transaction service
     
     This class contains methods to interact with transactions.
     
+    Total amounts are maintained in one of two modes, selected by settings.TRANSACTIONS_TOTAL_AMOUNT_MODE:
+    - direct: the total amounts of the ancestors are incremented in place.
+    - deferred: the increments are appended as pending deltas, which avoids lock contention on the
+      rows of popular ancestors. The deltas are folded into total_amount by rollup_total_amount_deltas
+      and reads add the pending deltas with apply_pending_total_amounts.
+
+    The writes of a tree run on its shard, see TransactionShardService, inside the atomic block on
+    default which also covers the type stats and the rollups.
+
+    The writes which read a path lock its row first: moves lock every row of the moved subtree and
+    the new parent, the other writes take a shared lock on the transaction they update or create
+    under, and no ancestor, so no path they read is moved before they commit. A write on a tree
+    which was moved to another shard raises TreeMovedError, the write can be retried.
+
     Methods defined here:
+    - __increment_total_amount(transaction_ids, amount) -> None
+    - __increment_total_amounts(amounts) -> None
+    - __record_propagation(depth, rows) -> None
+    - __lock_hierarchy(transactions, shared, other_ids) -> None
+    - __lock_subtree(transaction, parent_transaction) -> None
+    - __get_creation_order(items) -> list
+    - __bulk_create_transactions(items) -> list
+    - __bulk_update_transactions(items) -> tuple
+    - __move_subtree(transaction, parent_transaction) -> None
     - __update_ancestor_transactions_total_amount(transaction, amount) -> None
+    - is_total_amount_deferred() -> bool
+    - increment_total_amounts(amounts) -> None
     - create_transaction(data) -> transaction
+    - acreate_transaction(data) -> transaction
+    - bulk_create_transactions(items) -> list
     - update_transaction(transaction, data) -> transaction
+    - bulk_update_transactions(items) -> tuple
+    - apply_pending_total_amounts(transactions) -> None
+    - apply_pending_total_amounts_to_rows(rows) -> None
+    - aapply_pending_total_amounts_to_rows(rows) -> None
+    - iterate_rows(queryset, fields, chunk_size) -> iterator
+    - iterate_subtree(transaction, fields, max_depth, chunk_size) -> iterator
+    - rollup_total_amount_deltas(batch_size) -> int
     """
 
+    DIRECT_TOTAL_AMOUNT_MODE = "direct"
+    DEFERRED_TOTAL_AMOUNT_MODE = "deferred"
+
+    @classmethod
+    def is_total_amount_deferred(cls):
+        """Checks if the total amounts are maintained with pending deltas."""
+        return settings.TRANSACTIONS_TOTAL_AMOUNT_MODE == cls.DEFERRED_TOTAL_AMOUNT_MODE
+
+    @classmethod
+    def __increment_total_amount(cls, transaction_ids, amount):
+        """Adds the same amount to the total amount of the given transactions."""
+        TransactionRepository.invalidate_cached_transactions(transaction_ids)
+        if cls.is_total_amount_deferred():
+            rows = len(TransactionTotalAmountDeltaRepository.append_deltas({transaction_id: amount for transaction_id in transaction_ids}))
+        else:
+            rows = TransactionRepository.increment_total_amount(transaction_ids, amount)
+        cls.__record_propagation(len(transaction_ids), rows)
+
+    @classmethod
+    def __increment_total_amounts(cls, amounts):
+        """Adds the amounts, keyed by transaction id, to the total amount of the transactions."""
+        TransactionRepository.invalidate_cached_transactions(list(amounts))
+        if cls.is_total_amount_deferred():
+            rows = len(TransactionTotalAmountDeltaRepository.append_deltas(amounts))
+        else:
+            rows = TransactionRepository.increment_total_amounts(amounts)
+        cls.__record_propagation(len(amounts), rows)
+
+    @classmethod
+    def __record_propagation(cls, depth, rows):
+        """Record the number of transactions a write changed the total amount of, and the rows it wrote."""
+        if metrics.is_enabled():
+            PROPAGATION_DEPTH.observe(depth, settings.TRANSACTIONS_TOTAL_AMOUNT_MODE)
+            PROPAGATION_ROWS.inc(settings.TRANSACTIONS_TOTAL_AMOUNT_MODE, amount=rows)
+
+    @classmethod
+    def __lock_hierarchy(cls, transactions, shared=False, other_ids=()):
+        """Lock the rows of transactions, and of other ids, and refresh their hierarchy fields, read under the locks.
+
+        A move locks every row of the moved subtree, so the paths read here are not moved before the
+        caller commits. The trees are checked to still be on the current shard, see
+        TransactionShardService.move_tree.
+        """
+        transaction_ids = {*(transaction.id for transaction in transactions), *other_ids}
+        rows = TransactionRepository.lock_hierarchy(transaction_ids, shared=shared)
+        root_ids = {rows[transaction.id][2] if transaction.id in rows else transaction.root_id for transaction in transactions}
+        TransactionShardService.check_current_shard(root_ids, transaction_ids)
+        for transaction in transactions:
+            if transaction.id not in rows:
+                raise TransactionRepository.get_model().DoesNotExist
+            transaction.path, transaction.depth, transaction.root_id = rows[transaction.id]
+
+    @classmethod
+    def __lock_subtree(cls, transaction, parent_transaction):
+        """Lock the rows of a transaction, of its subtree and of its new parent, and refresh their hierarchy fields.
+
+        The subtree is read again under the locks, until its rows created before they were taken are locked too.
+        """
+        transactions = [transaction, *([parent_transaction] if parent_transaction is not None else [])]
+        subtree_ids = set()
+        while True:
+            subtree_ids |= set(TransactionRepository.get_subtree_ids(transaction))
+            cls.__lock_hierarchy(transactions, other_ids=subtree_ids)
+            if set(TransactionRepository.get_subtree_ids(transaction)) <= subtree_ids:
+                return
+
+    @classmethod
+    def increment_total_amounts(cls, amounts):
+        """Adds the amounts, keyed by transaction id, to the total amount of existing transactions.
+
+        This is meant for writers which compute the amounts themselves, such as the bulk import.
+        """
+        for alias, transaction_ids in TransactionShardRepository.group_by_shard(amounts).items():
+            with TransactionShardService.on_shard(alias):
+                cls.__increment_total_amounts({transaction_id: amounts[transaction_id] for transaction_id in transaction_ids})
+
     @classmethod
     def __update_ancestor_transactions_total_amount(cls, transaction, amount):
         """Updates the total amount of ancestor transactions.
@@ -23,41 +156,332 @@ class TransactionService:
         Returns:
             None
         """
-        # get all the parent transactions
-        parent_transactions = []
-        parent_transaction = transaction.parent_transaction
-        while parent_transaction:
-            parent_transaction.total_amount += amount
-            parent_transactions.append(parent_transaction)
-            parent_transaction = parent_transaction.parent_transaction
-        
-        # update the parent transactions
-        if not parent_transactions:
-            return
-        TransactionRepository.bulk_update_transactions(parent_transactions, ["total_amount"])
+        # the ancestors ids are read from the hierarchy path, so they are updated in a single statement
+        ancestor_ids = TransactionRepository.get_ancestor_ids(transaction)
+        cls.__increment_total_amount(ancestor_ids, amount)
 
     @classmethod
     @transaction.atomic
     def create_transaction(cls, data):
-        """Create a transaction."""
-        # create a transaction
-        transaction = TransactionRepository.create_transaction(**data)
-        # update the total amount of ancestor transactions
-        transaction_amount = data.get("amount")
-        cls.__update_ancestor_transactions_total_amount(transaction, transaction_amount)
-        return transaction
+        """Create a transaction, on the shard of its parent or on the one its id is placed on."""
+        data = {**data, "id": data.get("id") or uuid.uuid4()}
+        with TransactionShardService.on_shard(TransactionShardService.get_shard_for_new_transaction(data["id"], data.get("parent_transaction"))):
+            if data.get("parent_transaction") is not None:
+                cls.__lock_hierarchy([data["parent_transaction"]], shared=True)
+            # create a transaction
+            transaction = TransactionRepository.create_transaction(**data)
+            # update the total amount of ancestor transactions
+            transaction_amount = data.get("amount")
+            cls.__update_ancestor_transactions_total_amount(transaction, transaction_amount)
+            TransactionTypeStatsService.record_created_transactions([transaction])
+            TransactionRollupService.record_created_transactions([transaction])
+            return transaction
     
+    @classmethod
+    async def acreate_transaction(cls, data):
+        """Async version of create_transaction.
+
+        The atomic block and the row locks of the ancestors updates stay in one thread.
+        """
+        return await sync_to_async(cls.create_transaction)(data)
+
+    @classmethod
+    @transaction.atomic
+    def bulk_create_transactions(cls, items):
+        """Create a batch of transactions.
+
+        Items can reference each other as parents through temp_id and parent_temp_id. The total
+        amount of every transaction in the batch is computed in memory and the amounts added to
+        existing ancestors are summed, so every existing ancestor is updated exactly once. The items
+        are created on the shard of their tree, with one group of items per shard.
+
+        Returns:
+            list: The created transactions, in the order of the items.
+        """
+        if not TransactionShardService.is_sharded():
+            return cls.__bulk_create_transactions(items)
+        # a new root is placed by its id, the other items are placed with their parent
+        items = [{**item, "id": item.get("id") or uuid.uuid4()} for item in items]
+        shards, shards_by_temp_id = [None] * len(items), {}
+        for index in cls.__get_creation_order(items):
+            item = items[index]
+            if item.get("parent_temp_id") is not None:
+                shards[index] = shards_by_temp_id[item["parent_temp_id"]]
+            else:
+                shards[index] = TransactionShardService.get_shard_for_new_transaction(item["id"], item.get("parent_transaction"))
+            if item.get("temp_id") is not None:
+                shards_by_temp_id[item["temp_id"]] = shards[index]
+        transactions = [None] * len(items)
+        for alias in dict.fromkeys(shards):
+            indexes = [index for index, shard in enumerate(shards) if shard == alias]
+            with TransactionShardService.on_shard(alias):
+                created = cls.__bulk_create_transactions([items[index] for index in indexes])
+            for index, transaction in zip(indexes, created):
+                transactions[index] = transaction
+        return transactions
+
+    @classmethod
+    def __get_creation_order(cls, items):
+        """Get the indexes of the items of a batch, parents before their children."""
+        return topological_order(
+            [item.get("temp_id") for item in items],
+            [item.get("parent_temp_id") for item in items],
+        )
+
+    @classmethod
+    def __bulk_create_transactions(cls, items):
+        """Create a batch of transactions on the current shard, see bulk_create_transactions."""
+        parents = {item["parent_transaction"].id: item["parent_transaction"] for item in items if item.get("parent_transaction") is not None}
+        if parents:
+            cls.__lock_hierarchy(list(parents.values()), shared=True)
+        order = cls.__get_creation_order(items)
+        transactions = [None] * len(items)
+        transactions_by_temp_id = {}
+        # parents are built before their children so that the children can derive their hierarchy fields
+        for index in order:
+            item = items[index]
+            fields = {field: value for field, value in item.items() if field not in ("temp_id", "parent_temp_id")}
+            if item.get("parent_temp_id") is not None:
+                fields["parent_transaction"] = transactions_by_temp_id[item["parent_temp_id"]]
+            transaction = TransactionRepository.build_transaction(**fields)
+            transactions[index] = transaction
+            if item.get("temp_id") is not None:
+                transactions_by_temp_id[item["temp_id"]] = transaction
+
+        # children are visited before their parents, so a total amount is complete once it is pushed up,
+        # the sums run on minor units
+        total_amount_field = TransactionRepository.get_model()._meta.get_field("total_amount")
+        total_amounts = {transaction.id: total_amount_field.to_minor_units(transaction.total_amount) for transaction in transactions}
+        ancestor_amounts = defaultdict(int)
+        for index in reversed(order):
+            transaction = transactions[index]
+            transaction.total_amount = total_amount_field.from_minor_units(total_amounts[transaction.id])
+            parent = transaction.parent_transaction
+            if parent is None:
+                continue
+            if parent.id in total_amounts:
+                total_amounts[parent.id] += total_amounts[transaction.id]
+                continue
+            for ancestor_id in (*TransactionRepository.get_ancestor_ids(parent), parent.id):
+                ancestor_amounts[ancestor_id] += total_amounts[transaction.id]
+
+        TransactionRepository.bulk_create_transactions([transactions[index] for index in order])
+        cls.__increment_total_amounts({ancestor_id: total_amount_field.from_minor_units(amount) for ancestor_id, amount in ancestor_amounts.items()})
+        TransactionTypeStatsService.record_created_transactions(transactions)
+        TransactionRollupService.record_created_transactions(transactions)
+        return transactions
+
     @classmethod
     @transaction.atomic
     def update_transaction(cls, transaction, data):
-        """Updates a transaction."""
-        current_amount = transaction.amount
-        updated_amount = data.get("amount", current_amount) 
-        difference_in_amount = updated_amount - current_amount
-        # update the transaction
-        transaction = TransactionRepository.update_transaction(transaction, **data)
-        # update the ancestors total amount
-        if difference_in_amount:
-            cls.__update_ancestor_transactions_total_amount(transaction, difference_in_amount)
-        
-        return transaction
\ No newline at end of file
+        """Updates a transaction on its shard, moving it with its subtree when its parent_transaction changes."""
+        with TransactionShardService.on_shard(TransactionShardRepository.get_shard_of(transaction)):
+            current_amount = transaction.amount
+            current_transaction_type = transaction.transaction_type
+            parent_transaction = data.get("parent_transaction")
+            moved = "parent_transaction" in data and getattr(parent_transaction, "id", None) != transaction.parent_transaction_id
+            if moved:
+                cls.__lock_subtree(transaction, parent_transaction)
+                # the paths read under the lock are checked again, a concurrent move can have made the move a cycle
+                if parent_transaction is not None and parent_transaction.path.startswith(transaction.path):
+                    raise ValueError("A transaction can not be moved under itself or one of its descendants.")
+            else:
+                cls.__lock_hierarchy([transaction], shared=True)
+            updated_amount = data.get("amount", current_amount) 
+            difference_in_amount = updated_amount - current_amount
+            # total amount is incremented in the database, writing the in-memory value could overwrite concurrent updates
+            data = {field: value for field, value in data.items() if field != "total_amount"}
+            total_amount = transaction.total_amount + difference_in_amount
+            # update the transaction
+            transaction = TransactionRepository.update_transaction(transaction, **data)
+            TransactionRepository.invalidate_cached_transactions([transaction.id])
+            # update the total amount of the transaction and its ancestors
+            if difference_in_amount:
+                transaction_ids = [*TransactionRepository.get_ancestor_ids(transaction), transaction.id]
+                cls.__increment_total_amount(transaction_ids, difference_in_amount)
+                # in the deferred mode the stored total amount is unchanged until the rollup
+                if not cls.is_total_amount_deferred():
+                    transaction.total_amount = total_amount
+            if moved:
+                cls.__move_subtree(transaction, parent_transaction)
+            TransactionTypeStatsService.record_updated_transaction(current_transaction_type, current_amount, transaction)
+            TransactionRollupService.record_updated_transaction(current_transaction_type, current_amount, transaction)
+
+            return transaction
+
+    @classmethod
+    def __move_subtree(cls, transaction, parent_transaction):
+        """Moves the hierarchy of a transaction and its subtree under a new parent, None for a new tree.
+
+        The total amount of the subtree is subtracted from the old ancestors and added to the new ones,
+        the shared ancestors are left alone. The cost depends on the depths, not on the size of the
+        subtree, except for the single UPDATE rewriting the paths of the subtree.
+        """
+        # the hierarchy is already locked, the total amount of the subtree is read again under the lock
+        subtree_total_amount = TransactionRepository.get_transaction_for_update(transaction.id).total_amount
+        if cls.is_total_amount_deferred():
+            subtree_total_amount += TransactionTotalAmountDeltaRepository.get_pending_amounts([transaction.id]).get(transaction.id, 0)
+        total_amount_field = TransactionRepository.get_model()._meta.get_field("total_amount")
+        subtree_total_amount = total_amount_field.to_minor_units(subtree_total_amount)
+        amounts = defaultdict(int)
+        for ancestor_id in TransactionRepository.get_ancestor_ids(transaction):
+            amounts[ancestor_id] -= subtree_total_amount
+        if parent_transaction is not None:
+            for ancestor_id in [*TransactionRepository.get_ancestor_ids(parent_transaction), parent_transaction.id]:
+                amounts[ancestor_id] += subtree_total_amount
+        cls.__increment_total_amounts({ancestor_id: total_amount_field.from_minor_units(amount) for ancestor_id, amount in amounts.items() if amount})
+        # the cached descendants have a stale path, depth and root_id, they are only read when there is a cache
+        if TransactionRepository.get_cache() is not None:
+            TransactionRepository.invalidate_cached_transactions(TransactionRepository.get_subtree_ids(transaction))
+        was_root = transaction.depth == 0
+        TransactionRepository.move_subtree(transaction, parent_transaction)
+        # the directory is keyed by root, a new tree gets an entry and a root moved under another tree loses its own
+        if TransactionShardService.is_sharded():
+            if parent_transaction is None:
+                TransactionShardRepository.set_shard([transaction.id], TransactionShardRepository.get_shard_of(transaction))
+            elif was_root:
+                TransactionShardRepository.remove_trees([transaction.id])
+
+    @classmethod
+    @transaction.atomic
+    def bulk_update_transactions(cls, items):
+        """Updates a batch of transactions.
+
+        The amount differences are merged over the shared ancestors, so every updated transaction and
+        every ancestor whose total amount changes is written once, with one UPDATE per batch of rows.
+        The items are updated on the shard of their tree, with one group of items per shard.
+
+        Args:
+            items (list): Dicts of the transaction to update under "transaction" and the new amount and transaction_type.
+
+        Returns:
+            tuple: The updated transactions, the number of updated transactions and the number of
+            other ancestors whose total amount changed.
+        """
+        if not TransactionShardService.is_sharded():
+            return cls.__bulk_update_transactions(items)
+        transactions, updated, ancestors_updated = [None] * len(items), 0, 0
+        shards = [TransactionShardRepository.get_shard_of(item["transaction"]) for item in items]
+        for alias in dict.fromkeys(shards):
+            indexes = [index for index, shard in enumerate(shards) if shard == alias]
+            with TransactionShardService.on_shard(alias):
+                shard_transactions, shard_updated, shard_ancestors_updated = cls.__bulk_update_transactions([items[index] for index in indexes])
+            for index, transaction in zip(indexes, shard_transactions):
+                transactions[index] = transaction
+            updated += shard_updated
+            ancestors_updated += shard_ancestors_updated
+        return transactions, updated, ancestors_updated
+
+    @classmethod
+    def __bulk_update_transactions(cls, items):
+        """Updates a batch of transactions on the current shard, see bulk_update_transactions."""
+        now = timezone.now()
+        cls.__lock_hierarchy([item["transaction"] for item in items], shared=True)
+        amount_field = TransactionRepository.get_model()._meta.get_field("amount")
+        # the differences are summed on minor units
+        values, amounts, previous_values, transactions = {}, defaultdict(int), [], []
+        for item in items:
+            transaction = item["transaction"]
+            data = {field: item[field] for field in ("amount", "transaction_type") if field in item}
+            previous_values.append((transaction.transaction_type, transaction.amount))
+            difference_in_amount = amount_field.to_minor_units(data.get("amount", transaction.amount)) - amount_field.to_minor_units(transaction.amount)
+            if difference_in_amount:
+                for transaction_id in [*TransactionRepository.get_ancestor_ids(transaction), transaction.id]:
+                    amounts[transaction_id] += difference_in_amount
+            for field, value in {**data, "modified_at": now}.items():
+                setattr(transaction, field, value)
+            values[transaction.id] = data
+            transactions.append(transaction)
+        amounts = {transaction_id: amount_field.from_minor_units(amount) for transaction_id, amount in amounts.items() if amount}
+        TransactionRepository.invalidate_cached_transactions(list(values.keys() | amounts.keys()))
+        if cls.is_total_amount_deferred():
+            TransactionRepository.update_transactions_and_total_amounts(values, {}, modified_at=now)
+            rows = len(TransactionTotalAmountDeltaRepository.append_deltas(amounts))
+        else:
+            # the ancestors get the modified_at of the updated transactions
+            TransactionRepository.update_transactions_and_total_amounts(values, amounts, modified_at=now)
+            rows = len(amounts)
+            for transaction in transactions:
+                transaction.total_amount += amounts.get(transaction.id, 0)
+        cls.__record_propagation(len(amounts), rows)
+        TransactionTypeStatsService.record_updated_transactions(previous_values, transactions)
+        TransactionRollupService.record_updated_transactions(previous_values, transactions)
+        return transactions, len(values), len(amounts.keys() - values.keys())
+
+    @classmethod
+    def apply_pending_total_amounts(cls, transactions):
+        """Adds the pending deltas to the total amount of the given transactions, in memory.
+
+        This is a no-op in the direct mode. In the deferred mode it makes reads of total_amount exact.
+        """
+        if not cls.is_total_amount_deferred():
+            return
+        pending_amounts = TransactionTotalAmountDeltaRepository.get_pending_amounts([transaction.id for transaction in transactions])
+        for transaction in transactions:
+            if transaction.id in pending_amounts:
+                transaction.total_amount += pending_amounts[transaction.id]
+
+    @classmethod
+    def apply_pending_total_amounts_to_rows(cls, rows):
+        """Adds the pending deltas to the total_amount of rows read as dicts, in memory."""
+        if not cls.is_total_amount_deferred():
+            return
+        pending_amounts = TransactionTotalAmountDeltaRepository.get_pending_amounts([row["id"] for row in rows])
+        for row in rows:
+            if row["id"] in pending_amounts:
+                row["total_amount"] += pending_amounts[row["id"]]
+
+    @classmethod
+    async def aapply_pending_total_amounts_to_rows(cls, rows):
+        """Async version of apply_pending_total_amounts_to_rows."""
+        if not cls.is_total_amount_deferred():
+            return
+        pending_amounts = await TransactionTotalAmountDeltaRepository.aget_pending_amounts([row["id"] for row in rows])
+        for row in rows:
+            if row["id"] in pending_amounts:
+                row["total_amount"] += pending_amounts[row["id"]]
+
+    @classmethod
+    def iterate_rows(cls, queryset, fields, chunk_size=2000):
+        """Yields the transactions of a queryset as chunks of dicts of the given fields.
+
+        Rows are streamed from the database chunk by chunk, through a server-side cursor on postgres,
+        so memory does not depend on the number of rows.
+        """
+        rows = queryset.values(*fields).iterator(chunk_size=chunk_size)
+        for chunk in iterate_in_chunks(rows, chunk_size):
+            if "total_amount" in fields:
+                cls.apply_pending_total_amounts_to_rows(chunk)
+            yield chunk
+
+    @classmethod
+    def iterate_subtree(cls, transaction, fields, max_depth=None, chunk_size=2000):
+        """Yields a transaction and its descendants as chunks of dicts of the given fields, parents first."""
+        queryset = TransactionRepository.get_subtree(transaction, max_depth=max_depth)
+        return cls.iterate_rows(queryset, fields, chunk_size=chunk_size)
+
+    @classmethod
+    def rollup_total_amount_deltas(cls, batch_size=1000):
+        """Folds pending deltas into the total amount of their transactions.
+
+        Every batch is committed on its own, the shards are rolled up one after the other. Concurrent
+        rollups skip the deltas locked by each other.
+
+        Returns:
+            int: The number of folded deltas.
+        """
+        folded = 0
+        for alias in TransactionShardRepository.get_shards():
+            while True:
+                with transaction.atomic(), TransactionShardService.on_shard(alias):
+                    delta_ids = TransactionTotalAmountDeltaRepository.lock_delta_ids(batch_size)
+                    if not delta_ids:
+                        break
+                    amounts = TransactionTotalAmountDeltaRepository.sum_deltas_by_transaction(delta_ids)
+                    # the effective total amounts do not change, so the transactions are not touched
+                    TransactionRepository.increment_total_amounts(amounts, touch=False)
+                    TransactionTotalAmountDeltaRepository.delete_deltas(delta_ids)
+                    # the cached stored total amounts change even though the effective ones do not
+                    TransactionRepository.invalidate_cached_transactions(list(amounts))
+                folded += len(delta_ids)
+        return folded
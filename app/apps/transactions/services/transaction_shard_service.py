@@ -0,0 +1,335 @@
+import heapq
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from app.apps.transactions.repositories.totalamountdeltarepo import TransactionTotalAmountDeltaRepository
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from app.apps.transactions.repositories.transactionshardrepo import TransactionShardRepository
+from app.apps.transactions.routers import get_current_shard, get_shards, use_shard
+
+
+class TreeMovedError(Exception):
+    """A tree was written on a shard it was moved from, through a stale directory cache."""
+
+
+def map_shards(function, shards):
+    """Call function(alias) for every shard, in parallel threads up to settings.TRANSACTIONS_SHARDING["FAN_OUT_WORKERS"].
+
+    The shards are called in the calling thread when one of them is in an atomic block, the worker
+    threads would not see its uncommitted writes.
+
+    Returns:
+        list: The results, in the order of the shards.
+    """
+    workers = min(settings.TRANSACTIONS_SHARDING["FAN_OUT_WORKERS"], len(shards))
+    if workers <= 1 or any(connections[alias].in_atomic_block for alias in shards):
+        return [function(alias) for alias in shards]
+
+    def call(alias):
+        try:
+            return function(alias)
+        finally:
+            # the worker threads open their own connections
+            connections[alias].close()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(call, shards))
+
+
+class ShardedQuerySet:
+    """A read only queryset of the transactions of every shard.
+
+    The chained methods are applied to the queryset of every shard, the shards are queried in parallel
+    and their rows, already ordered by each shard, are merged in the order of the queryset. A slice
+    fetches the rows up to its stop from every shard. The ordering can only use model fields in the
+    same direction, the ordering fields missing from the rows of a values() queryset are fetched for
+    the merge and removed from the rows.
+    """
+    CHAINED_METHODS = {"all", "filter", "exclude", "order_by", "only", "defer", "values"}
+
+    def __init__(self, queryset, shards, values_fields=None, start=None, stop=None):
+        self.queryset = queryset
+        self.shards = shards
+        self._values_fields = values_fields
+        self._start, self._stop = start, stop
+        self._result_cache = None
+
+    @property
+    def model(self):
+        return self.queryset.model
+
+    @property
+    def ordered(self):
+        return self.queryset.ordered
+
+    def __getattr__(self, name):
+        if name not in self.CHAINED_METHODS:
+            raise AttributeError(name)
+
+        def chain(*args, **kwargs):
+            if self._start is not None or self._stop is not None:
+                raise TypeError("Cannot filter a query once a slice has been taken.")
+            values_fields = (args if not kwargs else ()) if name == "values" else self._values_fields
+            return ShardedQuerySet(getattr(self.queryset, name)(*args, **kwargs), self.shards, values_fields)
+        return chain
+
+    def get_ordering(self):
+        """Get the names of the ordering fields and whether the ordering is descending."""
+        query = self.queryset.query
+        ordering = query.order_by or (self.model._meta.ordering if query.default_ordering else ())
+        names, directions = [], set()
+        for field in ordering:
+            name = field.lstrip("-") if isinstance(field, str) else None
+            if not name or "__" in name or name == "?":
+                raise ValueError(f"Cannot merge the shards ordered by {field!r}.")
+            names.append(self.model._meta.pk.name if name == "pk" else name)
+            directions.add(field.startswith("-"))
+        if len(directions) > 1:
+            raise ValueError("Cannot merge the shards ordered in both directions.")
+        return names, directions == {True}
+
+    def get_shard_queryset(self):
+        """Get the queryset run on every shard and the ordering fields it adds to the rows."""
+        names, _ = self.get_ordering()
+        missing = [name for name in names if name not in self._values_fields] if self._values_fields else []
+        queryset = self.queryset.values(*self._values_fields, *missing) if missing else self.queryset
+        return queryset, missing
+
+    def merge(self, results, missing):
+        """Merge the ordered rows of the shards."""
+        names, reverse = self.get_ordering()
+        if not names:
+            rows = itertools.chain.from_iterable(results)
+        else:
+            if self._values_fields is not None:
+                keys = names
+                def key(row):
+                    return tuple((row[name] is None, row[name]) for name in keys)
+            else:
+                keys = [self.model._meta.get_field(name).attname for name in names]
+                def key(row):
+                    return tuple((getattr(row, name) is None, getattr(row, name)) for name in keys)
+            # nulls sort last in ascending order, like postgres
+            rows = heapq.merge(*results, key=key, reverse=reverse)
+        for row in rows:
+            for name in missing:
+                del row[name]
+            yield row
+
+    def fetch(self):
+        """Fetch the rows of the slice from every shard in parallel."""
+        if self._result_cache is None:
+            queryset, missing = self.get_shard_queryset()
+            limit = self._stop
+
+            def fetch_shard(alias):
+                shard_queryset = queryset.using(alias)
+                return list(shard_queryset[:limit] if limit is not None else shard_queryset)
+            rows = self.merge(map_shards(fetch_shard, self.shards), missing)
+            self._result_cache = list(itertools.islice(rows, self._start or 0, self._stop))
+        return self._result_cache
+
+    def iterator(self, chunk_size=2000):
+        """Stream the merged rows, every shard is read with its own iterator."""
+        queryset, missing = self.get_shard_queryset()
+        iterators = [queryset.using(alias).iterator(chunk_size=chunk_size) for alias in self.shards]
+        return itertools.islice(self.merge(iterators, missing), self._start or 0, self._stop)
+
+    def count(self):
+        if self._start is not None or self._stop is not None:
+            return len(self.fetch())
+        return sum(map_shards(lambda alias: self.queryset.using(alias).count(), self.shards))
+
+    def exists(self):
+        return self.count() > 0
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if key.step is not None:
+                raise ValueError("Cannot merge the shards with a slice step.")
+            offset = self._start or 0
+            start = offset + (key.start or 0)
+            stop = offset + key.stop if key.stop is not None else self._stop
+            if self._stop is not None and stop is not None:
+                stop = min(stop, self._stop)
+            return ShardedQuerySet(self.queryset, self.shards, self._values_fields, start, stop)
+        return self[key:key + 1].fetch()[0]
+
+    def __iter__(self):
+        return iter(self.fetch())
+
+    def __len__(self):
+        return len(self.fetch())
+
+    async def acount(self):
+        return await sync_to_async(self.count)()
+
+    async def __aiter__(self):
+        for row in await sync_to_async(self.fetch)():
+            yield row
+
+
+class TransactionShardService:
+    """Transaction shard service
+
+    This class contains methods to place the trees of transactions on shards, the database aliases
+    of settings.TRANSACTIONS_SHARDING["SHARDS"]. Every operation of TransactionService stays inside
+    one tree, so a tree is never split: a new root is placed on the shard its id hashes to and the
+    descendants are created on the shard of their root. The trees which are not on the first shard
+    are recorded in the shard directory, see TransactionShardRepository.
+
+    The aggregates, the directory and the ingestion queue stay on default, the writes of a tree commit
+    on its shard right before default commits.
+
+    Methods defined here:
+    - is_sharded() -> bool
+    - get_shard_for_new_transaction(transaction_id, parent_transaction) -> str
+    - on_shard(alias) -> context manager
+    - check_current_shard(root_ids, transaction_ids) -> None
+    - fan_out(queryset) -> ShardedQuerySet
+    - count_transactions_by_shard() -> dict
+    - get_tree_sizes(alias, limit) -> list
+    - move_tree(root_id, target, wait) -> int
+    - plan_rebalance(max_moves) -> list
+    """
+
+    @classmethod
+    def is_sharded(cls):
+        """Checks if there is more than one shard."""
+        return TransactionShardRepository.is_sharded()
+
+    @classmethod
+    def get_shard_for_new_transaction(cls, transaction_id, parent_transaction=None):
+        """Get the shard a new transaction is created on, None when the transactions are not sharded."""
+        if not cls.is_sharded():
+            return None
+        if parent_transaction is not None:
+            return TransactionShardRepository.get_shard_of(parent_transaction)
+        shards = get_shards()
+        return shards[transaction_id.int % len(shards)]
+
+    @classmethod
+    @contextmanager
+    def on_shard(cls, alias):
+        """Route the transactions of the block to a shard and make it atomic on the shard.
+
+        The caller holds the atomic block on default, a shard commits right before default.
+        """
+        with use_shard(alias), (transaction.atomic(using=alias) if alias not in (None, DEFAULT_DB_ALIAS) else nullcontext()):
+            yield
+
+    @classmethod
+    def check_current_shard(cls, root_ids, transaction_ids):
+        """Checks that trees locked on the current shard were not moved to another shard, see move_tree.
+
+        Raises TreeMovedError when one was, after dropping the cached shards of the transactions.
+        """
+        alias = get_current_shard()
+        if not cls.is_sharded() or alias is None:
+            return
+        if any(shard != alias for shard in TransactionShardRepository.get_shards_of_trees(root_ids).values()):
+            TransactionShardRepository.forget(transaction_ids)
+            raise TreeMovedError(f"The tree was moved from {alias!r} to another shard.")
+
+    @classmethod
+    def fan_out(cls, queryset):
+        """Get a queryset of the transactions reading every shard, the queryset itself when they are not sharded.
+
+        Raises ValueError when the ordering of the queryset can not be merged.
+        """
+        if not cls.is_sharded():
+            return queryset
+        queryset = ShardedQuerySet(queryset, get_shards())
+        queryset.get_ordering()
+        return queryset
+
+    @classmethod
+    def count_transactions_by_shard(cls):
+        """Count the transactions of every shard, keyed by shard alias."""
+        shards = get_shards()
+        return dict(zip(shards, map_shards(lambda alias: TransactionRepository.get_all_queryset().using(alias).count(), shards)))
+
+    @classmethod
+    def get_tree_sizes(cls, alias, limit=None):
+        """Get the (root id, number of transactions) of the trees of a shard, largest first."""
+        with use_shard(alias):
+            return TransactionRepository.get_tree_sizes(limit)
+
+    @classmethod
+    def move_tree(cls, root_id, target, wait=None):
+        """Moves a tree of transactions to another shard.
+
+        The rows of the tree are locked on the source shard and copied to the target with the same ids
+        and timestamps, then the directory is switched before the locks are released. The writes of
+        TransactionService lock the row they write under and check the directory under the lock, so
+        the ones routed to the source by a stale directory cache raise TreeMovedError.
+        Processes which cached the previous shard of the tree keep reading it for
+        settings.TRANSACTIONS_SHARDING["DIRECTORY_CACHE_TTL"] seconds, so the copy on the source is only
+        deleted after waiting that long, and kept when it was written in between.
+
+        Returns:
+            int: The number of moved transactions.
+        """
+        source = TransactionShardRepository.get_shard(root_id)
+        if target not in get_shards():
+            raise ValueError(f"Unknown shard {target!r}.")
+        if source == target:
+            return 0
+        with transaction.atomic(using=source), transaction.atomic(), transaction.atomic(using=target):
+            with use_shard(source):
+                # the writers lock the row they write under, the tree is read again until the rows
+                # they committed before it was locked are read and locked too
+                rows = TransactionRepository.lock_tree(root_id)
+                while True:
+                    if not rows:
+                        raise ValueError(f"No tree with the root {root_id} on {source!r}.")
+                    locked_rows, rows = rows, TransactionRepository.lock_tree(root_id)
+                    if rows == locked_rows:
+                        break
+                ids = [row[0] for row in rows]
+                if TransactionTotalAmountDeltaRepository.get_pending_amounts(ids):
+                    raise ValueError(f"The tree {root_id} has pending total amount deltas, roll them up first.")
+            with use_shard(target):
+                # a previous move interrupted before its directory switch can have left a copy
+                TransactionRepository.delete_tree(root_id)
+                TransactionRepository.copy_transaction_rows(rows)
+            TransactionShardRepository.set_shard([root_id], target, ids)
+            TransactionRepository.invalidate_cached_transactions(ids)
+
+        time.sleep(settings.TRANSACTIONS_SHARDING["DIRECTORY_CACHE_TTL"] if wait is None else wait)
+        with transaction.atomic(using=source), use_shard(source):
+            if TransactionRepository.lock_tree(root_id) != rows or TransactionTotalAmountDeltaRepository.get_pending_amounts(ids):
+                raise ValueError(f"The tree {root_id} was written on {source!r} during the move, its copy there was kept.")
+            TransactionRepository.delete_tree(root_id)
+        return len(ids)
+
+    @classmethod
+    def plan_rebalance(cls, max_moves=10):
+        """Plan the moves of trees from the fullest shards to the emptiest ones.
+
+        A tree is moved only when the move reduces the gap between the two shards.
+
+        Returns:
+            list: The (root id, number of transactions, source, target) of the moves, in order.
+        """
+        counts = cls.count_transactions_by_shard()
+        trees = {alias: cls.get_tree_sizes(alias, limit=max_moves * 10) for alias in counts}
+        moves = []
+        while len(moves) < max_moves:
+            source = max(counts, key=counts.get)
+            target = min(counts, key=counts.get)
+            gap = counts[source] - counts[target]
+            candidates = [tree for tree in trees[source] if tree[1] < gap]
+            if not candidates:
+                break
+            # the largest tree which does not overshoot
+            root_id, size = max(candidates, key=lambda tree: min(tree[1], gap - tree[1]))
+            trees[source].remove((root_id, size))
+            counts[source] -= size
+            counts[target] += size
+            moves.append((root_id, size, source, target))
+        return moves
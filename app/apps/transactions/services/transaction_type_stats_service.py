@@ -0,0 +1,127 @@
+from decimal import Decimal
+from django.db import transaction
+from django.utils import timezone
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from app.apps.transactions.repositories.transactiontypestatsrepo import TransactionTypeStatsRepository
+
+class TransactionTypeStatsService:
+    """Transaction type stats service
+
+    This class contains methods to maintain and read the count, sum, min and max amount of the
+    transactions of every type. The stats are updated by TransactionService in the same atomic
+    block as the transactions. The sums are computed on integer minor units.
+
+    Methods defined here:
+    - __remove_from_stats(transaction_type, amount) -> None
+    - record_created_transactions(transactions) -> None
+    - record_updated_transaction(transaction_type, amount, transaction) -> None
+    - record_updated_transactions(previous_values, transactions) -> None
+    - get_stats(transaction_type) -> TransactionTypeStats
+    - get_all_stats() -> QuerySet
+    - rebuild_stats(chunk_size) -> int
+    """
+
+    @classmethod
+    def __remove_from_stats(cls, transaction_type, amount):
+        """Removes a transaction from the stats of its type."""
+        stats = TransactionTypeStatsRepository.subtract_from_stats(transaction_type, 1, amount)
+        if stats is None:
+            return
+        # the min or the max is only known to change if the removed amount was one of them
+        if amount in (stats.min_amount, stats.max_amount):
+            TransactionTypeStatsRepository.recompute_bounds(transaction_type)
+
+    @classmethod
+    def record_created_transactions(cls, transactions):
+        """Adds new transactions to the stats, with one update per transaction type."""
+        amount_field = TransactionRepository.get_model()._meta.get_field("amount")
+        stats = {}
+        for transaction in transactions:
+            count, amount_sum, min_amount, max_amount = stats.get(transaction.transaction_type, (0, 0, transaction.amount, transaction.amount))
+            stats[transaction.transaction_type] = (count + 1, amount_sum + amount_field.to_minor_units(transaction.amount), min(min_amount, transaction.amount), max(max_amount, transaction.amount))
+        for transaction_type, (count, amount_sum, min_amount, max_amount) in stats.items():
+            TransactionTypeStatsRepository.add_to_stats(transaction_type, count, amount_field.from_minor_units(amount_sum), min_amount, max_amount)
+
+    @classmethod
+    def record_updated_transaction(cls, transaction_type, amount, transaction):
+        """Moves an updated transaction from its previous type and amount to the current ones."""
+        if transaction_type == transaction.transaction_type and amount == transaction.amount:
+            return
+        cls.__remove_from_stats(transaction_type, amount)
+        TransactionTypeStatsRepository.add_to_stats(transaction.transaction_type, 1, transaction.amount, transaction.amount, transaction.amount)
+
+    @classmethod
+    def record_updated_transactions(cls, previous_values, transactions):
+        """Moves updated transactions from their previous (type, amount) to the current ones, with a few updates per type.
+
+        The transactions have to be saved already, the bounds of a type are recomputed from the table.
+        """
+        amount_field = TransactionRepository.get_model()._meta.get_field("amount")
+        removed = {}
+        changed_transactions = []
+        for (transaction_type, amount), transaction in zip(previous_values, transactions):
+            if transaction_type == transaction.transaction_type and amount == transaction.amount:
+                continue
+            count, amount_sum, amounts = removed.get(transaction_type, (0, 0, set()))
+            removed[transaction_type] = (count + 1, amount_sum + amount_field.to_minor_units(amount), amounts | {amount})
+            changed_transactions.append(transaction)
+        bounds_to_recompute = []
+        for transaction_type, (count, amount_sum, amounts) in removed.items():
+            stats = TransactionTypeStatsRepository.subtract_from_stats(transaction_type, count, amount_field.from_minor_units(amount_sum))
+            # the min or the max is only known to change if a removed amount was one of them
+            if stats is not None and (stats.min_amount in amounts or stats.max_amount in amounts):
+                bounds_to_recompute.append(transaction_type)
+        cls.record_created_transactions(changed_transactions)
+        for transaction_type in bounds_to_recompute:
+            TransactionTypeStatsRepository.recompute_bounds(transaction_type)
+
+    @classmethod
+    def get_stats(cls, transaction_type):
+        """Get the stats of a transaction type, empty stats if there are no transactions of the type."""
+        stats = TransactionTypeStatsRepository.get_stats_by_type(transaction_type)
+        if stats is None:
+            stats = TransactionTypeStatsRepository.get_model()(transaction_type=transaction_type, count=0, amount_sum=Decimal(0))
+        return stats
+
+    @classmethod
+    def get_all_stats(cls):
+        """Get the stats of all the transaction types."""
+        return TransactionTypeStatsRepository.get_all_queryset().filter(count__gt=0).order_by("transaction_type")
+
+    @classmethod
+    @transaction.atomic
+    def rebuild_stats(cls, chunk_size=2000):
+        """Rebuilds the stats of all the types from the transactions in one streaming pass.
+
+        The existing stats rows are locked first, so concurrent writers wait for the rebuild and
+        then apply their change on top of the rebuilt stats.
+
+        Returns:
+            int: The number of transactions read.
+        """
+        existing_stats = TransactionTypeStatsRepository.lock_all_stats()
+        amount_field = TransactionRepository.get_model()._meta.get_field("amount")
+        aggregates = {}
+        read = 0
+        for transaction_type, amount in TransactionRepository.iterate_types_and_amounts(chunk_size=chunk_size):
+            read += 1
+            aggregate = aggregates.get(transaction_type)
+            if aggregate is None:
+                aggregates[transaction_type] = [1, amount_field.to_minor_units(amount), amount, amount]
+                continue
+            aggregate[0] += 1
+            aggregate[1] += amount_field.to_minor_units(amount)
+            if amount < aggregate[2]:
+                aggregate[2] = amount
+            if amount > aggregate[3]:
+                aggregate[3] = amount
+
+        stats = []
+        now = timezone.now()
+        for transaction_type, (count, amount_sum, min_amount, max_amount) in aggregates.items():
+            type_stats = existing_stats.get(transaction_type) or TransactionTypeStatsRepository.get_model()(transaction_type=transaction_type)
+            type_stats.count, type_stats.amount_sum, type_stats.min_amount, type_stats.max_amount = count, amount_field.from_minor_units(amount_sum), min_amount, max_amount
+            type_stats.modified_at = now
+            stats.append(type_stats)
+        TransactionTypeStatsRepository.save_all_stats(stats, set(existing_stats) - set(aggregates))
+        return read
@@ -2,4 +2,15 @@ from app.settings import  BASE_URL
 CREATE_TRANSACTION_URL = f"{BASE_URL}/transactions/"
 LIST_TRANSACTION_URL = f"{BASE_URL}/transactions/"
 RETRIEVE_TRANSACTION_URL = f"{BASE_URL}/transactions/{{transaction_id}}/"
-UPDATE_TRANSACTION_URL = f"{BASE_URL}/transactions/{{transaction_id}}/"
\ No newline at end of file
+UPDATE_TRANSACTION_URL = f"{BASE_URL}/transactions/{{transaction_id}}/"
+BATCH_TRANSACTION_URL = f"{BASE_URL}/transactions/batch/"
+STATS_TRANSACTION_URL = f"{BASE_URL}/transactions/stats/"
+CACHE_STATS_TRANSACTION_URL = f"{BASE_URL}/transactions/cache-stats/"
+TREE_TRANSACTION_URL = f"{BASE_URL}/transactions/{{transaction_id}}/tree/"
+EXPORT_TRANSACTION_URL = f"{BASE_URL}/transactions/export/"
+ASYNC_CREATE_TRANSACTION_URL = f"{BASE_URL}/async/transactions/"
+ASYNC_LIST_TRANSACTION_URL = f"{BASE_URL}/async/transactions/"
+ASYNC_RETRIEVE_TRANSACTION_URL = f"{BASE_URL}/async/transactions/{{transaction_id}}/"
+ROLLUPS_TRANSACTION_URL = f"{BASE_URL}/transactions/rollups/"
+INGEST_TRANSACTION_URL = f"{BASE_URL}/transactions/ingest/"
+INGEST_STATUS_TRANSACTION_URL = f"{BASE_URL}/transactions/ingest/{{transaction_id}}/"
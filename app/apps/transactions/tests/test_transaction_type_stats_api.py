@@ -0,0 +1,84 @@
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
+from decimal import Decimal
+from unittest import mock
+from django.conf import settings
+from django.core.management import call_command
+from rest_framework import status
+from rest_framework.test import APITestCase
+from app.apps.transactions.repositories.transactiontypestatsrepo import TransactionTypeStatsRepository
+from endpoints import CREATE_TRANSACTION_URL, BATCH_TRANSACTION_URL, UPDATE_TRANSACTION_URL, STATS_TRANSACTION_URL
+
+
+class TransactionTypeStatsAPITestCase(APITestCase):
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
+    def setUp(self):
+        """Set up transactions through the API so that the stats are maintained."""
+        self.ids = []
+        for amount, transaction_type in [(10, "Food"), (30, "Food"), (20, "Food"), (100, "Rent")]:
+            response = self.client.post(CREATE_TRANSACTION_URL, {"amount": amount, "transaction_type": transaction_type}, format='json')
+            self.ids.append(response.data["id"])
+
+    def get_stats(self, transaction_type):
+        """Get the stats of a type from the API."""
+        response = self.client.get(STATS_TRANSACTION_URL + f'?transaction_type={transaction_type}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data
+        return [data["count"], Decimal(data["amount_sum"]), data["min_amount"] and Decimal(data["min_amount"]), data["max_amount"] and Decimal(data["max_amount"])]
+
+    def test_stats_are_maintained_on_create(self):
+        """Tests the stats after single and batch creation."""
+        self.assertEqual(self.get_stats("Food"), [3, Decimal(60), Decimal(10), Decimal(30)])
+        response = self.client.post(BATCH_TRANSACTION_URL, [{"amount": 5, "transaction_type": "Food"}, {"amount": 50, "transaction_type": "Food"}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.get_stats("Food"), [5, Decimal(115), Decimal(5), Decimal(50)])
+        self.assertEqual(self.get_stats("Unknown"), [0, Decimal(0), None, None])
+        response = self.client.get(STATS_TRANSACTION_URL)
+        self.assertEqual([row["transaction_type"] for row in response.data], ["Food", "Rent"])
+
+    def test_stats_are_maintained_on_update(self):
+        """Tests the stats after updating the amount and the type of transactions."""
+        # the max amount changes
+        self.client.patch(UPDATE_TRANSACTION_URL.format(transaction_id=self.ids[1]), {"amount": 15}, format='json')
+        self.assertEqual(self.get_stats("Food"), [3, Decimal(45), Decimal(10), Decimal(20)])
+        # the min amount moves to another type
+        self.client.patch(UPDATE_TRANSACTION_URL.format(transaction_id=self.ids[0]), {"transaction_type": "Rent"}, format='json')
+        self.assertEqual(self.get_stats("Food"), [2, Decimal(35), Decimal(15), Decimal(20)])
+        self.assertEqual(self.get_stats("Rent"), [2, Decimal(110), Decimal(10), Decimal(100)])
+        # the last transaction of a type moves away
+        self.client.patch(UPDATE_TRANSACTION_URL.format(transaction_id=self.ids[3]), {"transaction_type": "Food"}, format='json')
+        self.client.patch(UPDATE_TRANSACTION_URL.format(transaction_id=self.ids[0]), {"transaction_type": "Food"}, format='json')
+        self.assertEqual(self.get_stats("Rent"), [0, Decimal(0), None, None])
+
+    def test_stats_modified_at(self):
+        """Tests that the incremental updates of the stats refresh their modified_at."""
+        TransactionTypeStatsRepository.get_all_queryset().update(modified_at=datetime(2020, 1, 1, tzinfo=dt_timezone.utc))
+        self.client.post(CREATE_TRANSACTION_URL, {"amount": 5, "transaction_type": "Food"}, format='json')
+        self.client.patch(UPDATE_TRANSACTION_URL.format(transaction_id=self.ids[3]), {"transaction_type": "Other"}, format='json')
+        stats = {type_stats.transaction_type: type_stats.modified_at for type_stats in TransactionTypeStatsRepository.get_all_queryset()}
+        self.assertEqual(set(stats), {"Food", "Rent", "Other"})
+        self.assertTrue(all(modified_at.year > 2020 for modified_at in stats.values()), stats)
+
+    def test_rebuild_stats(self):
+        """Tests that the rebuild command repairs drifted stats."""
+        TransactionTypeStatsRepository.get_all_queryset().filter(transaction_type="Food").update(count=99, min_amount=0)
+        TransactionTypeStatsRepository.get_all_queryset().create(transaction_type="Stale", count=1, amount_sum=1)
+        TransactionTypeStatsRepository.get_all_queryset().filter(transaction_type="Rent").delete()
+        call_command("rebuild_transaction_type_stats", stdout=StringIO())
+        self.assertEqual(self.get_stats("Food"), [3, Decimal(60), Decimal(10), Decimal(30)])
+        self.assertEqual(self.get_stats("Rent"), [1, Decimal(100), Decimal(100), Decimal(100)])
+        self.assertEqual(self.get_stats("Stale"), [0, Decimal(0), None, None])
+
+    def test_rebuild_stats_with_concurrent_new_type(self):
+        """Tests that the rebuild overwrites the stats of a new type created after it locked the existing stats."""
+        TransactionTypeStatsRepository.get_all_queryset().filter(transaction_type="Rent").delete()
+        lock_all_stats = TransactionTypeStatsRepository.lock_all_stats
+
+        def lock_then_create(*args):
+            stats = lock_all_stats()
+            TransactionTypeStatsRepository.add_to_stats("Rent", 1, Decimal(100), Decimal(100), Decimal(100))
+            return stats
+        with mock.patch.object(TransactionTypeStatsRepository, "lock_all_stats", side_effect=lock_then_create):
+            call_command("rebuild_transaction_type_stats", stdout=StringIO())
+        self.assertEqual(self.get_stats("Rent"), [1, Decimal(100), Decimal(100), Decimal(100)])
@@ -1,6 +1,9 @@
 import uuid
 import copy
 from decimal import Decimal
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APITestCase
 from app.apps.transactions.repositories.transactionrepo import TransactionRepository
@@ -11,6 +14,8 @@ from fixtures.valid_updation_data import VALID_UPDATION_DATA
 from fixtures.invalid_updation_data import INVALID_UPDATION_DATA
 
 class TransactionAPITestCase(APITestCase):
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
     def setUp(self):
         """Set up the test."""
         fields = {
@@ -153,4 +158,30 @@ class TransactionAPITestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIsInstance(response.data, dict)
         self.assertIn('results', response.data)
-        self.assertEqual(len(response.data.get('results')), 0)
\ No newline at end of file
+        self.assertEqual(len(response.data.get('results')), 0)
+
+    def test_amount_propagation_in_deep_chain(self):
+        """Tests that all ancestors of a deep transaction are updated with a constant number of queries."""
+        leaf = self.test_transaction
+        chain = [leaf]
+        for _ in range(20):
+            leaf = TransactionRepository.create_transaction(amount=Decimal(0), total_amount=Decimal(0), transaction_type='Test transaction', parent_transaction=leaf)
+            chain.append(leaf)
+        data = {"amount": 50, "transaction_type": "Test transaction", "parent_transaction": str(self.test_transaction.id)}
+        # warm up, the first transaction of a type creates its stats
+        self.client.post(CREATE_TRANSACTION_URL, data, format='json')
+        with CaptureQueriesContext(connection) as shallow_queries:
+            self.client.post(CREATE_TRANSACTION_URL, data, format='json')
+        data["parent_transaction"] = str(leaf.id)
+        with CaptureQueriesContext(connection) as deep_queries:
+            response = self.client.post(CREATE_TRANSACTION_URL, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(deep_queries), len(shallow_queries))
+        url = UPDATE_TRANSACTION_URL.format(transaction_id=response.data["id"])
+        response = self.client.patch(url, {"amount": 80}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Decimal(response.data["total_amount"]), Decimal(80))
+        for ancestor in chain:
+            ancestor.refresh_from_db()
+        self.assertEqual(chain[0].total_amount, Decimal(280))
+        self.assertTrue(all(ancestor.total_amount == Decimal(80) for ancestor in chain[1:]))
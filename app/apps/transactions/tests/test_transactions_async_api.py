@@ -0,0 +1,56 @@
+import uuid
+from decimal import Decimal
+from django.conf import settings
+from django.test import TestCase, override_settings
+from rest_framework import status
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from app.apps.transactions.services.transaction_service import TransactionService
+from endpoints import ASYNC_CREATE_TRANSACTION_URL, ASYNC_LIST_TRANSACTION_URL, ASYNC_RETRIEVE_TRANSACTION_URL, LIST_TRANSACTION_URL, RETRIEVE_TRANSACTION_URL
+
+
+class AsyncTransactionAPITestCase(TestCase):
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
+    def setUp(self):
+        """Set up a small tree."""
+        self.root = TransactionService.create_transaction({"amount": Decimal(10), "total_amount": Decimal(10), "transaction_type": "Food"})
+        for amount in (Decimal(1), Decimal("2.5")):
+            TransactionService.create_transaction({"amount": amount, "total_amount": amount, "transaction_type": "Rent", "parent_transaction": self.root})
+
+    async def assert_same_response(self, async_url, url):
+        """Check that the async view responds the same as the DRF view, but for the links to itself."""
+        response = await self.async_client.get(async_url)
+        expected_response = await self.async_client.get(url)
+        self.assertEqual((response.status_code, response.content.replace(b"/async/", b"/")), (expected_response.status_code, expected_response.content))
+        return response
+
+    async def test_list(self):
+        """Tests the list with fields, filters and both paginations."""
+        for query in ('', '?fields=total_amount', '?transaction_type=Rent&page_size=1&page=2', '?page_size=0', '?page=9', '?fields=path'):
+            await self.assert_same_response(ASYNC_LIST_TRANSACTION_URL + query, LIST_TRANSACTION_URL + query)
+        query = '?pagination=cursor&page_size=2'
+        response = await self.assert_same_response(ASYNC_LIST_TRANSACTION_URL + query, LIST_TRANSACTION_URL + query)
+        next_url = response.json()["next"]
+        await self.assert_same_response(next_url, next_url.replace("/async/", "/"))
+
+    async def test_retrieve(self):
+        """Tests retrieving existing and missing transactions."""
+        for transaction_id, query in ((self.root.id, ''), (self.root.id, '?fields=total_amount'), (uuid.uuid4(), ''), ('invalid', '')):
+            await self.assert_same_response(ASYNC_RETRIEVE_TRANSACTION_URL.format(transaction_id=transaction_id) + query, RETRIEVE_TRANSACTION_URL.format(transaction_id=transaction_id) + query)
+
+    @override_settings(TRANSACTIONS_TOTAL_AMOUNT_MODE="deferred")
+    async def test_create(self):
+        """Tests creating a transaction and reading the pending total amount of its parent."""
+        response = await self.async_client.post(ASYNC_CREATE_TRANSACTION_URL, {"amount": 4, "transaction_type": "Rent", "parent_transaction": str(self.root.id)}, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()["parent_transaction"], str(self.root.id))
+        response = await self.async_client.get(ASYNC_RETRIEVE_TRANSACTION_URL.format(transaction_id=self.root.id) + '?fields=total_amount')
+        self.assertEqual(response.json()["total_amount"], "17.50")
+        stored_root = await TransactionRepository.get_all_queryset().aget(id=self.root.id)
+        self.assertEqual(stored_root.total_amount, Decimal("13.50"))
+
+    async def test_create_validation(self):
+        """Tests that invalid transactions are rejected."""
+        response = await self.async_client.post(ASYNC_CREATE_TRANSACTION_URL, {"amount": -1, "transaction_type": "Rent", "parent_transaction": str(uuid.uuid4())}, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.json()), {"amount", "parent_transaction"})
@@ -0,0 +1,77 @@
+import uuid
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITestCase
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from endpoints import BATCH_TRANSACTION_URL
+
+
+class TransactionBatchAPITestCase(APITestCase):
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
+    def setUp(self):
+        """Set up the test."""
+        fields = {
+            'amount': Decimal(100.00),
+            'total_amount': Decimal(100.00),
+            'transaction_type': 'Test transaction'
+        }
+        self.test_transaction = TransactionRepository.create_transaction(**fields)
+
+    def test_batch_create_with_temp_id_references(self):
+        """Tests creating a batch whose items reference each other and an existing transaction."""
+        data = [
+            {"temp_id": "grandchild", "parent_temp_id": "child", "amount": 5, "transaction_type": "Food"},
+            {"temp_id": "child", "parent_transaction": str(self.test_transaction.id), "amount": 20, "transaction_type": "Food"},
+            {"parent_temp_id": "child", "amount": 7, "transaction_type": "Rent"},
+            {"amount": 1, "transaction_type": "Rent"},
+        ]
+        response = self.client.post(BATCH_TRANSACTION_URL, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 4)
+        self.assertEqual(TransactionRepository.get_all_queryset().count(), 5)
+        grandchild, child, sibling, root = response.data
+        self.assertEqual(str(grandchild["parent_transaction"]), child["id"])
+        self.assertEqual(str(sibling["parent_transaction"]), child["id"])
+        self.assertEqual(Decimal(child["total_amount"]), Decimal(32))
+        self.assertIsNone(root["parent_transaction"])
+        self.test_transaction.refresh_from_db()
+        self.assertEqual(self.test_transaction.total_amount, Decimal(132))
+
+    def test_batch_create_query_count_does_not_depend_on_batch_size(self):
+        """Tests that parents are resolved and ancestors updated once for the whole batch."""
+        leaf = self.test_transaction
+        for _ in range(5):
+            leaf = TransactionRepository.create_transaction(amount=Decimal(0), total_amount=Decimal(0), transaction_type='Test transaction', parent_transaction=leaf)
+        data = [{"parent_transaction": str(leaf.id), "amount": 1, "transaction_type": "Food"}]
+        # warm up, the first transaction of a type creates its stats
+        self.client.post(BATCH_TRANSACTION_URL, data, format='json')
+        with CaptureQueriesContext(connection) as single_item_queries:
+            self.client.post(BATCH_TRANSACTION_URL, data, format='json')
+        with CaptureQueriesContext(connection) as batch_queries:
+            response = self.client.post(BATCH_TRANSACTION_URL, data * 50, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(batch_queries), len(single_item_queries))
+        self.test_transaction.refresh_from_db()
+        self.assertEqual(self.test_transaction.total_amount, Decimal(152))
+
+    def test_batch_create_with_invalid_data(self):
+        """Tests that an invalid item rejects the whole batch."""
+        invalid_batches = [
+            [{"amount": 1, "transaction_type": "Food", "parent_transaction": str(uuid.uuid4())}],
+            [{"amount": 1, "transaction_type": "Food", "parent_temp_id": "missing"}],
+            [{"temp_id": "a", "amount": 1, "transaction_type": "Food"}, {"temp_id": "a", "amount": 1, "transaction_type": "Food"}],
+            [
+                {"temp_id": "a", "parent_temp_id": "b", "amount": 1, "transaction_type": "Food"},
+                {"temp_id": "b", "parent_temp_id": "a", "amount": 1, "transaction_type": "Food"},
+            ],
+            [{"amount": -1, "transaction_type": "Food"}],
+            [],
+        ]
+        for data in invalid_batches:
+            response = self.client.post(BATCH_TRANSACTION_URL, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(TransactionRepository.get_all_queryset().count(), 1)
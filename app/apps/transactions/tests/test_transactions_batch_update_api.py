@@ -0,0 +1,75 @@
+import uuid
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITestCase
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from app.apps.transactions.services.total_amount_reconciliation_service import TotalAmountReconciliationService
+from app.apps.transactions.services.transaction_service import TransactionService
+from app.apps.transactions.services.transaction_type_stats_service import TransactionTypeStatsService
+from endpoints import BATCH_TRANSACTION_URL
+
+
+class TransactionBatchUpdateAPITestCase(APITestCase):
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
+    def setUp(self):
+        """Set up a root with a child which has two children."""
+        self.root = self.create_transaction(Decimal(100))
+        self.child = self.create_transaction(Decimal(10), self.root)
+        self.leaves = [self.create_transaction(Decimal(1), self.child), self.create_transaction(Decimal(2), self.child)]
+
+    def create_transaction(self, amount, parent_transaction=None):
+        """Create a transaction through the service so the ancestors total amounts are updated."""
+        return TransactionService.create_transaction({"amount": amount, "total_amount": amount, "transaction_type": "Food", "parent_transaction": parent_transaction})
+
+    def get_total_amounts(self):
+        """Get the stored total amounts of the root, the child and the leaves."""
+        transactions = TransactionRepository.get_transactions_in_bulk([self.root.id, self.child.id, *(leaf.id for leaf in self.leaves)])
+        return [transactions[transaction.id].total_amount for transaction in (self.root, self.child, *self.leaves)]
+
+    def test_batch_update(self):
+        """Tests that the shared ancestors are updated once with the merged differences."""
+        data = [
+            {"id": str(self.leaves[0].id), "amount": 6},
+            {"id": str(self.leaves[1].id), "amount": 1, "transaction_type": "Rent"},
+            {"id": str(self.child.id), "amount": 11},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(BATCH_TRANSACTION_URL, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data["updated"], response.data["ancestors_updated"]), (3, 1))
+        self.assertEqual([Decimal(item["total_amount"]) for item in response.data["results"]], [Decimal(6), Decimal(1), Decimal(18)])
+        self.assertEqual(self.get_total_amounts(), [Decimal(118), Decimal(18), Decimal(6), Decimal(1)])
+        transaction_updates = [query for query in queries.captured_queries if query["sql"].startswith('UPDATE "transactions_transaction"')]
+        self.assertEqual(len(transaction_updates), 1)
+        self.assertEqual(TotalAmountReconciliationService.reconcile()[1], 0)
+        self.assertEqual((TransactionTypeStatsService.get_stats("Food").count, TransactionTypeStatsService.get_stats("Rent").amount_sum), (3, Decimal(1)))
+        self.assertEqual(TransactionTypeStatsService.get_stats("Food").max_amount, Decimal(100))
+
+    @override_settings(TRANSACTIONS_TOTAL_AMOUNT_MODE="deferred")
+    def test_batch_update_deferred(self):
+        """Tests that the merged differences are appended as pending deltas in the deferred mode."""
+        data = [{"id": str(leaf.id), "amount": 4} for leaf in self.leaves]
+        response = self.client.patch(BATCH_TRANSACTION_URL, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([Decimal(item["total_amount"]) for item in response.data["results"]], [Decimal(4), Decimal(4)])
+        TransactionService.rollup_total_amount_deltas()
+        self.assertEqual(self.get_total_amounts(), [Decimal(118), Decimal(18), Decimal(4), Decimal(4)])
+
+    def test_batch_update_validation(self):
+        """Tests that unknown and duplicate ids and invalid amounts are rejected without any update."""
+        data = [
+            {"id": str(self.leaves[0].id), "amount": 6},
+            {"id": str(self.leaves[0].id), "amount": 7},
+            {"id": str(uuid.uuid4()), "amount": 1},
+        ]
+        response = self.client.patch(BATCH_TRANSACTION_URL, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([set(error) for error in response.data["non_field_errors"]], [set(), {"id"}, {"id"}])
+        response = self.client.patch(BATCH_TRANSACTION_URL, [{"id": str(self.child.id), "amount": -1}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.get_total_amounts(), [Decimal(113), Decimal(13), Decimal(1), Decimal(2)])
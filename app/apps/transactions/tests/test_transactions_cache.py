@@ -0,0 +1,126 @@
+import os
+import time
+import tempfile
+from decimal import Decimal
+from unittest import mock
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from endpoints import CREATE_TRANSACTION_URL, RETRIEVE_TRANSACTION_URL, UPDATE_TRANSACTION_URL, CACHE_STATS_TRANSACTION_URL
+
+TRANSACTIONS_CACHE = {"ENABLED": True, "LOCAL_MAX_SIZE": 2, "LOCAL_TTL": 60, "BACKEND": "", "BACKEND_TTL": 60}
+# a backend shared by processes, unlike the LocMemCache of default
+CACHES = {**settings.CACHES, "shared": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": os.path.join(tempfile.gettempdir(), "transactions_cache_tests")}}
+
+
+@override_settings(TRANSACTIONS_CACHE=TRANSACTIONS_CACHE, CACHES=CACHES)
+class TransactionCacheTestCase(APITestCase):
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
+    def setUp(self):
+        """Set up the test."""
+        TransactionRepository.reset_cache()
+        caches["shared"].clear()
+        fields = {
+            'amount': Decimal(100.00),
+            'total_amount': Decimal(100.00),
+            'transaction_type': 'Test transaction'
+        }
+        self.test_transaction = TransactionRepository.create_transaction(**fields)
+
+    def get_total_amount(self, transaction_id):
+        """Get the total amount of a transaction from the API."""
+        url = RETRIEVE_TRANSACTION_URL.format(transaction_id=transaction_id) + '?fields=total_amount'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return Decimal(response.data["total_amount"])
+
+    def test_retrieve_is_served_from_cache(self):
+        """Tests that a second retrieve does not query the database."""
+        self.assertEqual(self.get_total_amount(self.test_transaction.id), Decimal(100))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_total_amount(self.test_transaction.id), Decimal(100))
+        stats = self.client.get(CACHE_STATS_TRANSACTION_URL).data
+        self.assertEqual((stats["local_hits"], stats["local_misses"]), (1, 1))
+
+    def test_writes_invalidate_the_transaction_and_its_ancestors(self):
+        """Tests that cached totals are invalidated when a descendant is created or updated."""
+        self.get_total_amount(self.test_transaction.id)
+        data = {"amount": 50, "transaction_type": "Test transaction", "parent_transaction": str(self.test_transaction.id)}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(CREATE_TRANSACTION_URL, data, format='json')
+        child_id = response.data["id"]
+        self.assertEqual(self.get_total_amount(self.test_transaction.id), Decimal(150))
+
+        data["parent_transaction"] = child_id
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(CREATE_TRANSACTION_URL, data, format='json')
+        grandchild_id = response.data["id"]
+        self.assertEqual(self.get_total_amount(child_id), Decimal(100))
+        self.assertEqual(self.get_total_amount(grandchild_id), Decimal(50))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(UPDATE_TRANSACTION_URL.format(transaction_id=grandchild_id), {"amount": 10}, format='json')
+        self.assertEqual(self.get_total_amount(grandchild_id), Decimal(10))
+        self.assertEqual(self.get_total_amount(child_id), Decimal(60))
+        self.assertEqual(self.get_total_amount(self.test_transaction.id), Decimal(160))
+
+    def test_write_during_a_miss(self):
+        """Tests that a transaction read by a miss before a write commits is not served after it, with and without the backend tier."""
+        get_transaction_by_id = TransactionRepository.get_transaction_by_id
+        for cache_settings in (TRANSACTIONS_CACHE, {**TRANSACTIONS_CACHE, "BACKEND": "shared"}):
+            with self.subTest(backend=cache_settings["BACKEND"]), override_settings(TRANSACTIONS_CACHE=cache_settings):
+                TransactionRepository.reset_cache()
+                total_amount = TransactionRepository.get_transaction_by_id(self.test_transaction.id).total_amount
+                writes = []
+
+                def read_then_write(transaction_id, fields=None):
+                    transaction = get_transaction_by_id(transaction_id, fields)
+                    if not writes:
+                        writes.append(transaction_id)
+                        with self.captureOnCommitCallbacks(execute=True):
+                            self.client.patch(UPDATE_TRANSACTION_URL.format(transaction_id=transaction_id), {"amount": transaction.amount + 1}, format='json')
+                    return transaction
+                with mock.patch.object(TransactionRepository, "get_transaction_by_id", side_effect=read_then_write):
+                    self.assertEqual(self.get_total_amount(self.test_transaction.id), total_amount)
+                self.assertEqual(self.get_total_amount(self.test_transaction.id), total_amount + 1)
+
+    @override_settings(TRANSACTIONS_CACHE={**TRANSACTIONS_CACHE, "BACKEND": "shared"})
+    def test_write_of_another_process(self):
+        """Tests that the LRU tier of a process serves a transaction invalidated by another process for LOCAL_TTL seconds at most, without reading the backend."""
+        TransactionRepository.reset_cache()
+        self.assertEqual(self.get_total_amount(self.test_transaction.id), Decimal(100))
+        cache = TransactionRepository.get_cache()
+        # the write is made by a process with its own LRU tier
+        TransactionRepository.reset_cache()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(UPDATE_TRANSACTION_URL.format(transaction_id=self.test_transaction.id), {"amount": 10}, format='json')
+        TransactionRepository._cache = cache
+        with mock.patch.object(caches["shared"], "get", side_effect=AssertionError("read the backend")):
+            self.assertEqual(self.get_total_amount(self.test_transaction.id), Decimal(100))
+        with mock.patch("app.apps.base.cache.time.monotonic", return_value=time.monotonic() + TRANSACTIONS_CACHE["LOCAL_TTL"]):
+            self.assertEqual(self.get_total_amount(self.test_transaction.id), Decimal(10))
+
+    @override_settings(TRANSACTIONS_CACHE={**TRANSACTIONS_CACHE, "BACKEND": "default"})
+    def test_process_local_backend_refused(self):
+        """Tests that the cache refuses a LocMemCache backend, its tokens are not shared by the processes."""
+        with self.assertRaises(ImproperlyConfigured):
+            TransactionRepository.get_cache()
+
+    def test_cache_is_bounded(self):
+        """Tests that the least recently used transactions are evicted."""
+        for amount in range(3):
+            transaction = TransactionRepository.create_transaction(amount=Decimal(amount), total_amount=Decimal(amount), transaction_type='Test transaction')
+            self.get_total_amount(transaction.id)
+        stats = self.client.get(CACHE_STATS_TRANSACTION_URL).data
+        self.assertEqual((stats["local_size"], stats["local_evictions"]), (2, 1))
+
+    def test_retrieve_non_existent_transaction(self):
+        """Tests that invalid and unknown ids are not found."""
+        for transaction_id in ("invalid_id", "0" * 32):
+            response = self.client.get(RETRIEVE_TRANSACTION_URL.format(transaction_id=transaction_id))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
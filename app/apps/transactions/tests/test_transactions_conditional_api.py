@@ -0,0 +1,97 @@
+from decimal import Decimal
+from django.conf import settings
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from app.apps.transactions.services.transaction_service import TransactionService
+from endpoints import BATCH_TRANSACTION_URL, LIST_TRANSACTION_URL, RETRIEVE_TRANSACTION_URL, UPDATE_TRANSACTION_URL
+
+
+class TransactionConditionalAPITestCase(APITestCase):
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
+    def setUp(self):
+        """Set up a root with a child which has a leaf."""
+        self.root = self.create_transaction(Decimal(100))
+        self.child = self.create_transaction(Decimal(10), self.root)
+        self.leaf = self.create_transaction(Decimal(1), self.child)
+
+    def create_transaction(self, amount, parent_transaction=None):
+        """Create a transaction through the service so the ancestors total amounts are updated."""
+        return TransactionService.create_transaction({"amount": amount, "total_amount": amount, "transaction_type": "Food", "parent_transaction": parent_transaction})
+
+    def get_etag(self, transaction, **params):
+        response = self.client.get(RETRIEVE_TRANSACTION_URL.format(transaction_id=transaction.id), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response["ETag"]
+
+    def test_retrieve_not_modified(self):
+        """Tests that a retrieve with the current ETag is answered with 304, and that the ETag depends on the fields."""
+        url = RETRIEVE_TRANSACTION_URL.format(transaction_id=self.root.id)
+        response = self.client.get(url)
+        self.assertTrue(response["ETag"].startswith('W/"'))
+        self.assertIn("Last-Modified", response)
+        not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual((not_modified.content, not_modified["ETag"]), (b"", response["ETag"]))
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertNotEqual(self.get_etag(self.root, fields="total_amount"), response["ETag"])
+
+    def test_propagation_changes_ancestor_etags(self):
+        """Tests that creating, updating and batch updating a descendant change the validators of the ancestors."""
+        etags = [self.get_etag(transaction) for transaction in (self.root, self.child)]
+        self.create_transaction(Decimal(5), self.child)
+        for transaction, etag in zip((self.root, self.child), etags):
+            response = self.client.get(RETRIEVE_TRANSACTION_URL.format(transaction_id=transaction.id), HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        etag = self.get_etag(self.root)
+        self.client.patch(UPDATE_TRANSACTION_URL.format(transaction_id=self.leaf.id), {"amount": 2}, format='json')
+        self.assertNotEqual(self.get_etag(self.root), etag)
+
+        modified_at = TransactionRepository.get_transaction_by_id(self.root.id).modified_at
+        etag = self.get_etag(self.root)
+        response = self.client.patch(BATCH_TRANSACTION_URL, [{"id": str(self.leaf.id), "amount": 3}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(TransactionRepository.get_transaction_by_id(self.root.id).modified_at, modified_at)
+        self.assertNotEqual(self.get_etag(self.root), etag)
+
+    def test_unchanged_total_keeps_etag(self):
+        """Tests that a write which does not change a total amount leaves the ancestors validators alone."""
+        etag = self.get_etag(self.root)
+        self.client.patch(UPDATE_TRANSACTION_URL.format(transaction_id=self.leaf.id), {"transaction_type": "Rent"}, format='json')
+        self.assertEqual(self.get_etag(self.root), etag)
+
+    def test_move_changes_subtree_etags(self):
+        """Tests that moving a subtree changes the validators of its descendants, whose depth changes."""
+        other_root = self.create_transaction(Decimal(50))
+        etag = self.get_etag(self.leaf)
+        self.client.patch(UPDATE_TRANSACTION_URL.format(transaction_id=self.child.id), {"parent_transaction": str(other_root.id)}, format='json')
+        self.assertNotEqual(self.get_etag(self.leaf), etag)
+
+    def test_list_page_not_modified(self):
+        """Tests that an unchanged list page is answered with 304, also by the fast serializer, and a changed one with 200."""
+        response = self.client.get(LIST_TRANSACTION_URL)
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(LIST_TRANSACTION_URL, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+        with override_settings(TRANSACTIONS_FAST_SERIALIZER=True):
+            fast_response = self.client.get(LIST_TRANSACTION_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(fast_response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        cursor_etag = self.client.get(LIST_TRANSACTION_URL, {"pagination": "cursor"})["ETag"]
+        self.assertNotEqual(cursor_etag, etag)
+        self.create_transaction(Decimal(1))
+        self.assertEqual(self.client.get(LIST_TRANSACTION_URL, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(LIST_TRANSACTION_URL, {"pagination": "cursor"}, HTTP_IF_NONE_MATCH=cursor_etag).status_code, status.HTTP_200_OK)
+
+    @override_settings(TRANSACTIONS_TOTAL_AMOUNT_MODE="deferred")
+    def test_deferred_total_amounts(self):
+        """Tests that a pending delta changes the ETag, that folding it does not, and that there is no Last-Modified."""
+        response = self.client.get(RETRIEVE_TRANSACTION_URL.format(transaction_id=self.root.id))
+        self.assertNotIn("Last-Modified", response)
+        self.create_transaction(Decimal(5), self.child)
+        etag = self.get_etag(self.root)
+        self.assertNotEqual(etag, response["ETag"])
+        TransactionService.rollup_total_amount_deltas()
+        self.assertEqual(self.get_etag(self.root), etag)
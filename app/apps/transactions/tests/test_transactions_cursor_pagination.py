@@ -0,0 +1,70 @@
+from decimal import Decimal
+from django.conf import settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from endpoints import ASYNC_LIST_TRANSACTION_URL, LIST_TRANSACTION_URL
+
+
+class TransactionCursorPaginationTestCase(APITestCase):
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
+    def setUp(self):
+        """Set up 25 transactions, every fifth one with a different type."""
+        self.transactions = []
+        for index in range(25):
+            fields = {
+                'amount': Decimal(index),
+                'total_amount': Decimal(index),
+                'transaction_type': 'Rent' if index % 5 == 0 else 'Food',
+            }
+            self.transactions.append(TransactionRepository.create_transaction(**fields))
+        # newest first
+        self.expected_ids = [str(transaction.id) for transaction in sorted(self.transactions, key=lambda t: (t.created_at, t.id), reverse=True)]
+
+    def get_page(self, url):
+        """Get a page and check its shape."""
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        return response.data
+
+    def test_walk_forward_and_backward(self):
+        """Tests that following next and previous links visits every transaction once, in order."""
+        page = self.get_page(LIST_TRANSACTION_URL + '?pagination=cursor&page_size=10&fields=id')
+        self.assertIsNone(page['previous'])
+        pages = [page]
+        while page['next']:
+            page = self.get_page(page['next'])
+            pages.append(page)
+        self.assertEqual([len(page['results']) for page in pages], [10, 10, 5])
+        self.assertEqual([row['id'] for page in pages for row in page['results']], self.expected_ids)
+        self.assertEqual(set(pages[0]['results'][0].keys()), {'id'})
+
+        page = self.get_page(pages[-1]['previous'])
+        self.assertEqual(page['results'], pages[1]['results'])
+        page = self.get_page(page['previous'])
+        self.assertEqual(page['results'], pages[0]['results'])
+        self.assertIsNone(page['previous'])
+
+    def test_cursor_pagination_with_type_filter(self):
+        """Tests that the cursor pagination works together with the transaction_type filter."""
+        page = self.get_page(LIST_TRANSACTION_URL + '?pagination=cursor&page_size=3&transaction_type=Rent')
+        ids = [row['id'] for row in page['results']]
+        page = self.get_page(page['next'])
+        ids += [row['id'] for row in page['results']]
+        self.assertIsNone(page['next'])
+        expected_ids = [transaction_id for transaction_id in self.expected_ids if TransactionRepository.get_transaction_by_id(transaction_id).transaction_type == 'Rent']
+        self.assertEqual(ids, expected_ids)
+
+    def test_invalid_cursor(self):
+        """Tests that an invalid cursor is rejected."""
+        response = self.client.get(LIST_TRANSACTION_URL + '?pagination=cursor&cursor=invalid')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_pagination_can_not_be_disabled(self):
+        """Tests that page_size=0, which disables the page number pagination, is rejected with a cursor."""
+        for url in (LIST_TRANSACTION_URL, ASYNC_LIST_TRANSACTION_URL):
+            response = self.client.get(url + '?pagination=cursor&page_size=0')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('page_size', response.json())
@@ -0,0 +1,56 @@
+from io import StringIO
+from decimal import Decimal
+from django.conf import settings
+from django.core.management import call_command
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from app.apps.transactions.repositories.totalamountdeltarepo import TransactionTotalAmountDeltaRepository
+from endpoints import CREATE_TRANSACTION_URL, LIST_TRANSACTION_URL, RETRIEVE_TRANSACTION_URL, UPDATE_TRANSACTION_URL
+
+
+@override_settings(TRANSACTIONS_TOTAL_AMOUNT_MODE="deferred")
+class DeferredTotalAmountTestCase(APITestCase):
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
+    def setUp(self):
+        """Set up the test."""
+        fields = {
+            'amount': Decimal(100.00),
+            'total_amount': Decimal(100.00),
+            'transaction_type': 'Test transaction'
+        }
+        self.test_transaction = TransactionRepository.create_transaction(**fields)
+
+    def get_total_amount(self, transaction_id):
+        """Get the total amount of a transaction from the API."""
+        url = RETRIEVE_TRANSACTION_URL.format(transaction_id=transaction_id) + '?fields=total_amount'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return Decimal(response.data["total_amount"])
+
+    def test_total_amount_is_exact_before_and_after_rollup(self):
+        """Tests that reads add the pending deltas and that the rollup folds them into total_amount."""
+        data = {"amount": 50, "transaction_type": "Test transaction", "parent_transaction": str(self.test_transaction.id)}
+        response = self.client.post(CREATE_TRANSACTION_URL, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        child_id = response.data["id"]
+        response = self.client.patch(UPDATE_TRANSACTION_URL.format(transaction_id=child_id), {"amount": 70}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Decimal(response.data["total_amount"]), Decimal(70))
+
+        # the stored total amount of the parent is untouched until the rollup
+        self.test_transaction.refresh_from_db()
+        self.assertEqual(self.test_transaction.total_amount, Decimal(100))
+        self.assertEqual(self.get_total_amount(self.test_transaction.id), Decimal(170))
+        self.assertEqual(self.get_total_amount(child_id), Decimal(70))
+        response = self.client.get(LIST_TRANSACTION_URL + '?transaction_type=Test transaction&fields=total_amount')
+        self.assertEqual(sorted(Decimal(row["total_amount"]) for row in response.data["results"]), [Decimal(70), Decimal(170)])
+
+        call_command("rollup_total_amounts", batch_size=1, stdout=StringIO())
+        self.assertEqual(TransactionTotalAmountDeltaRepository.count_deltas(), 0)
+        self.test_transaction.refresh_from_db()
+        self.assertEqual(self.test_transaction.total_amount, Decimal(170))
+        self.assertEqual(self.get_total_amount(self.test_transaction.id), Decimal(170))
+        self.assertEqual(self.get_total_amount(child_id), Decimal(70))
@@ -0,0 +1,56 @@
+import csv
+import io
+import json
+from decimal import Decimal
+from django.conf import settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from endpoints import EXPORT_TRANSACTION_URL, LIST_TRANSACTION_URL
+
+
+class TransactionExportAPITestCase(APITestCase):
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
+    def setUp(self):
+        """Set up transactions of two types."""
+        for index in range(5):
+            fields = {
+                'amount': Decimal(index),
+                'total_amount': Decimal(index),
+                'transaction_type': 'Rent' if index % 2 else 'Food',
+            }
+            TransactionRepository.create_transaction(**fields)
+
+    def export(self, query=''):
+        """Export transactions and return the response and its content."""
+        response = self.client.get(EXPORT_TRANSACTION_URL + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_export_ndjson(self):
+        """Tests that the NDJSON export matches the unpaginated list."""
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        response = self.client.get(LIST_TRANSACTION_URL + '?page_size=0')
+        self.assertEqual(rows, json.loads(response.content))
+
+    def test_export_csv_with_filter_and_fields(self):
+        """Tests the CSV export with the transaction_type filter and the fields projection."""
+        response, content = self.export('?format=csv&transaction_type=Rent&fields=amount,transaction_type')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(rows[0], ['id', 'amount', 'transaction_type'])
+        self.assertEqual(sorted(row[1:] for row in rows[1:]), [['1.00', 'Rent'], ['3.00', 'Rent']])
+
+    def test_export_csv_without_rows(self):
+        """Tests that an empty CSV export still has a header."""
+        _, content = self.export('?format=csv&transaction_type=Unknown&fields=amount')
+        self.assertEqual(content.splitlines(), ['id,amount'])
+
+    def test_export_with_invalid_params(self):
+        """Tests that unknown formats and fields are rejected."""
+        self.assertEqual(self.client.get(EXPORT_TRANSACTION_URL + '?format=xml').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(EXPORT_TRANSACTION_URL + '?fields=invalid').status_code, status.HTTP_400_BAD_REQUEST)
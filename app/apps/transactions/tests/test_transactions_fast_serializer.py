@@ -0,0 +1,44 @@
+from decimal import Decimal
+from django.conf import settings
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+from app.apps.transactions.services.transaction_service import TransactionService
+from endpoints import LIST_TRANSACTION_URL
+
+
+class TransactionFastSerializerTestCase(APITestCase):
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
+    def setUp(self):
+        """Set up a small tree."""
+        self.root = root = TransactionService.create_transaction({"amount": Decimal("10.5"), "total_amount": Decimal("10.5"), "transaction_type": "Food"})
+        for amount in (Decimal(1), Decimal("2.25"), Decimal(3)):
+            TransactionService.create_transaction({"amount": amount, "total_amount": amount, "transaction_type": "Rent", "parent_transaction": root})
+
+    def assert_same_content(self, url):
+        """Check that the fast path renders the same bytes as the serializer."""
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with override_settings(TRANSACTIONS_FAST_SERIALIZER=True):
+            fast_response = self.client.get(url)
+        self.assertEqual(fast_response.content, response.content)
+        return response
+
+    def test_list(self):
+        """Tests the list with all the fields, some fields, a filter and without pagination."""
+        for query in ('', '?fields=total_amount,parent_transaction', '?transaction_type=Rent&page_size=2&page=2', '?page_size=0'):
+            self.assert_same_content(LIST_TRANSACTION_URL + query)
+
+    def test_cursor_pagination(self):
+        """Tests following the keyset pagination links."""
+        url = LIST_TRANSACTION_URL + '?pagination=cursor&page_size=3&fields=amount'
+        while url:
+            url = self.assert_same_content(url).data["next"]
+
+    @override_settings(TRANSACTIONS_TOTAL_AMOUNT_MODE="deferred")
+    def test_pending_total_amounts(self):
+        """Tests that the pending deltas are added to the rows."""
+        TransactionService.create_transaction({"amount": Decimal(4), "total_amount": Decimal(4), "transaction_type": "Rent", "parent_transaction": self.root})
+        self.assertIn('"total_amount":"20.75"', self.assert_same_content(LIST_TRANSACTION_URL + '?fields=total_amount&transaction_type=Food').content.decode())
+        self.assert_same_content(LIST_TRANSACTION_URL + '?fields=total_amount')
@@ -0,0 +1,49 @@
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITestCase
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from endpoints import LIST_TRANSACTION_URL, RETRIEVE_TRANSACTION_URL
+
+
+class TransactionFieldsTestCase(APITestCase):
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
+    def setUp(self):
+        """Set up the test."""
+        self.test_transaction = TransactionRepository.create_transaction(amount=Decimal(10), total_amount=Decimal(10), transaction_type='Food')
+
+    def get_selected_sql(self, url):
+        """Get the select clause of the last query made to answer a request."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        sql = queries.captured_queries[-1]["sql"]
+        return response, sql[:sql.index(" FROM ")]
+
+    def test_list_selects_the_requested_fields(self):
+        """Tests that the list only selects the requested columns, and the keyset ordering columns."""
+        response, select = self.get_selected_sql(LIST_TRANSACTION_URL + '?fields=total_amount')
+        self.assertEqual(response.data["results"], [{"id": str(self.test_transaction.id), "total_amount": "10.00"}])
+        self.assertIn('"total_amount"', select)
+        self.assertNotIn('"amount"', select)
+        self.assertNotIn('"transaction_type"', select)
+        response, select = self.get_selected_sql(LIST_TRANSACTION_URL + '?pagination=cursor&fields=amount')
+        self.assertEqual(response.data["results"], [{"id": str(self.test_transaction.id), "amount": "10.00"}])
+        self.assertIn('"created_at"', select)
+        self.assertNotIn('"total_amount"', select)
+
+    def test_retrieve_selects_the_requested_fields(self):
+        """Tests that retrieve only selects the requested columns."""
+        response, select = self.get_selected_sql(RETRIEVE_TRANSACTION_URL.format(transaction_id=self.test_transaction.id) + '?fields=transaction_type')
+        self.assertEqual(response.data, {"id": str(self.test_transaction.id), "transaction_type": "Food"})
+        self.assertNotIn('"amount"', select)
+
+    def test_unknown_fields_are_rejected(self):
+        """Tests that unknown fields are rejected without reading transactions."""
+        for url in (LIST_TRANSACTION_URL, RETRIEVE_TRANSACTION_URL.format(transaction_id=self.test_transaction.id)):
+            with self.assertNumQueries(0):
+                response = self.client.get(url + '?fields=amount,path')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
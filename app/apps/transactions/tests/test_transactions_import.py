@@ -0,0 +1,159 @@
+import csv
+import datetime
+import os
+import tempfile
+import uuid
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TransactionTestCase
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from app.apps.transactions.services.transaction_type_stats_service import TransactionTypeStatsService
+
+
+class ImportTransactionsTestCase(TransactionTestCase):
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
+    def setUp(self):
+        """Set up an existing chain and an import file whose rows are not ordered parents first."""
+        self.existing_root = TransactionRepository.create_transaction(amount=Decimal(1), total_amount=Decimal(1), transaction_type='Food')
+        self.existing_child = TransactionRepository.create_transaction(amount=Decimal(2), total_amount=Decimal(2), transaction_type='Food', parent_transaction=self.existing_root)
+        self.existing_root.total_amount = Decimal(3)
+        self.existing_root.save()
+
+        self.ids = [uuid.uuid4() for _ in range(4)]
+        self.rows = [
+            # grandchild of ids[0]
+            {"id": self.ids[2], "parent_transaction": self.ids[1], "amount": "5", "transaction_type": "Rent", "created_at": "2020-01-01T10:00:00Z"},
+            {"id": self.ids[1], "parent_transaction": self.ids[0], "amount": "20", "transaction_type": "Rent", "created_at": "2020-01-01T09:00:00Z"},
+            {"id": self.ids[0], "parent_transaction": self.existing_child.id, "amount": "100", "transaction_type": "Rent", "created_at": "2020-01-01T08:00:00Z"},
+            {"id": self.ids[3], "parent_transaction": "", "amount": "7.5", "transaction_type": "Food", "created_at": "2020-01-02T08:00:00Z"},
+        ]
+        file = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, newline="")
+        with file:
+            writer = csv.DictWriter(file, fieldnames=["id", "parent_transaction", "amount", "transaction_type", "created_at"])
+            writer.writeheader()
+            writer.writerows(self.rows)
+        self.path = file.name
+        self.addCleanup(os.remove, self.path)
+
+    def import_transactions(self, *args):
+        """Run the import command."""
+        call_command("import_transactions", self.path, *args, stdout=StringIO())
+
+    def assert_imported(self):
+        """Check the totals and hierarchy fields of the imported and existing transactions."""
+        transactions = TransactionRepository.get_transactions_in_bulk(self.ids)
+        self.assertEqual([transactions[transaction_id].total_amount for transaction_id in self.ids], [Decimal(125), Decimal(25), Decimal(5), Decimal("7.5")])
+        self.assertEqual(transactions[self.ids[2]].depth, 4)
+        self.assertEqual(transactions[self.ids[2]].root_id, self.existing_root.id)
+        self.assertEqual(list(TransactionRepository.get_ancestors(transactions[self.ids[2]])), [self.existing_root, self.existing_child, transactions[self.ids[0]], transactions[self.ids[1]]])
+        self.assertEqual(transactions[self.ids[0]].created_at.isoformat(), "2020-01-01T08:00:00+00:00")
+        self.existing_root.refresh_from_db()
+        self.existing_child.refresh_from_db()
+        self.assertEqual((self.existing_root.total_amount, self.existing_child.total_amount), (Decimal(128), Decimal(127)))
+        self.assertEqual(TransactionTypeStatsService.get_stats("Rent").count, 3)
+
+    def test_import(self):
+        """Tests importing a file in batches."""
+        self.import_transactions("--batch-size", "2")
+        self.assert_imported()
+
+    def test_resume_failed_import(self):
+        """Tests resuming an import which failed after its first batch."""
+        copy_transaction_rows = TransactionRepository.copy_transaction_rows
+        calls = []
+
+        def fail_second_batch(rows):
+            calls.append(rows)
+            if len(calls) == 2:
+                raise RuntimeError("connection lost")
+            return copy_transaction_rows(rows)
+
+        with mock.patch.object(TransactionRepository, "copy_transaction_rows", side_effect=fail_second_batch):
+            with self.assertRaises(RuntimeError):
+                self.import_transactions("--batch-size", "2")
+        self.assertEqual(TransactionRepository.get_all_queryset().count(), 4)
+        self.import_transactions("--batch-size", "2", "--resume")
+        self.assert_imported()
+
+    def write_rows(self):
+        """Write the rows to the import file."""
+        with open(self.path, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=list(self.rows[0]))
+            writer.writeheader()
+            writer.writerows(self.rows)
+
+    def test_resume_import_of_rows_without_id(self):
+        """Tests that a resumed import recognizes the rows without an id which it already loaded."""
+        self.rows[3]["id"] = ""
+        self.write_rows()
+        copy_transaction_rows = TransactionRepository.copy_transaction_rows
+        calls = []
+
+        def fail_after_loading(rows):
+            calls.append(rows)
+            copy_transaction_rows(rows)
+            if len(calls) == 2:
+                raise RuntimeError("connection lost")
+
+        with mock.patch.object(TransactionRepository, "copy_transaction_rows", side_effect=fail_after_loading):
+            with self.assertRaises(RuntimeError):
+                self.import_transactions("--batch-size", "2")
+        self.import_transactions("--batch-size", "2", "--resume")
+        self.import_transactions("--resume")
+        self.assertEqual(TransactionRepository.get_all_queryset().count(), 6)
+        self.assertEqual(TransactionTypeStatsService.get_stats("Food").count, 1)
+
+    def test_resume_import_of_rows_without_created_at(self):
+        """Tests that the rows without created_at get the time of the first run, also when they are loaded by a resumed import."""
+        for row in self.rows:
+            row["created_at"] = ""
+        self.write_rows()
+        copy_transaction_rows = TransactionRepository.copy_transaction_rows
+        calls = []
+
+        def fail_second_batch(rows):
+            calls.append(rows)
+            if len(calls) == 2:
+                raise RuntimeError("connection lost")
+            return copy_transaction_rows(rows)
+
+        first_run = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+        with mock.patch.object(TransactionRepository, "copy_transaction_rows", side_effect=fail_second_batch), mock.patch("django.utils.timezone.now", return_value=first_run):
+            with self.assertRaises(RuntimeError):
+                self.import_transactions("--batch-size", "2")
+        self.import_transactions("--batch-size", "2", "--resume")
+        transactions = TransactionRepository.get_transactions_in_bulk(self.ids)
+        self.assertEqual({transactions[transaction_id].created_at for transaction_id in self.ids}, {first_run})
+
+    def test_import_amount_bounds(self):
+        """Tests that the amounts are limited by the bigint bound of the amount column."""
+        # its own type, the stats and rollups of the type would overflow with another amount
+        self.rows[3].update(amount="92233720368547758.07", transaction_type="Salary")
+        self.write_rows()
+        self.import_transactions()
+        self.assertEqual(TransactionRepository.get_transaction_by_id(self.ids[3]).amount, Decimal("92233720368547758.07"))
+        self.rows[3]["amount"] = "92233720368547758.08"
+        self.write_rows()
+        with self.assertRaisesMessage(CommandError, "amount has to be between 0 and 92233720368547758.07"):
+            self.import_transactions()
+
+    def test_import_rejects_rounded_amounts(self):
+        """Tests that an amount with more than 2 decimal places is rejected rather than rounded."""
+        self.rows[3]["amount"] = "7.555"
+        self.write_rows()
+        with self.assertRaisesMessage(CommandError, "more than 2 decimal places"):
+            self.import_transactions()
+        self.assertEqual(TransactionRepository.get_all_queryset().count(), 2)
+
+    def test_import_with_unknown_parent(self):
+        """Tests that an import referencing an unknown parent is rejected before loading anything."""
+        self.rows[3]["parent_transaction"] = uuid.uuid4()
+        self.write_rows()
+        with self.assertRaises(CommandError):
+            self.import_transactions()
+        self.assertEqual(TransactionRepository.get_all_queryset().count(), 2)
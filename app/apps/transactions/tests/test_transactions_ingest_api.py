@@ -0,0 +1,124 @@
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.conf import settings
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from app.apps.transactions.services.transaction_ingestion_service import TransactionIngestionService
+from app.apps.transactions.services.transaction_service import TransactionService
+from endpoints import INGEST_TRANSACTION_URL, INGEST_STATUS_TRANSACTION_URL
+
+INGESTION = {"ENABLED": True, "BATCH_SIZE": 100, "LINGER": 0, "SYNCHRONOUS_COMMIT": True, "RETENTION": 0}
+
+
+@override_settings(TRANSACTIONS_INGESTION=INGESTION)
+class TransactionIngestAPITestCase(APITestCase):
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
+    def setUp(self):
+        """Set up an existing root transaction."""
+        self.root = TransactionService.create_transaction({"amount": Decimal(100), "total_amount": Decimal(100), "transaction_type": "Food"})
+
+    def ingest(self, amount, parent_transaction=None):
+        data = {"amount": amount, "transaction_type": "Food"}
+        if parent_transaction is not None:
+            data["parent_transaction"] = str(parent_transaction)
+        response = self.client.post(INGEST_TRANSACTION_URL, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        return response.data["id"]
+
+    def get_status(self, transaction_id):
+        response = self.client.get(INGEST_STATUS_TRANSACTION_URL.format(transaction_id=transaction_id))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data["status"]
+
+    def test_ingest_and_drain(self):
+        """Tests that queued transactions are created by a drain, with parents inside and outside the batch."""
+        child_id = self.ingest("10.00", self.root.id)
+        leaf_id = self.ingest("1.50", child_id)
+        other_id = self.ingest("5.00")
+        self.assertEqual(self.get_status(leaf_id), "pending")
+        self.assertFalse(TransactionRepository.get_existing_ids([child_id, leaf_id, other_id]))
+
+        self.assertEqual(TransactionIngestionService.drain_batch(), (3, 0))
+        self.assertEqual([self.get_status(transaction_id) for transaction_id in (child_id, leaf_id, other_id)], ["done"] * 3)
+        self.assertEqual(TransactionRepository.get_transaction_by_id(self.root.id).total_amount, Decimal("111.50"))
+        child = TransactionRepository.get_transaction_by_id(child_id)
+        self.assertEqual((child.parent_transaction_id, child.total_amount), (self.root.id, Decimal("11.50")))
+        leaf = TransactionRepository.get_transaction_by_id(leaf_id)
+        self.assertEqual(leaf.path, f"{self.root.id.hex}/{child.id.hex}/{leaf.id.hex}/")
+        self.assertEqual(TransactionIngestionService.drain_batch(), (0, 0))
+
+    def test_parent_in_a_later_batch(self):
+        """Tests that a child drained after its parent is created under it."""
+        child_id = self.ingest("10.00")
+        leaf_id = self.ingest("2.00", child_id)
+        self.assertEqual(TransactionIngestionService.drain_batch(batch_size=1), (1, 0))
+        self.assertEqual(TransactionIngestionService.get_queue_depth(), 1)
+        self.assertEqual(TransactionIngestionService.drain_batch(batch_size=1), (1, 0))
+        self.assertEqual(TransactionRepository.get_transaction_by_id(child_id).total_amount, Decimal("12.00"))
+        self.assertEqual(TransactionRepository.get_transaction_by_id(leaf_id).depth, 1)
+
+    def test_deleted_parent_fails(self):
+        """Tests that an ingestion fails when its parent disappeared before the drain."""
+        child_id = self.ingest("10.00", self.root.id)
+        TransactionRepository.get_all_queryset().filter(id=self.root.id).delete()
+        self.assertEqual(TransactionIngestionService.drain_batch(), (0, 1))
+        response = self.client.get(INGEST_STATUS_TRANSACTION_URL.format(transaction_id=child_id))
+        self.assertEqual((response.data["status"], response.data["error"]), ("failed", "The parent transaction does not exist."))
+
+    def test_poison_ingestion_fails_alone(self):
+        """Tests that an ingestion which can not be created fails with its error and its children, the rest of the batch is created."""
+        bulk_create_transactions = TransactionService.bulk_create_transactions
+
+        def reject_poison(items):
+            if any(item["amount"] == Decimal("6.66") for item in items):
+                raise ValueError("poison")
+            return bulk_create_transactions(items)
+
+        child_id = self.ingest("10.00", self.root.id)
+        poison_id = self.ingest("6.66", self.root.id)
+        leaf_id = self.ingest("1.00", poison_id)
+        other_id = self.ingest("2.00", child_id)
+        with mock.patch.object(TransactionService, "bulk_create_transactions", side_effect=reject_poison):
+            self.assertEqual(TransactionIngestionService.drain_batch(), (2, 2))
+        self.assertEqual([self.get_status(transaction_id) for transaction_id in (child_id, poison_id, leaf_id, other_id)], ["done", "failed", "failed", "done"])
+        response = self.client.get(INGEST_STATUS_TRANSACTION_URL.format(transaction_id=poison_id))
+        self.assertEqual(response.data["error"], "ValueError: poison")
+        self.assertEqual(TransactionRepository.get_transaction_by_id(self.root.id).total_amount, Decimal("112.00"))
+        self.assertEqual(TransactionRepository.get_transaction_by_id(other_id).depth, 2)
+        self.assertEqual(TransactionIngestionService.drain_batch(), (0, 0))
+
+    def test_invalid_parent(self):
+        """Tests that a parent which is neither a transaction nor queued is rejected."""
+        response = self.client.post(INGEST_TRANSACTION_URL, {"amount": "1.00", "transaction_type": "Food", "parent_transaction": "00000000-0000-0000-0000-000000000000"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("parent_transaction", response.data)
+
+    def test_drain_command(self):
+        """Tests that the command drains the queue and deletes the processed ingestions once idle."""
+        transaction_ids = [self.ingest("1.00", self.root.id) for _ in range(5)]
+        out = StringIO()
+        call_command("drain_ingestion_queue", "--once", "--batch-size", "2", stdout=out)
+        self.assertEqual(TransactionRepository.get_existing_ids(transaction_ids), set(transaction_ids))
+        self.assertEqual(TransactionRepository.get_transaction_by_id(self.root.id).total_amount, Decimal(105))
+        self.assertEqual(TransactionIngestionService.delete_processed(retention=0), 5)
+
+    @override_settings(METRICS_ENABLED=True)
+    def test_queue_metrics(self):
+        """Tests the queue depth and lag gauges."""
+        self.ingest("1.00")
+        lines = self.client.get(reverse('metrics')).content.decode().splitlines()
+        self.assertIn('transactions_ingestion_queue_depth{status="pending"} 1', lines)
+        self.assertIn('transactions_ingestion_queue_depth{status="failed"} 0', lines)
+        self.assertTrue(any(line.startswith("transactions_ingestion_queue_lag_seconds ") for line in lines))
+
+    @override_settings(TRANSACTIONS_INGESTION={**INGESTION, "ENABLED": False})
+    def test_disabled(self):
+        """Tests that the ingest endpoints are not found when the ingestion is disabled."""
+        response = self.client.post(INGEST_TRANSACTION_URL, {"amount": "1.00", "transaction_type": "Food"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,48 @@
+from decimal import Decimal
+from django.conf import settings
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from app.apps.base import metrics
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from endpoints import CREATE_TRANSACTION_URL, LIST_TRANSACTION_URL
+
+
+@override_settings(METRICS_ENABLED=True)
+class TransactionMetricsTestCase(APITestCase):
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
+    def setUp(self):
+        """Set up a chain of two transactions and empty metrics."""
+        metrics.registry.clear()
+        self.root = TransactionRepository.create_transaction(amount=Decimal(1), total_amount=Decimal(1), transaction_type='Food')
+        self.child = TransactionRepository.create_transaction(amount=Decimal(1), total_amount=Decimal(1), transaction_type='Food', parent_transaction=self.root)
+
+    def get_metrics(self):
+        """Get the metrics lines."""
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        return response.content.decode().splitlines()
+
+    def test_request_and_propagation_metrics(self):
+        """Tests the per view request metrics and the total amount propagation metrics."""
+        self.client.post(CREATE_TRANSACTION_URL, {"amount": 2, "transaction_type": "Food", "parent_transaction": str(self.child.id)}, format="json")
+        self.client.get(LIST_TRANSACTION_URL)
+        lines = self.get_metrics()
+        self.assertIn('http_requests_total{view="transactions-list",method="POST",status="201"} 1', lines)
+        self.assertIn('http_requests_total{view="transactions-list",method="GET",status="200"} 1', lines)
+        self.assertIn('http_request_duration_seconds_count{view="transactions-list",method="GET"} 1', lines)
+        self.assertIn('http_request_db_queries_bucket{view="transactions-list",method="GET",le="+Inf"} 1', lines)
+        self.assertIn('transactions_total_amount_propagation_depth_sum{mode="direct"} 2', lines)
+        self.assertIn('transactions_total_amount_propagation_rows_total{mode="direct"} 2', lines)
+        queries = next(line for line in lines if line.startswith('http_request_db_queries_sum{view="transactions-list",method="POST"}'))
+        self.assertGreater(float(queries.split()[-1]), 0)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        """Tests that nothing is recorded or served when the metrics are disabled."""
+        self.client.get(LIST_TRANSACTION_URL)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn("http_requests_total{", metrics.registry.render())
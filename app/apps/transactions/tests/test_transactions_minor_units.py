@@ -0,0 +1,74 @@
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from app.apps.transactions.repositories.transactionrolluprepo import TransactionRollupRepository
+from app.apps.transactions.repositories.transactiontypestatsrepo import TransactionTypeStatsRepository
+from app.apps.transactions.services.total_amount_reconciliation_service import TotalAmountReconciliationService
+from endpoints import CREATE_TRANSACTION_URL, LIST_TRANSACTION_URL, RETRIEVE_TRANSACTION_URL
+
+MAX_AMOUNT = "99999999.99"
+
+
+class TransactionMinorUnitsTestCase(APITestCase):
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
+    def create(self, amount, parent_transaction=None):
+        data = {"amount": amount, "transaction_type": "Food"}
+        if parent_transaction is not None:
+            data["parent_transaction"] = parent_transaction
+        response = self.client.post(CREATE_TRANSACTION_URL, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data
+
+    def get_stored_amounts(self, transaction_id):
+        """Get the raw amount and total amount columns of a transaction."""
+        model = TransactionRepository.get_model()
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT amount, total_amount FROM {model._meta.db_table} WHERE id = %s", [model._meta.pk.get_db_prep_value(transaction_id, connection)])
+            return cursor.fetchone()
+
+    def test_stored_as_minor_units(self):
+        """Tests that the amounts are stored as integer cents and served as decimals."""
+        root = self.create("12.34")
+        self.create("0.29", root["id"])
+        self.assertEqual(self.get_stored_amounts(root["id"]), (1234, 1263))
+        response = self.client.get(RETRIEVE_TRANSACTION_URL.format(transaction_id=root["id"]))
+        self.assertEqual((response.data["amount"], response.data["total_amount"]), ("12.34", "12.63"))
+        self.assertEqual(TransactionRepository.get_subtree_sum(TransactionRepository.get_transaction_by_id(root["id"])), Decimal("12.63"))
+
+    def test_aggregates_stored_as_minor_units(self):
+        """Tests that the type stats and the rollups are stored as integer cents and served as decimals."""
+        root = self.create("12.34")
+        self.create("0.29", root["id"])
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT amount_sum, min_amount, max_amount FROM {TransactionTypeStatsRepository.get_model()._meta.db_table}")
+            self.assertEqual(cursor.fetchall(), [(1263, 29, 1234)])
+            for grain in (TransactionRollupRepository.HOUR, TransactionRollupRepository.DAY):
+                cursor.execute(f"SELECT amount_sum FROM {TransactionRollupRepository.get_model(grain)._meta.db_table}")
+                self.assertEqual(cursor.fetchall(), [(1263,)])
+        stats = TransactionTypeStatsRepository.get_stats_by_type("Food")
+        self.assertEqual((stats.amount_sum, stats.min_amount, stats.max_amount), (Decimal("12.63"), Decimal("0.29"), Decimal("12.34")))
+
+    def test_total_amount_beyond_ten_digits(self):
+        """Tests that the total of children with the largest amount does not overflow."""
+        root = self.create(MAX_AMOUNT)
+        for _ in range(20):
+            self.create(MAX_AMOUNT, root["id"])
+        expected = str(Decimal(MAX_AMOUNT) * 21)
+        response = self.client.get(RETRIEVE_TRANSACTION_URL.format(transaction_id=root["id"]))
+        self.assertEqual(response.data["total_amount"], expected)
+        with override_settings(TRANSACTIONS_FAST_SERIALIZER=True):
+            response = self.client.get(LIST_TRANSACTION_URL, {"fields": "id,total_amount", "page_size": 50})
+        self.assertEqual({row["id"]: row["total_amount"] for row in response.data["results"]}[root["id"]], expected)
+        self.assertEqual(TotalAmountReconciliationService.reconcile()[1], 0)
+
+    def test_more_decimal_places_rejected(self):
+        """Tests that an amount which is not a whole number of cents is not rounded."""
+        field = TransactionRepository.get_model()._meta.get_field("amount")
+        self.assertEqual(field.get_prep_value(Decimal("1.5")), 150)
+        with self.assertRaises(ValueError):
+            field.get_prep_value(Decimal("1.005"))
@@ -0,0 +1,111 @@
+from decimal import Decimal
+from unittest import mock
+from django.conf import settings
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from app.apps.transactions.services.total_amount_reconciliation_service import TotalAmountReconciliationService
+from app.apps.transactions.services.transaction_service import TransactionService
+from endpoints import UPDATE_TRANSACTION_URL
+
+
+class TransactionMoveAPITestCase(APITestCase):
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
+    def setUp(self):
+        """Set up a root with a child which has a leaf, and a second root with a child."""
+        self.root = self.create_transaction(Decimal(100))
+        self.child = self.create_transaction(Decimal(10), self.root)
+        self.leaf = self.create_transaction(Decimal(1), self.child)
+        self.other_root = self.create_transaction(Decimal(50))
+        self.other_child = self.create_transaction(Decimal(5), self.other_root)
+
+    def create_transaction(self, amount, parent_transaction=None):
+        """Create a transaction through the service so the ancestors total amounts are updated."""
+        return TransactionService.create_transaction({"amount": amount, "total_amount": amount, "transaction_type": "Food", "parent_transaction": parent_transaction})
+
+    def move(self, transaction, parent_transaction, **data):
+        """Move a transaction through the update endpoint."""
+        data["parent_transaction"] = str(parent_transaction.id) if parent_transaction is not None else None
+        return self.client.patch(UPDATE_TRANSACTION_URL.format(transaction_id=transaction.id), data, format='json')
+
+    def get_transaction(self, transaction):
+        return TransactionRepository.get_transaction_by_id(transaction.id)
+
+    def test_move_to_other_tree(self):
+        """Tests that the subtree hierarchy is rewritten and the totals are moved between the trees."""
+        response = self.move(self.child, self.other_child)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["parent_transaction"], self.other_child.id)
+        self.assertEqual([self.get_transaction(transaction).total_amount for transaction in (self.root, self.other_root, self.other_child)], [Decimal(100), Decimal(66), Decimal(16)])
+        leaf = self.get_transaction(self.leaf)
+        self.assertEqual((leaf.root_id, leaf.depth), (self.other_root.id, 3))
+        self.assertEqual(leaf.path, f"{self.other_root.id.hex}/{self.other_child.id.hex}/{self.child.id.hex}/{self.leaf.id.hex}/")
+        self.assertEqual(TotalAmountReconciliationService.reconcile()[1], 0)
+
+    def test_move_to_root(self):
+        """Tests that a null parent makes the subtree a tree of its own."""
+        response = self.move(self.child, None, amount=20)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        child, leaf = self.get_transaction(self.child), self.get_transaction(self.leaf)
+        self.assertEqual((child.root_id, child.depth, child.path, child.total_amount), (self.child.id, 0, f"{self.child.id.hex}/", Decimal(21)))
+        self.assertEqual((leaf.root_id, leaf.depth), (self.child.id, 1))
+        self.assertEqual(self.get_transaction(self.root).total_amount, Decimal(100))
+        self.assertEqual(TotalAmountReconciliationService.reconcile()[1], 0)
+
+    def test_move_within_tree(self):
+        """Tests that the shared ancestors keep their total amount when moving inside a tree."""
+        sibling = self.create_transaction(Decimal(3), self.root)
+        response = self.move(self.leaf, sibling)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([self.get_transaction(transaction).total_amount for transaction in (self.root, self.child, sibling)], [Decimal(114), Decimal(10), Decimal(4)])
+        self.assertEqual(TotalAmountReconciliationService.reconcile()[1], 0)
+
+    def test_move_under_descendant(self):
+        """Tests that moving a transaction under itself or its subtree is rejected."""
+        for parent_transaction in (self.child, self.leaf):
+            response = self.move(self.child, parent_transaction)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn("parent_transaction", response.data)
+        self.assertEqual(self.get_transaction(self.leaf).path, self.leaf.path)
+
+    @override_settings(TRANSACTIONS_TOTAL_AMOUNT_MODE="deferred")
+    def test_move_deferred(self):
+        """Tests that the pending deltas of the moved subtree are moved with it."""
+        self.create_transaction(Decimal(4), self.leaf)
+        response = self.move(self.child, self.other_root)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        TransactionService.rollup_total_amount_deltas()
+        self.assertEqual([self.get_transaction(transaction).total_amount for transaction in (self.root, self.other_root, self.child)], [Decimal(100), Decimal(70), Decimal(15)])
+        self.assertEqual(TotalAmountReconciliationService.reconcile()[1], 0)
+
+    def test_opposite_move_validated_before_a_move(self):
+        """Tests that a move checked against paths read before a concurrent move is checked again under the lock."""
+        self.assertEqual(self.move(self.other_root, self.child).status_code, status.HTTP_200_OK)
+        # self.other_child still has the path it had when the second move was validated
+        with self.assertRaises(ValueError):
+            TransactionService.update_transaction(self.get_transaction(self.child), {"parent_transaction": self.other_child})
+        self.assertEqual(self.get_transaction(self.child).path, self.child.path)
+        self.assertEqual(TotalAmountReconciliationService.reconcile()[1], 0)
+
+    def test_create_under_parent_read_before_a_move(self):
+        """Tests that a child gets the path of its parent read under the lock, not the one it was validated with."""
+        self.assertEqual(self.move(self.child, self.other_child).status_code, status.HTTP_200_OK)
+        transaction = self.create_transaction(Decimal(2), self.leaf)
+        self.assertEqual(self.get_transaction(transaction).path, f"{self.other_root.id.hex}/{self.other_child.id.hex}/{self.child.id.hex}/{self.leaf.id.hex}/{transaction.id.hex}/")
+        self.assertEqual(self.get_transaction(self.other_root).total_amount, Decimal(68))
+        self.assertEqual(TotalAmountReconciliationService.reconcile()[1], 0)
+
+    def test_locks(self):
+        """Tests that creates and updates lock the row they write under and not its ancestors, and moves lock the moved subtree and the new parent."""
+        lock_hierarchy = TransactionRepository.lock_hierarchy
+        with mock.patch.object(TransactionRepository, "lock_hierarchy", side_effect=lock_hierarchy) as lock:
+            self.create_transaction(Decimal(2), self.leaf)
+            self.assertEqual(lock.call_args_list[-1], mock.call({self.leaf.id}, shared=True))
+            TransactionService.update_transaction(self.get_transaction(self.leaf), {"amount": Decimal(3)})
+            self.assertEqual(lock.call_args_list[-1], mock.call({self.leaf.id}, shared=True))
+            TransactionService.update_transaction(self.get_transaction(self.child), {"parent_transaction": self.get_transaction(self.other_child)})
+            locked_ids = lock.call_args_list[-1].args[0]
+        self.assertEqual(locked_ids, {*TransactionRepository.get_subtree_ids(self.get_transaction(self.child)), self.other_child.id})
+        self.assertEqual(TotalAmountReconciliationService.reconcile()[1], 0)
@@ -0,0 +1,101 @@
+import unittest
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from app.apps.transactions.models import Transaction
+from app.apps.transactions.repositories.totalamountdeltarepo import TransactionTotalAmountDeltaRepository
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from app.apps.transactions.services.transaction_partition_service import TransactionPartitionService
+from app.apps.transactions.services.transaction_service import TransactionService
+from endpoints import EXPORT_TRANSACTION_URL, LIST_TRANSACTION_URL
+
+
+class TransactionPartitioningTestCase(APITestCase):
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
+    def test_month_ranges(self):
+        """Tests the monthly partition ranges over a year boundary."""
+        ranges = TransactionPartitionService.get_month_ranges(
+            datetime(2025, 11, 20, 13, tzinfo=dt_timezone.utc), datetime(2026, 1, 31, 23, tzinfo=dt_timezone(timedelta(hours=-5)))
+        )
+        self.assertEqual([name for name, _, _ in ranges], [
+            "transactions_transaction_p2025_11", "transactions_transaction_p2025_12", "transactions_transaction_p2026_01", "transactions_transaction_p2026_02",
+        ])
+        self.assertEqual(ranges[1][1:], (datetime(2025, 12, 1, tzinfo=dt_timezone.utc), datetime(2026, 1, 1, tzinfo=dt_timezone.utc)))
+
+    def test_created_at_filters(self):
+        """Tests that the list and the export filter on a created_at range."""
+        old = TransactionRepository.create_transaction(amount=Decimal(1), total_amount=Decimal(1), transaction_type="Food")
+        TransactionRepository.create_transaction(amount=Decimal(2), total_amount=Decimal(2), transaction_type="Food")
+        TransactionRepository.get_all_queryset().filter(id=old.id).update(created_at=datetime(2026, 1, 15, tzinfo=dt_timezone.utc))
+        params = {"created_at__gte": "2026-01-01T00:00:00Z", "created_at__lt": "2026-02-01T00:00:00Z"}
+        response = self.client.get(LIST_TRANSACTION_URL, {**params, "fields": "id", "page_size": 10})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row["id"] for row in response.data["results"]], [str(old.id)])
+        response = self.client.get(EXPORT_TRANSACTION_URL, {**params, "fields": "id"})
+        self.assertEqual(b"".join(response.streaming_content).decode().splitlines(), [f'{{"id":"{old.id}"}}'])
+
+    def test_requires_postgres(self):
+        """Tests that the partition command refuses other databases."""
+        with self.assertRaisesMessage(CommandError, "requires postgres"):
+            call_command("partition_transactions", "--create-ahead")
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "Partitioning requires postgres.")
+class TransactionPartitionedTableTestCase(APITestCase):
+    """The transactions table converted to monthly partitions, the conversion is rolled back after each test."""
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
+    def setUp(self):
+        """Set up a root with a child, then convert the table with no partition ahead of the current month."""
+        self.root = self.create_transaction(Decimal(100))
+        self.child = self.create_transaction(Decimal(10), self.root)
+        self.assertEqual(TransactionPartitionService.convert(months_ahead=0)[1], 2)
+        self.next_month = TransactionPartitionService.add_months(TransactionPartitionService.get_month_start(timezone.now()), 1)
+
+    def create_transaction(self, amount, parent_transaction=None):
+        return TransactionService.create_transaction({"amount": amount, "total_amount": amount, "transaction_type": "Food", "parent_transaction": parent_transaction})
+
+    def get_partition(self, transaction):
+        """Get the name of the partition which holds a transaction."""
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT tableoid::regclass::text FROM {connection.ops.quote_name(Transaction._meta.db_table)} WHERE id = %s", [transaction.id])
+            return cursor.fetchone()[0]
+
+    def test_constraints(self):
+        """Tests that the primary key is (id, created_at) and the indexes of the model are recreated."""
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Transaction._meta.db_table)
+        self.assertEqual([constraint["columns"] for constraint in constraints.values() if constraint["primary_key"]], [["id", "created_at"]])
+        self.assertLessEqual({index.name for index in Transaction._meta.indexes}, set(constraints))
+        self.assertTrue(TransactionPartitionService.get_partitions())
+        # the ids are uuid4, the primary key only rejects a row with the same id and created_at
+        duplicate = Transaction(id=self.child.id, created_at=self.child.created_at, amount=Decimal(1), total_amount=Decimal(1), transaction_type="Food")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Transaction.objects.bulk_create([duplicate])
+
+    def test_next_month(self):
+        """Tests that the partition of the next month is created and holds the rows of the month, read by id and through the parent references."""
+        next_partition = TransactionPartitionService.get_partition_name(self.next_month)
+        self.assertEqual(TransactionPartitionService.create_future_partitions(months_ahead=1), [next_partition])
+        self.assertEqual(TransactionPartitionService.create_future_partitions(months_ahead=1), [])
+        leaf = self.create_transaction(Decimal(1), self.child)
+        TransactionRepository.get_all_queryset().filter(id=leaf.id).update(created_at=self.next_month + timedelta(days=1))
+        self.assertEqual(self.get_partition(leaf), next_partition)
+        self.assertEqual(self.get_partition(self.root), TransactionPartitionService.get_partition_name(TransactionPartitionService.get_month_start(timezone.now())))
+        leaf = TransactionRepository.get_transaction_by_id(leaf.id)
+        self.assertEqual(leaf.parent_transaction.parent_transaction_id, self.root.id)
+        self.assertEqual(TransactionRepository.get_transaction_by_id(self.root.id).total_amount, Decimal(111))
+        self.assertEqual(list(self.child.transaction_set.values_list("id", flat=True)), [leaf.id])
+        TransactionTotalAmountDeltaRepository.append_deltas({leaf.id: Decimal(2)})
+        self.assertEqual(leaf.total_amount_deltas.get().amount, Decimal(2))
+        TransactionService.update_transaction(leaf, {"amount": Decimal(3)})
+        self.assertEqual(TransactionRepository.get_transaction_by_id(self.root.id).total_amount, Decimal(113))
+        self.assertEqual(self.get_partition(leaf), next_partition)
+        TransactionRepository.get_all_queryset().filter(id=self.child.id).delete()
+        self.assertEqual(list(TransactionRepository.get_all_queryset().values_list("id", flat=True)), [self.root.id])
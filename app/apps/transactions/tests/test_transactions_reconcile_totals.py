@@ -0,0 +1,58 @@
+from decimal import Decimal
+from io import StringIO
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from app.apps.transactions.services.total_amount_reconciliation_service import TotalAmountReconciliationService
+from app.apps.transactions.services.transaction_service import TransactionService
+
+
+class ReconcileTotalsTestCase(TestCase):
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
+    def setUp(self):
+        """Set up two trees and corrupt the total amount of a root and a leaf."""
+        root = self.create_transaction(Decimal(10))
+        child = self.create_transaction(Decimal("2.5"), root)
+        grandchild = self.create_transaction(Decimal(1), child)
+        other_root = self.create_transaction(Decimal(7))
+        self.transactions = [root, child, grandchild, other_root]
+        TransactionRepository.get_all_queryset().filter(id=root.id).update(total_amount=Decimal(1))
+        TransactionRepository.get_all_queryset().filter(id=grandchild.id).update(total_amount=Decimal("1.25"))
+
+    def create_transaction(self, amount, parent_transaction=None):
+        """Create a transaction through the service so the ancestors total amounts are updated."""
+        return TransactionService.create_transaction({"amount": amount, "total_amount": amount, "transaction_type": "Food", "parent_transaction": parent_transaction})
+
+    def assert_totals(self, totals):
+        """Check the stored total amounts of the transactions."""
+        transactions = TransactionRepository.get_transactions_in_bulk([transaction.id for transaction in self.transactions])
+        self.assertEqual([transactions[transaction.id].total_amount for transaction in self.transactions], totals)
+
+    def test_report(self):
+        """Tests that the mismatches are reported and left unchanged, with partitions smaller than a tree."""
+        checked, mismatched, mismatches = TotalAmountReconciliationService.reconcile(max_rows=1)
+        self.assertEqual((checked, mismatched), (4, 2))
+        self.assertEqual(
+            sorted((mismatch.transaction_id, mismatch.total_amount, mismatch.expected_total_amount) for mismatch in mismatches),
+            sorted([(self.transactions[0].id, Decimal(1), Decimal("13.5")), (self.transactions[2].id, Decimal("1.25"), Decimal(1))]),
+        )
+        self.assert_totals([Decimal(1), Decimal("3.5"), Decimal("1.25"), Decimal(7)])
+
+    def test_fix_per_partition(self):
+        """Tests that every partition is fixed on its own and only a sample of the mismatches is returned."""
+        TransactionRepository.get_all_queryset().filter(id=self.transactions[3].id).update(total_amount=Decimal(0))
+        # the rows are read with one query, then every tree is fixed in a savepoint of its own
+        with self.assertNumQueries(1 + 2 * 3):
+            checked, mismatched, mismatches = TotalAmountReconciliationService.reconcile(max_rows=1, fix=True, sample_size=1)
+        self.assertEqual((checked, mismatched, len(mismatches)), (4, 3, 1))
+        self.assert_totals([Decimal("13.5"), Decimal("3.5"), Decimal(1), Decimal(7)])
+
+    def test_fix_with_workers(self):
+        """Tests fixing the mismatches with the sums computed by worker processes."""
+        stdout = StringIO()
+        call_command("reconcile_totals", "--fix", "--workers", "2", "--partition-rows", "1", stdout=stdout)
+        self.assertIn("Checked 4 transactions. Fixed 2 mismatched total amounts.", stdout.getvalue())
+        self.assert_totals([Decimal("13.5"), Decimal("3.5"), Decimal(1), Decimal(7)])
+        self.assertEqual(TotalAmountReconciliationService.reconcile()[1], 0)
@@ -0,0 +1,163 @@
+import asyncio
+import time
+import unittest
+from asgiref.sync import async_to_sync
+from decimal import Decimal
+from django.conf import settings
+from django.db import connections
+from django.core.exceptions import MiddlewareNotUsed, SynchronousOnlyOperation
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse
+from unittest import mock
+from rest_framework import status
+from rest_framework.test import APITransactionTestCase
+from app.apps.base import routers
+from app.apps.base.middleware import ReplicaRoutingMiddleware
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from endpoints import CREATE_TRANSACTION_URL, EXPORT_TRANSACTION_URL, LIST_TRANSACTION_URL, RETRIEVE_TRANSACTION_URL
+
+ROUTING = {"REPLICAS": ["replica_1", "replica_2"], "STICKINESS": 10, "MAX_LAG": 5, "LAG_CHECK_INTERVAL": 60}
+REPLICAS = [alias for alias in settings.DATABASES if alias.startswith("replica_")]
+
+
+@override_settings(DATABASE_ROUTING=ROUTING)
+class ReplicaRoutingTestCase(SimpleTestCase):
+    """Routing decisions, without querying the replicas."""
+
+    def setUp(self):
+        routers.lag_monitor.clear()
+        for alias in ROUTING["REPLICAS"]:
+            routers.lag_monitor.set_lag(alias, 0)
+        self.router = routers.PrimaryReplicaRouter()
+        self.model = TransactionRepository.get_model()
+        self.middleware = ReplicaRoutingMiddleware(self.get_response)
+        self.factory = RequestFactory()
+
+    def get_response(self, request):
+        """Respond with the alias the reads of the request are routed to."""
+        return HttpResponse(self.router.db_for_read(self.model))
+
+    def test_router(self):
+        """Tests that the reads go to the primary unless a replica is chosen, and that the writes always go to the primary."""
+        self.assertEqual(self.router.db_for_read(self.model), "default")
+        with routers.read_from("replica_1"):
+            self.assertEqual(self.router.db_for_read(self.model), "replica_1")
+            self.assertEqual(self.router.db_for_write(self.model), "default")
+            with routers.read_from_primary():
+                self.assertEqual(self.router.db_for_read(self.model), "default")
+        self.assertFalse(self.router.allow_migrate("replica_1", "transactions"))
+        self.assertIsNone(self.router.allow_migrate("default", "transactions"))
+
+    def test_reads_go_to_replicas(self):
+        """Tests that read only requests are routed to a replica and writes to the primary, which pins the client."""
+        response = self.middleware(self.factory.get("/"))
+        self.assertIn(response.content.decode(), ROUTING["REPLICAS"])
+        response = self.middleware(self.factory.post("/"))
+        self.assertEqual(response.content, b"default")
+        self.assertEqual(response.cookies[ReplicaRoutingMiddleware.COOKIE_NAME]["max-age"], 10)
+        request = self.factory.get("/")
+        request.COOKIES[ReplicaRoutingMiddleware.COOKIE_NAME] = response.cookies[ReplicaRoutingMiddleware.COOKIE_NAME].value
+        self.assertEqual(self.middleware(request).content, b"default")
+        request = self.factory.get("/")
+        request.COOKIES[ReplicaRoutingMiddleware.COOKIE_NAME] = "1"
+        self.assertIn(self.middleware(request).content.decode(), ROUTING["REPLICAS"])
+
+    def test_lagging_replicas_skipped(self):
+        """Tests that replicas lagging more than MAX_LAG are skipped, and that the primary serves the reads when all lag."""
+        routers.lag_monitor.set_lag("replica_1", 30)
+        self.assertEqual({self.middleware(self.factory.get("/")).content for _ in range(20)}, {b"replica_2"})
+        routers.lag_monitor.set_lag("replica_2", float("inf"))
+        self.assertEqual(self.middleware(self.factory.get("/")).content, b"default")
+
+    def test_header_pins_to_primary(self):
+        """Tests that a client without cookies is pinned to the primary by sending back the header of its write."""
+        response = self.middleware(self.factory.post("/"))
+        pinned_until = response[ReplicaRoutingMiddleware.HEADER_NAME]
+        self.assertAlmostEqual(float(pinned_until.split(":")[0]), time.time() + 10, delta=2)
+        self.assertEqual(self.middleware(self.factory.get("/", headers={ReplicaRoutingMiddleware.HEADER_NAME: pinned_until})).content, b"default")
+        signer = self.middleware.signer
+        for ignored in (
+            str(int(time.time()) + 3600), "invalid", pinned_until.replace(pinned_until.split(":")[0], str(int(time.time()) + 3600), 1),
+            signer.sign(str(int(time.time()) - 1)),
+        ):
+            response = self.middleware(self.factory.get("/", headers={ReplicaRoutingMiddleware.HEADER_NAME: ignored}))
+            self.assertIn(response.content.decode(), ROUTING["REPLICAS"])
+        # a signed time beyond the stickiness is capped at the stickiness after the signature
+        pinned_until = signer.sign(str(int(time.time()) + 3600))
+        self.assertEqual(self.middleware(self.factory.get("/", headers={ReplicaRoutingMiddleware.HEADER_NAME: pinned_until})).content, b"default")
+        with mock.patch("time.time", return_value=time.time() + 11):
+            response = self.middleware(self.factory.get("/", headers={ReplicaRoutingMiddleware.HEADER_NAME: pinned_until}))
+        self.assertIn(response.content.decode(), ROUTING["REPLICAS"])
+
+    def test_async_lag_check(self):
+        """Tests that the async middleware queries the lags out of the event loop."""
+
+        def query_lag(alias):
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return 0.0
+            raise SynchronousOnlyOperation("The lag is queried from the event loop.")
+
+        async def get_response(request):
+            return self.get_response(request)
+
+        routers.lag_monitor.clear()
+        with mock.patch.object(routers.lag_monitor, "query_lag", side_effect=query_lag) as query:
+            response = async_to_sync(ReplicaRoutingMiddleware(get_response))(self.factory.get("/"))
+        self.assertIn(response.content.decode(), ROUTING["REPLICAS"])
+        self.assertEqual(query.call_count, 2)
+
+    @override_settings(DATABASE_ROUTING={**ROUTING, "REPLICAS": []})
+    def test_no_replicas(self):
+        """Tests that the middleware is not used without replicas."""
+        with self.assertRaises(MiddlewareNotUsed):
+            ReplicaRoutingMiddleware(self.get_response)
+
+
+@unittest.skipUnless(REPLICAS, "No replica is configured, set DB_REPLICA_HOSTS.")
+@override_settings(DATABASE_ROUTING={**ROUTING, "REPLICAS": REPLICAS[:1]})
+class ReplicaRoutingAPITestCase(APITransactionTestCase):
+    """The endpoints with a replica alias, which mirrors the primary in the tests.
+
+    The replica has its own connection, so the data is committed for it to see it.
+    """
+    databases = {"default", *REPLICAS}
+
+    def setUp(self):
+        routers.lag_monitor.set_lag(REPLICAS[0], 0)
+
+    def capture(self, method, url, **kwargs):
+        """Request an endpoint and get its response and the number of queries of the primary and the replica."""
+        with CaptureQueriesContext(connections["default"]) as primary, CaptureQueriesContext(connections[REPLICAS[0]]) as replica:
+            response = getattr(self.client, method)(url, **kwargs)
+            if response.streaming:
+                b"".join(response.streaming_content)
+        return response, len(primary), len(replica)
+
+    def test_read_your_writes(self):
+        """Tests that the reads hit the replica, except for a client which just wrote."""
+        response, primary, replica = self.capture("post", CREATE_TRANSACTION_URL, data={"amount": "10.00", "transaction_type": "Food"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+        transaction_id = response.data["id"]
+
+        response, primary, replica = self.capture("get", RETRIEVE_TRANSACTION_URL.format(transaction_id=transaction_id))
+        self.assertEqual((response.status_code, primary, replica), (status.HTTP_200_OK, 1, 0))
+
+        self.client.cookies.clear()
+        response, primary, replica = self.capture("get", RETRIEVE_TRANSACTION_URL.format(transaction_id=transaction_id))
+        self.assertEqual(response.data["amount"], "10.00")
+        self.assertEqual((primary, replica), (0, 1))
+        response, primary, replica = self.capture("get", LIST_TRANSACTION_URL)
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_export_streams_from_replica(self):
+        """Tests that the rows of a streaming response are read from the replica."""
+        TransactionRepository.create_transaction(amount=Decimal(1), total_amount=Decimal(1), transaction_type="Food")
+        response, primary, replica = self.capture("get", EXPORT_TRANSACTION_URL)
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
@@ -0,0 +1,51 @@
+from decimal import Decimal
+from django.conf import settings
+from django.test import TestCase
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+
+
+class TransactionRepositoryTestCase(TestCase):
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
+    def setUp(self):
+        """Set up a tree of transactions: root -> child -> grandchild and root -> sibling."""
+        self.root = self.create_transaction(100)
+        self.child = self.create_transaction(20, self.root)
+        self.grandchild = self.create_transaction(3, self.child)
+        self.sibling = self.create_transaction(40, self.root)
+
+    def create_transaction(self, amount, parent_transaction=None):
+        """Create a transaction with the repository."""
+        fields = {
+            'amount': Decimal(amount),
+            'total_amount': Decimal(amount),
+            'transaction_type': 'Test transaction',
+            'parent_transaction': parent_transaction,
+        }
+        return TransactionRepository.create_transaction(**fields)
+
+    def test_hierarchy_fields(self):
+        """Tests that path, depth and root_id are maintained on creation."""
+        self.assertEqual(self.root.depth, 0)
+        self.assertEqual(self.grandchild.depth, 2)
+        self.assertEqual(self.grandchild.root_id, self.root.id)
+        self.assertTrue(self.grandchild.path.startswith(self.child.path))
+
+    def test_get_ancestors(self):
+        """Tests getting the ancestors of a transaction, root first."""
+        with self.assertNumQueries(1):
+            ancestors = list(TransactionRepository.get_ancestors(self.grandchild))
+        self.assertEqual(ancestors, [self.root, self.child])
+        self.assertEqual(list(TransactionRepository.get_ancestors(self.root)), [])
+
+    def test_get_descendants(self):
+        """Tests getting the descendants of a transaction."""
+        descendants = set(TransactionRepository.get_descendants(self.root))
+        self.assertEqual(descendants, {self.child, self.grandchild, self.sibling})
+        self.assertEqual(list(TransactionRepository.get_descendants(self.child)), [self.grandchild])
+
+    def test_get_subtree_sum(self):
+        """Tests summing the amounts of a subtree."""
+        with self.assertNumQueries(1):
+            self.assertEqual(TransactionRepository.get_subtree_sum(self.root), Decimal(163))
+        self.assertEqual(TransactionRepository.get_subtree_sum(self.child), Decimal(23))
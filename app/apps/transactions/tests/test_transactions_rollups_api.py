@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TransactionTestCase
+from rest_framework import status
+from rest_framework.test import APITestCase
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from app.apps.transactions.services.transaction_rollup_service import TransactionRollupService
+from app.apps.transactions.services.transaction_service import TransactionService
+from endpoints import BATCH_TRANSACTION_URL, ROLLUPS_TRANSACTION_URL, UPDATE_TRANSACTION_URL
+
+START = datetime(2026, 3, 1, tzinfo=dt_timezone.utc)
+
+
+def create_transaction(amount, transaction_type, created_at=None):
+    """Create a transaction through the service, moving its creation time without updating the rollups."""
+    transaction = TransactionService.create_transaction({"amount": amount, "total_amount": amount, "transaction_type": transaction_type})
+    if created_at is not None:
+        TransactionRepository.get_all_queryset().filter(id=transaction.id).update(created_at=created_at)
+    return transaction
+
+
+def get_rollups(grain, start, end):
+    """Get the rollups of a window as (bucket start, type, count, amount sum) tuples."""
+    return [
+        (rollup["bucket_start"], rollup["transaction_type"], rollup["count"], rollup["amount_sum"])
+        for rollup in TransactionRollupService.get_rollups(grain, start, end)
+    ]
+
+
+class TransactionRollupsAPITestCase(APITestCase):
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
+    def get(self, **params):
+        return self.client.get(ROLLUPS_TRANSACTION_URL, params)
+
+    def test_incremental_rollups(self):
+        """Tests that creates and amount or type changes are added to the current hour and day."""
+        food = create_transaction(Decimal(10), "Food")
+        create_transaction(Decimal(5), "Food")
+        rent = create_transaction(Decimal(100), "Rent")
+        response = self.client.patch(UPDATE_TRANSACTION_URL.format(transaction_id=food.id), {"amount": 12}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.patch(BATCH_TRANSACTION_URL, [{"id": str(rent.id), "transaction_type": "Food"}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        for grain in ("hour", "day"):
+            response = self.get(grain=grain)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            bucket_start = TransactionRollupService.get_bucket_start(grain, food.created_at)
+            self.assertEqual(
+                [(row["bucket_start"], row["transaction_type"], row["count"], row["amount_sum"]) for row in response.data],
+                [(bucket_start.isoformat().replace("+00:00", "Z"), "Food", 3, "117.00")],
+            )
+
+    def test_filters(self):
+        """Tests the range and the transaction type filters."""
+        create_transaction(Decimal(1), "Food")
+        create_transaction(Decimal(2), "Rent")
+        create_transaction(Decimal(3), "Travel")
+        response = self.get(transaction_type="Food,Travel")
+        self.assertEqual([row["transaction_type"] for row in response.data], ["Food", "Travel"])
+        end = datetime.now(dt_timezone.utc) - timedelta(days=2)
+        response = self.get(start=(end - timedelta(days=1)).isoformat(), end=end.isoformat())
+        self.assertEqual(response.data, [])
+
+    def test_invalid_query(self):
+        """Tests that unknown grains and empty ranges are rejected."""
+        self.assertEqual(self.get(grain="minute").status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.get(start="2026-03-02T00:00:00Z", end="2026-03-01T00:00:00Z")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("end", response.data)
+
+    def test_rebuild(self):
+        """Tests that a rebuild recomputes the rollups of the window and leaves the others."""
+        create_transaction(Decimal(1), "Food", START + timedelta(hours=1, minutes=30))
+        create_transaction(Decimal(2), "Food", START + timedelta(hours=1, minutes=45))
+        create_transaction(Decimal(4), "Rent", START + timedelta(days=1, hours=23))
+        create_transaction(Decimal(8), "Food", START + timedelta(days=5))
+        stdout = StringIO()
+        call_command("rebuild_transaction_rollups", "--start", "2026-03-01T00:00:00", "--end", "2026-03-03T00:00:00", "--workers", "1", stdout=stdout)
+        self.assertIn("Rebuilt 4 rollups from 3 transactions", stdout.getvalue())
+        self.assertEqual(get_rollups("hour", START, START + timedelta(days=2)), [
+            (START + timedelta(hours=1), "Food", 2, Decimal(3)),
+            (START + timedelta(days=1, hours=23), "Rent", 1, Decimal(4)),
+        ])
+        self.assertEqual(get_rollups("day", START, START + timedelta(days=2)), [
+            (START, "Food", 2, Decimal(3)),
+            (START + timedelta(days=1), "Rent", 1, Decimal(4)),
+        ])
+        # the transactions were rolled up at their original creation time, which is outside of the window
+        self.assertEqual([rollup[1:] for rollup in get_rollups("day", START + timedelta(days=2), datetime.now(dt_timezone.utc) + timedelta(days=1))], [
+            ("Food", 3, Decimal(11)),
+            ("Rent", 1, Decimal(4)),
+        ])
+
+
+class TransactionRollupsParallelRebuildTestCase(TransactionTestCase):
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
+    def test_parallel_rebuild(self):
+        """Tests that a rebuild with several workers matches the rows of an in process one."""
+        for day in range(6):
+            create_transaction(Decimal(day + 1), "Food" if day % 2 else "Rent", START + timedelta(days=day, hours=day))
+        self.assertEqual(TransactionRollupService.rebuild_rollups(START, START + timedelta(days=6), workers=3, chunk_days=1), (6, 12))
+        parallel_rollups = get_rollups("hour", START, START + timedelta(days=6)), get_rollups("day", START, START + timedelta(days=6))
+        TransactionRollupService.rebuild_rollups(START, START + timedelta(days=6), workers=1, chunk_days=4)
+        self.assertEqual((get_rollups("hour", START, START + timedelta(days=6)), get_rollups("day", START, START + timedelta(days=6))), parallel_rollups)
+        self.assertEqual(len(parallel_rollups[0]), 6)
@@ -0,0 +1,219 @@
+import json
+import unittest
+import uuid
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.conf import settings
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APITransactionTestCase
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from app.apps.transactions.repositories.transactionshardrepo import TransactionShardRepository
+from app.apps.transactions.routers import TransactionShardRouter, use_shard
+from app.apps.transactions.services.total_amount_reconciliation_service import TotalAmountReconciliationService
+from app.apps.transactions.services.transaction_service import TransactionService
+from app.apps.transactions.services.transaction_shard_service import ShardedQuerySet, TransactionShardService, TreeMovedError
+from endpoints import ASYNC_LIST_TRANSACTION_URL, ASYNC_RETRIEVE_TRANSACTION_URL, BATCH_TRANSACTION_URL, CREATE_TRANSACTION_URL, EXPORT_TRANSACTION_URL, LIST_TRANSACTION_URL, RETRIEVE_TRANSACTION_URL, TREE_TRANSACTION_URL, UPDATE_TRANSACTION_URL
+
+SHARDS = settings.TRANSACTIONS_SHARDING["SHARDS"]
+SHARDING = {**settings.TRANSACTIONS_SHARDING, "SHARDS": ["default", "shard_1"]}
+
+
+def make_id(shard_index):
+    """Make a transaction id placed on the shard of the given position when it is a root."""
+    while True:
+        transaction_id = uuid.uuid4()
+        if transaction_id.int % len(SHARDS) == shard_index:
+            return transaction_id
+
+
+@override_settings(TRANSACTIONS_SHARDING=SHARDING)
+class TransactionShardRoutingTestCase(SimpleTestCase):
+    """Routing and merging decisions, without querying the shards."""
+
+    def setUp(self):
+        self.router = TransactionShardRouter()
+        self.model = TransactionRepository.get_model()
+
+    def test_router(self):
+        """Tests that the transactions go to the current shard or to the shard of the instance, and the other models to the next router."""
+        self.assertIsNone(self.router.db_for_read(self.model))
+        with use_shard("shard_1"):
+            self.assertEqual(self.router.db_for_read(self.model), "shard_1")
+            self.assertEqual(self.router.db_for_write(self.model), "shard_1")
+            self.assertIsNone(self.router.db_for_write(TransactionShardRepository.get_model()))
+        instance = self.model()
+        instance._state.db = "shard_1"
+        self.assertEqual(self.router.db_for_read(self.model, instance=instance), "shard_1")
+        other = self.model()
+        other._state.db = "default"
+        self.assertFalse(self.router.allow_relation(instance, other))
+
+    def test_placement(self):
+        """Tests that new roots are placed by their id and children with their parent."""
+        root_id = uuid.UUID(int=3)
+        self.assertEqual(TransactionShardService.get_shard_for_new_transaction(root_id), "shard_1")
+        self.assertEqual(TransactionShardService.get_shard_for_new_transaction(uuid.UUID(int=4)), "default")
+        parent = self.model(id=root_id)
+        parent._state.db = "default"
+        self.assertEqual(TransactionShardService.get_shard_for_new_transaction(uuid.UUID(int=5), parent), "default")
+
+    def test_merge(self):
+        """Tests that the rows of the shards are merged in the order of the queryset, nulls last."""
+        queryset = ShardedQuerySet(TransactionRepository.get_all_queryset().order_by("amount", "id"), SHARDS, values_fields=("id",))
+        rows = [[{"id": 1, "amount": 1}, {"id": 3, "amount": None}], [{"id": 2, "amount": 2}]]
+        self.assertEqual(list(queryset.merge(rows, ["amount"])), [{"id": 1}, {"id": 2}, {"id": 3}])
+        with self.assertRaises(ValueError):
+            ShardedQuerySet(TransactionRepository.get_all_queryset().order_by("-created_at", "id"), SHARDS).get_ordering()
+
+
+@unittest.skipUnless(len(SHARDS) > 1, "The transactions are not sharded, set DB_SHARDS.")
+class TransactionShardingTestCase(APITransactionTestCase):
+    """The endpoints with the transactions spread over the shards.
+
+    The shards are queried from worker threads, so the data is committed for them to see it.
+    """
+    databases = set(SHARDS)
+
+    def setUp(self):
+        TransactionShardRepository.reset_cache()
+
+    def create_root(self, shard_index, amount="10.00"):
+        """Create a root transaction on the shard of the given position."""
+        return TransactionService.create_transaction({"id": make_id(shard_index), "amount": Decimal(amount), "total_amount": Decimal(amount), "transaction_type": "Food"})
+
+    def create_child(self, parent_id, amount="5.00"):
+        response = self.client.post(CREATE_TRANSACTION_URL, {"amount": amount, "transaction_type": "Food", "parent_transaction": str(parent_id)}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data
+
+    def get_stored_ids(self, alias):
+        return set(TransactionRepository.get_all_queryset().using(alias).values_list("id", flat=True))
+
+    def test_trees_stay_on_their_shard(self):
+        """Tests that children are created, read and updated on the shard of their root, which the directory records by root."""
+        root = self.create_root(1)
+        child = self.create_child(root.id)
+        grandchild = self.create_child(child["id"], "1.00")
+        self.assertEqual(self.get_stored_ids(SHARDS[1]), {root.id, uuid.UUID(child["id"]), uuid.UUID(grandchild["id"])})
+        self.assertEqual(list(TransactionShardRepository.get_model().objects.values_list("root_id", flat=True)), [root.id])
+
+        TransactionShardRepository.reset_cache()
+        response = self.client.get(RETRIEVE_TRANSACTION_URL.format(transaction_id=root.id))
+        self.assertEqual(response.data["total_amount"], "16.00")
+        response = self.client.patch(UPDATE_TRANSACTION_URL.format(transaction_id=grandchild["id"]), {"amount": "2.00"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(TREE_TRANSACTION_URL.format(transaction_id=root.id))
+        self.assertEqual(len(b"".join(response.streaming_content).decode().splitlines()), 3)
+        self.assertEqual(TransactionRepository.get_transaction_by_id(root.id).total_amount, Decimal("17.00"))
+
+    def test_move_across_shards_rejected(self):
+        """Tests that a transaction can not be moved under a parent of another shard."""
+        root, other_root = self.create_root(1), self.create_root(0)
+        response = self.client.patch(UPDATE_TRANSACTION_URL.format(transaction_id=root.id), {"parent_transaction": str(other_root.id)}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("parent_transaction", response.data)
+
+    def test_batch_spread_over_shards(self):
+        """Tests that a batch creates its trees on their shards, in the order of the items."""
+        roots = [self.create_root(0), self.create_root(1)]
+        items = [{"temp_id": "a", "amount": "1.00", "transaction_type": "Food"}, {"temp_id": "b", "parent_temp_id": "a", "amount": "2.00", "transaction_type": "Food"}]
+        items += [{"amount": "3.00", "transaction_type": "Food", "parent_transaction": str(root.id)} for root in roots]
+        response = self.client.post(BATCH_TRANSACTION_URL, items, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([row["amount"] for row in response.data], ["1.00", "2.00", "3.00", "3.00"])
+        self.assertIn(uuid.UUID(response.data[3]["id"]), self.get_stored_ids(SHARDS[1]))
+        self.assertEqual([TransactionRepository.get_transaction_by_id(root.id).total_amount for root in roots], [Decimal("13.00")] * 2)
+        self.assertEqual(TotalAmountReconciliationService.reconcile()[1], 0)
+
+    def test_list_merges_shards(self):
+        """Tests that the list and the export read every shard and merge them in order."""
+        created = [self.create_root(index % 2, f"{index}.00") for index in range(1, 8)]
+        expected = [str(transaction.id) for transaction in reversed(created)]
+        response = self.client.get(LIST_TRANSACTION_URL, {"page_size": 3, "page": 2})
+        self.assertEqual(response.data["count"], 7)
+        self.assertEqual([row["id"] for row in response.data["results"]], expected[3:6])
+        amounts, url = [], LIST_TRANSACTION_URL + "?pagination=cursor&page_size=3&fields=amount"
+        while url:
+            response = self.client.get(url)
+            amounts += [row["amount"] for row in response.data["results"]]
+            url = response.data["next"]
+        self.assertEqual(amounts, [f"{index}.00" for index in range(7, 0, -1)])
+        with override_settings(TRANSACTIONS_FAST_SERIALIZER=True):
+            response = self.client.get(LIST_TRANSACTION_URL, {"fields": "id", "ordering": "amount"})
+        self.assertEqual([row["id"] for row in response.data["results"]], expected[::-1])
+        response = self.client.get(LIST_TRANSACTION_URL, {"ordering": "-amount,id"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(EXPORT_TRANSACTION_URL, {"fields": "amount"})
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row["id"] for row in rows], expected)
+
+    def test_move_tree(self):
+        """Tests that a tree is moved to another shard with its ids, amounts and timestamps, and is found there."""
+        root = self.create_root(0)
+        child = self.create_child(root.id)
+        before = TransactionRepository.get_transaction_by_id(child["id"])
+        stdout = StringIO()
+        call_command("rebalance_transaction_shards", "--move", str(root.id), "--to", SHARDS[1], "--wait", "0", stdout=stdout)
+        self.assertIn("Moved 2 transactions", stdout.getvalue())
+        self.assertEqual(self.get_stored_ids(SHARDS[0]), set())
+        self.assertEqual(self.get_stored_ids(SHARDS[1]), {root.id, before.id})
+        TransactionShardRepository.reset_cache()
+        after = TransactionRepository.get_transaction_by_id(child["id"])
+        self.assertEqual((after.modified_at, after.total_amount, after.path), (before.modified_at, before.total_amount, before.path))
+        self.create_child(child["id"], "1.00")
+        response = self.client.get(RETRIEVE_TRANSACTION_URL.format(transaction_id=root.id))
+        self.assertEqual(response.data["total_amount"], "16.00")
+
+        call_command("rebalance_transaction_shards", "--move", str(root.id), "--to", SHARDS[0], "--wait", "0", stdout=stdout)
+        self.assertEqual(TransactionShardRepository.get_model().objects.count(), 0)
+        self.assertEqual(TransactionShardService.count_transactions_by_shard(), {SHARDS[0]: 3, SHARDS[1]: 0})
+
+    def test_stale_writes_during_move(self):
+        """Tests that the writes routed to the previous shard of a moved tree by a stale directory cache are rejected and can be retried."""
+        root = self.create_root(0)
+        child = self.create_child(root.id)
+        stale_parent = TransactionRepository.get_transaction_by_id(child["id"])
+
+        def write_through_stale_cache(seconds):
+            TransactionShardRepository.get_cache().set(stale_parent.id.hex, 0)
+            response = self.client.patch(UPDATE_TRANSACTION_URL.format(transaction_id=child["id"]), {"amount": "6.00"}, format="json")
+            self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+            with self.assertRaises(TreeMovedError):
+                TransactionService.create_transaction({"amount": Decimal("1.00"), "total_amount": Decimal("1.00"), "transaction_type": "Food", "parent_transaction": stale_parent})
+            # the rejected write dropped the stale cache
+            response = self.client.patch(UPDATE_TRANSACTION_URL.format(transaction_id=child["id"]), {"amount": "6.00"}, format="json")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with mock.patch("app.apps.transactions.services.transaction_shard_service.time.sleep", side_effect=write_through_stale_cache):
+            self.assertEqual(TransactionShardService.move_tree(root.id, SHARDS[1]), 2)
+        self.assertEqual(self.get_stored_ids(SHARDS[0]), set())
+        self.assertEqual(TransactionRepository.get_transaction_by_id(root.id).total_amount, Decimal("16.00"))
+
+    def test_rebalance(self):
+        """Tests that the planned moves even out the shards."""
+        root = self.create_root(0)
+        for _ in range(3):
+            self.create_child(root.id)
+        self.create_root(0)
+        self.assertEqual(TransactionShardService.plan_rebalance(), [(root.id, 4, SHARDS[0], SHARDS[1])])
+
+    @override_settings(TRANSACTIONS_TOTAL_AMOUNT_MODE="deferred")
+    def test_deferred_total_amounts(self):
+        """Tests that the pending deltas are appended on the shard of the tree and rolled up there."""
+        root = self.create_root(1)
+        self.create_child(root.id)
+        response = self.client.get(RETRIEVE_TRANSACTION_URL.format(transaction_id=root.id))
+        self.assertEqual(response.data["total_amount"], "15.00")
+        self.assertEqual(TransactionService.rollup_total_amount_deltas(), 1)
+        self.assertEqual(TransactionRepository.get_transaction_by_id(root.id).total_amount, Decimal("15.00"))
+
+    def test_async_list(self):
+        """Tests that the async list reads every shard."""
+        created = [self.create_root(index) for index in range(len(SHARDS))]
+        response = self.client.get(ASYNC_LIST_TRANSACTION_URL, {"fields": "id"})
+        self.assertEqual(response.json()["count"], len(created))
+        response = self.client.get(ASYNC_RETRIEVE_TRANSACTION_URL.format(transaction_id=created[-1].id))
+        self.assertEqual(response.json()["amount"], "10.00")
@@ -0,0 +1,63 @@
+import json
+from decimal import Decimal
+from django.conf import settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from endpoints import TREE_TRANSACTION_URL, RETRIEVE_TRANSACTION_URL
+
+
+class TransactionTreeAPITestCase(APITestCase):
+    databases = set(settings.TRANSACTIONS_SHARDING["SHARDS"])
+
+    def setUp(self):
+        """Set up a tree of transactions: root -> child -> grandchild, root -> sibling and an unrelated root."""
+        self.root = self.create_transaction(100)
+        self.child = self.create_transaction(20, self.root)
+        self.grandchild = self.create_transaction(3, self.child)
+        self.sibling = self.create_transaction(40, self.root)
+        self.other_root = self.create_transaction(1)
+
+    def create_transaction(self, amount, parent_transaction=None):
+        """Create a transaction with the repository."""
+        fields = {
+            'amount': Decimal(amount),
+            'total_amount': Decimal(amount),
+            'transaction_type': 'Test transaction',
+            'parent_transaction': parent_transaction,
+        }
+        return TransactionRepository.create_transaction(**fields)
+
+    def get_tree(self, transaction, query=''):
+        """Get the streamed tree of a transaction as a list of dicts."""
+        response = self.client.get(TREE_TRANSACTION_URL.format(transaction_id=transaction.id) + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        content = b''.join(response.streaming_content).decode()
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_tree_streams_subtree_parents_first(self):
+        """Tests that the tree contains the transaction and its descendants, every parent before its children."""
+        rows = self.get_tree(self.root)
+        self.assertEqual({row['id'] for row in rows}, {str(t.id) for t in (self.root, self.child, self.grandchild, self.sibling)})
+        self.assertEqual(rows[0]['id'], str(self.root.id))
+        positions = {row['id']: index for index, row in enumerate(rows)}
+        for row in rows[1:]:
+            self.assertLess(positions[row['parent_transaction']], positions[row['id']])
+        # rows have the same representation as retrieve
+        response = self.client.get(RETRIEVE_TRANSACTION_URL.format(transaction_id=self.grandchild.id))
+        self.assertEqual(json.loads(response.content), next(row for row in rows if row['id'] == str(self.grandchild.id)))
+
+    def test_tree_with_max_depth_and_fields(self):
+        """Tests limiting the depth and projecting the fields of the tree."""
+        rows = self.get_tree(self.root, '?max_depth=1&fields=total_amount')
+        self.assertEqual({row['id'] for row in rows}, {str(t.id) for t in (self.root, self.child, self.sibling)})
+        self.assertTrue(all(set(row) == {'id', 'total_amount'} for row in rows))
+        self.assertEqual(len(self.get_tree(self.grandchild, '?max_depth=0')), 1)
+
+    def test_tree_with_invalid_params(self):
+        """Tests that invalid fields and depths are rejected."""
+        for query in ('?fields=invalid', '?max_depth=-1', '?max_depth=a'):
+            response = self.client.get(TREE_TRANSACTION_URL.format(transaction_id=self.root.id) + query)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
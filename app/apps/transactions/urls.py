@@ -1,7 +1,14 @@
+from django.urls import path
+from django.views.decorators.csrf import csrf_exempt
+from app.apps.transactions.async_views import AsyncTransactionListView, AsyncTransactionDetailView
 from app.apps.transactions.views import TransactionViewSet
 from rest_framework.routers import DefaultRouter
 
 router = DefaultRouter()
 router.register(r'transactions', TransactionViewSet, basename='transactions')
 
-urlpatterns = router.urls
\ No newline at end of file
+# async views for the ASGI deployment, DRF views are csrf exempt as well
+urlpatterns = [
+    path('async/transactions/', csrf_exempt(AsyncTransactionListView.as_view()), name='async-transactions-list'),
+    path('async/transactions/<str:transaction_id>/', AsyncTransactionDetailView.as_view(), name='async-transactions-detail'),
+] + router.urls
@@ -1,3 +1,13 @@
+import csv
+import datetime
+import decimal
+import hashlib
+import io
+import json
+import uuid
+from itertools import islice
+
+
 def filter_response_fields(model, request):
     """Checks if request params has fields key and returns an array of fields.
     """
@@ -8,4 +18,138 @@ def filter_response_fields(model, request):
         fields = request.GET["fields"].split(",")
         fields = list(compulsory_fields.union(set(fields)))
         
-    return fields
\ No newline at end of file
+    return fields
+
+def topological_order(keys, parent_keys):
+    """Returns the indexes of the items ordered so that every item comes after its parent.
+
+    Args:
+        keys (list): The key of every item, None if the item can not be referenced.
+        parent_keys (list): The key of the parent of every item, None or a key which is not part of keys for roots.
+
+    Raises:
+        ValueError: If the parent references contain a cycle.
+    """
+    key_set = {key for key in keys if key is not None}
+    children = {}
+    roots = []
+    for index, parent_key in enumerate(parent_keys):
+        if parent_key is not None and parent_key in key_set:
+            children.setdefault(parent_key, []).append(index)
+        else:
+            # items whose parent is not part of the batch are the roots
+            roots.append(index)
+
+    order = []
+    stack = roots
+    while stack:
+        index = stack.pop()
+        order.append(index)
+        if keys[index] is not None:
+            stack.extend(children.get(keys[index], ()))
+    if len(order) != len(keys):
+        raise ValueError("The parent references contain a cycle.")
+    return order
+
+
+def to_representation(value):
+    """Renders a decimal, uuid or datetime the same way as the transaction serializers."""
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat()
+        return value[:-6] + "Z" if value.endswith("+00:00") else value
+    return value
+
+
+class TransactionJSONEncoder(json.JSONEncoder):
+    """JSON encoder which renders values the same way as the transaction serializers."""
+
+    def default(self, value):
+        representation = to_representation(value)
+        if representation is value:
+            return super().default(value)
+        return representation
+
+
+def compute_etag(rows, fields, *extra):
+    """Computes a weak ETag of the representation of rows, without rendering them.
+
+    A transaction changes its modified_at whenever it or its total amount changes, except for the
+    pending deltas of the deferred total amount mode, so the total amount is hashed as well when it
+    is part of the representation.
+
+    Args:
+        rows (list): Transactions, or rows read with values(), with their id and modified_at and the requested fields.
+        fields (list): The requested fields, None for all of them.
+        extra: Other parts of the representation, such as the pagination links.
+    """
+    with_total_amount = fields is None or "total_amount" in fields
+    digest = hashlib.sha1(json.dumps([fields, *extra], cls=TransactionJSONEncoder).encode())
+    for row in rows:
+        get = row.__getitem__ if isinstance(row, dict) else row.__getattribute__
+        digest.update(f"{get('id')}|{get('modified_at').isoformat()}|{get('total_amount') if with_total_amount else ''}\n".encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def iterate_in_chunks(iterable, chunk_size):
+    """Yields lists of at most chunk_size items of the iterable."""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, chunk_size)):
+        yield chunk
+
+
+def to_ndjson(chunks):
+    """Yields one newline delimited JSON document per chunk of rows."""
+    encoder = TransactionJSONEncoder(separators=(",", ":"), ensure_ascii=False)
+    for chunk in chunks:
+        yield "".join(encoder.encode(row) + "\n" for row in chunk)
+
+
+def to_csv(chunks, fields):
+    """Yields a CSV header and then one CSV document per chunk of rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for chunk in chunks:
+        writer.writerows([to_representation(row[field]) for field in fields] for row in chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # the header when there are no rows
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def compute_subtree_sums(parent_indexes, depths, amounts):
+    """Computes the subtree sum of every node of a forest stored as arrays.
+
+    Args:
+        parent_indexes (array): Index of the parent of every node, -1 for roots.
+        depths (array): Depth of every node.
+        amounts (array): Integer amount of every node.
+
+    Returns:
+        array: The sum of the amounts of every node and all its descendants.
+    """
+    sums = type(amounts)(amounts.typecode, amounts)
+    # children are deeper than their parents, so visiting the deepest nodes first completes every sum before it is pushed up
+    for index in sorted(range(len(depths)), key=depths.__getitem__, reverse=True):
+        parent_index = parent_indexes[index]
+        if parent_index >= 0:
+            sums[parent_index] += sums[index]
+    return sums
+
+
+def find_total_mismatches(partition):
+    """Finds the nodes of a partition whose total differs from their subtree sum.
+
+    Args:
+        partition (tuple): (parent_indexes, depths, amounts, totals) arrays of a set of whole trees.
+
+    Returns:
+        list: (index, subtree sum) of every mismatched node.
+    """
+    parent_indexes, depths, amounts, totals = partition
+    sums = compute_subtree_sums(parent_indexes, depths, amounts)
+    return [(index, subtree_sum) for index, (subtree_sum, total) in enumerate(zip(sums, totals)) if subtree_sum != total]
@@ -1,12 +1,53 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.http import Http404, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework import viewsets, filters
+from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, ValidationError as APIValidationError
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from app.apps.transactions.serializers import TransactionCreateSerializer, TransactionUpdateSerializer, TransactionReadSerializer
+from app.apps.transactions.serializers import TransactionCreateSerializer, TransactionBatchCreateSerializer, TransactionBatchUpdateSerializer, TransactionUpdateSerializer, TransactionReadSerializer, TransactionRowSerializer, TransactionTypeStatsSerializer, TransactionRollupQuerySerializer, TransactionRollupSerializer, TransactionIngestSerializer, TransactionIngestionSerializer
 from app.apps.transactions.services.transaction_service import TransactionService
+from app.apps.transactions.services.transaction_type_stats_service import TransactionTypeStatsService
+from app.apps.transactions.services.transaction_rollup_service import TransactionRollupService
+from app.apps.transactions.services.transaction_ingestion_service import TransactionIngestionService
+from app.apps.transactions.services.transaction_shard_service import TransactionShardService, TreeMovedError
 from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+from app.apps.transactions.repositories.transactionshardrepo import TransactionShardRepository
 from app.apps.transactions.filters import TransactionFilter
-from app.apps.transactions.utils import filter_response_fields
-from app.apps.base.pagination import StandardResultsSetPagination
+from app.apps.transactions.utils import compute_etag, filter_response_fields, to_csv, to_ndjson
+from app.apps.transactions.renderers import CSVRenderer, NDJSONRenderer
+from app.apps.base.pagination import StandardResultsSetPagination, KeysetCursorPagination
+
+
+def get_requested_fields(request):
+    """Get the fields requested with ?fields= in serializer order, None if none are requested."""
+    fields = filter_response_fields(model=TransactionRepository.get_model(),request=request)
+    if fields is None:
+        return None
+    read_fields = list(TransactionReadSerializer().fields)
+    unknown_fields = set(fields) - set(read_fields)
+    if unknown_fields:
+        raise APIValidationError({"fields": [f"Unknown fields: {', '.join(sorted(unknown_fields))}."]})
+    return [field for field in read_fields if field in fields]
+
+
+def is_pagination_disabled(request, paginator):
+    """Check if the pagination is disabled with ?page_size=0, the keyset pagination can not be disabled."""
+    if int(request.query_params.get("page_size", 1) or 1):
+        return False
+    if isinstance(paginator, KeysetCursorPagination):
+        raise APIValidationError({"page_size": ["The cursor pagination requires a page_size greater than 0."]})
+    return True
+
+
+class TreeMoved(APIException):
+    """A write routed to the shard its tree was moved from, see TransactionShardService.move_tree."""
+    status_code = 409
+    default_detail = "The transaction tree was moved to another shard, retry the request."
+    default_code = "tree_moved"
 
 
 class TransactionViewSet(viewsets.ModelViewSet):
@@ -15,15 +56,46 @@ class TransactionViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_class = TransactionFilter
     pagination_class = StandardResultsSetPagination
+    # stable default ordering, it matches the keyset pagination ordering
+    ordering = KeysetCursorPagination.ordering
+    # columns read in addition to the requested fields to compute the ETag and Last-Modified of responses,
+    # transaction_list_cov_idx includes them
+    VALIDATOR_FIELDS = ("id", "modified_at")
+
+    @property
+    def paginator(self):
+        """Use keyset pagination when it is requested with ?pagination=cursor."""
+        if not hasattr(self, "_paginator") and self.request.query_params.get("pagination") == "cursor":
+            self._paginator = KeysetCursorPagination()
+        return super().paginator
 
     def get_serializer_class(self):
         """Return serializer based on action."""
         if self.action == "create":
             return TransactionCreateSerializer
+        if self.action == "batch":
+            return TransactionBatchUpdateSerializer if self.request.method == "PATCH" else TransactionBatchCreateSerializer
         if self.action == "partial_update":
             return TransactionUpdateSerializer
         if self.action == "retrieve" or self.action == "list":
             return TransactionReadSerializer
+        if self.action == "stats":
+            return TransactionTypeStatsSerializer
+        if self.action == "rollups":
+            return TransactionRollupSerializer
+        if self.action == "ingest":
+            return TransactionIngestSerializer
+        if self.action == "ingestion":
+            return TransactionIngestionSerializer
+
+    def handle_exception(self, exc):
+        """Respond with a conflict to the writes on a moved tree, their retry reads the directory again."""
+        return super().handle_exception(TreeMoved() if isinstance(exc, TreeMovedError) else exc)
+
+    def apply_pending_total_amounts(self, transactions, fields):
+        """Add the pending total amount deltas if the total amount is part of the response."""
+        if fields is None or "total_amount" in fields:
+            TransactionService.apply_pending_total_amounts(transactions)
 
     def create(self, request, *args, **kwargs):
         """Create a new transaction."""
@@ -34,37 +106,225 @@ class TransactionViewSet(viewsets.ModelViewSet):
         data = TransactionReadSerializer(transaction).data
         return Response(data, status=201)
     
+    @action(detail=False, methods=["post", "patch"], url_path="batch")
+    def batch(self, request, *args, **kwargs):
+        """Create a batch of transactions, or update one with PATCH."""
+        if request.method == "PATCH":
+            return self.batch_update(request)
+        serializer = self.get_serializer(data=request.data, many=True, allow_empty=False, max_length=settings.TRANSACTIONS_BATCH_MAX_SIZE)
+        serializer.is_valid(raise_exception=True)
+        transactions = TransactionService.bulk_create_transactions(serializer.validated_data)
+        data = TransactionReadSerializer(transactions, many=True).data
+        return Response(data, status=201)
+
+    def batch_update(self, request):
+        """Update a batch of transactions, reporting how many transactions and other ancestors were updated."""
+        serializer = self.get_serializer(data=request.data, many=True, allow_empty=False, max_length=settings.TRANSACTIONS_BATCH_MAX_SIZE)
+        serializer.is_valid(raise_exception=True)
+        transactions, updated, ancestors_updated = TransactionService.bulk_update_transactions(serializer.validated_data)
+        TransactionService.apply_pending_total_amounts(transactions)
+        data = {
+            "updated": updated,
+            "ancestors_updated": ancestors_updated,
+            "results": TransactionReadSerializer(transactions, many=True).data,
+        }
+        return Response(data, status=200)
+
+    @action(detail=False, methods=["get"], url_path="stats")
+    def stats(self, request, *args, **kwargs):
+        """Get the count, sum, min and max amount of a transaction type, or of all types."""
+        transaction_type = request.query_params.get("transaction_type")
+        if transaction_type:
+            data = self.get_serializer(TransactionTypeStatsService.get_stats(transaction_type)).data
+        else:
+            data = self.get_serializer(TransactionTypeStatsService.get_all_stats(), many=True).data
+        return Response(data, status=200)
+
+    @action(detail=False, methods=["get"], url_path="rollups")
+    def rollups(self, request, *args, **kwargs):
+        """Get the count and amount sum per type and hour or day, read from the rollup tables."""
+        query = TransactionRollupQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        rollups = TransactionRollupService.get_rollups(params["grain"], params.get("start"), params.get("end"), params.get("transaction_type"))
+        return Response(self.get_serializer(rollups, many=True).data, status=200)
+
+    @action(detail=False, methods=["post"], url_path="ingest")
+    def ingest(self, request, *args, **kwargs):
+        """Queue a transaction, it is created later by the drain_ingestion_queue worker."""
+        if not TransactionIngestionService.is_enabled():
+            raise Http404
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ingestion = TransactionIngestionService.ingest(serializer.validated_data)
+        return Response({"id": ingestion.transaction_id, "status": ingestion.status}, status=202)
+
+    @action(detail=False, methods=["get"], url_path=r"ingest/(?P<ingestion_id>[^/.]+)")
+    def ingestion(self, request, ingestion_id=None, *args, **kwargs):
+        """Get the status of a queued transaction."""
+        if not TransactionIngestionService.is_enabled():
+            raise Http404
+        try:
+            ingestion = TransactionIngestionService.get_ingestion(ingestion_id)
+        except (TransactionIngestionService.get_model().DoesNotExist, ValidationError):
+            raise Http404
+        return Response(self.get_serializer(ingestion).data, status=200)
+
     def partial_update(self, request, *args, **kwargs):
         """Update a transaction."""
         instance = self.get_object()
         serializer = self.get_serializer(data=request.data, context={"instance": instance}, partial=True)
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
-        transaction = TransactionService.update_transaction(instance, data)
+        try:
+            transaction = TransactionService.update_transaction(instance, data)
+        except ValueError as error:
+            raise APIValidationError({"parent_transaction": [str(error)]})
+        TransactionService.apply_pending_total_amounts([transaction])
         data = TransactionReadSerializer(transaction).data
         return Response(data, status=200)
     
+    def get_object(self):
+        """Get the transaction of the request from the shard of its tree."""
+        with TransactionShardRepository.use_shard_of(self.kwargs[self.lookup_field]):
+            return super().get_object()
+
+    def fan_out(self, queryset):
+        """Read the filtered transactions from every shard, rejecting the orderings which can not be merged."""
+        try:
+            return TransactionShardService.fan_out(queryset)
+        except ValueError as error:
+            raise APIValidationError({"ordering": [str(error)]})
+
+    def get_cached_object(self, fields=None):
+        """Get the transaction of the request through the transaction cache."""
+        try:
+            instance = TransactionRepository.get_cached_transaction_by_id(self.kwargs[self.lookup_field], fields)
+        except (TransactionRepository.get_model().DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, instance)
+        return instance
+
+    def get_requested_fields(self):
+        """Get the requested fields in serializer order, None if none are requested."""
+        return get_requested_fields(self.request)
+
+    def get_stream_fields(self):
+        """Get the requested fields in serializer order, all the read fields if none are requested."""
+        return self.get_requested_fields() or list(TransactionReadSerializer().fields)
+
+    def project_queryset(self, queryset, fields):
+        """Only select the columns of the requested fields, and the columns the paginator orders by."""
+        if fields is None:
+            return queryset
+        ordering_fields = [field.lstrip("-") for field in getattr(self.paginator, "ordering", ())]
+        return queryset.only(*fields, *ordering_fields, *self.VALIDATOR_FIELDS)
+
+    def get_validators(self, rows, fields, *extra):
+        """Get the ETag and the Last-Modified timestamp of the representation of rows.
+
+        There is no Last-Modified in the deferred total amount mode, a pending delta changes a total
+        amount without changing the modified_at of the transaction.
+        """
+        etag = compute_etag(rows, fields, *extra)
+        last_modified = None
+        if rows and not TransactionService.is_total_amount_deferred():
+            get = (lambda row: row["modified_at"]) if isinstance(rows[0], dict) else (lambda row: row.modified_at)
+            last_modified = int(max(get(row) for row in rows).timestamp())
+        return etag, last_modified
+
+    def get_paginated_validators(self, rows, fields):
+        """Get the validators of a page, the count and links of the page are part of its representation."""
+        envelope = self.paginator.get_paginated_response([]).data
+        return self.get_validators(rows, fields, {key: value for key, value in envelope.items() if key != "results"})
+
+    def conditional_response(self, validators, get_response):
+        """Answer 304 Not Modified if the client has the current representation, otherwise get and return it with the validators."""
+        etag, last_modified = validators
+        response = get_conditional_response(self.request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = get_response()
+        response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        return response
+
+    @action(detail=True, methods=["get"], url_path="tree")
+    def tree(self, request, *args, **kwargs):
+        """Stream a transaction and all its descendants as newline delimited JSON, parents first."""
+        instance = self.get_object()
+        fields = self.get_stream_fields()
+        max_depth = request.query_params.get("max_depth")
+        if max_depth is not None:
+            if not max_depth.isdigit():
+                raise APIValidationError({"max_depth": ["A non negative integer is required."]})
+            max_depth = int(max_depth)
+        chunks = TransactionService.iterate_subtree(instance, fields, max_depth=max_depth, chunk_size=settings.TRANSACTIONS_STREAM_CHUNK_SIZE)
+        return StreamingHttpResponse(to_ndjson(chunks), content_type="application/x-ndjson")
+
+    @action(detail=False, methods=["get"], url_path="export", renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request, *args, **kwargs):
+        """Stream all the filtered transactions as newline delimited JSON or, with ?format=csv, as CSV."""
+        queryset = self.fan_out(self.filter_queryset(self.get_queryset()))
+        fields = self.get_stream_fields()
+        chunks = TransactionService.iterate_rows(queryset, fields, chunk_size=settings.TRANSACTIONS_STREAM_CHUNK_SIZE)
+        if request.accepted_renderer.format == CSVRenderer.format:
+            response = StreamingHttpResponse(to_csv(chunks, fields), content_type=CSVRenderer.media_type)
+            response["Content-Disposition"] = 'attachment; filename="transactions.csv"'
+            return response
+        return StreamingHttpResponse(to_ndjson(chunks), content_type=NDJSONRenderer.media_type)
+
+    @action(detail=False, methods=["get"], url_path="cache-stats")
+    def cache_stats(self, request, *args, **kwargs):
+        """Get the hit, miss and eviction counters of the transaction cache."""
+        return Response(TransactionRepository.get_cache_stats(), status=200)
+
     def retrieve(self, request, *args, **kwargs):
         """Retrieve a transaction."""
-        instance = self.get_object()
-        fields = filter_response_fields(model=TransactionRepository.get_model(),request=request)
-        data = self.get_serializer(instance, fields=fields).data
-        return Response(data, status=200)
+        fields = self.get_requested_fields()
+        instance = self.get_cached_object([*fields, *self.VALIDATOR_FIELDS] if fields else None)
+        self.apply_pending_total_amounts([instance], fields)
+        return self.conditional_response(
+            self.get_validators([instance], fields),
+            lambda: Response(self.get_serializer(instance, fields=fields).data, status=200),
+        )
     
     def list(self, request, *args, **kwargs):
         """List all transactions."""
-        queryset = self.filter_queryset(self.get_queryset())
-        fields = filter_response_fields(model=TransactionRepository.get_model(),request=request)
-        # pagination
-        paginate = int(request.query_params.get("page_size", 1) or 1)
-        if not paginate:
-            self._paginator = None
-        page = self.paginate_queryset(queryset)
+        fields = self.get_requested_fields()
+        if settings.TRANSACTIONS_FAST_SERIALIZER:
+            return self.list_rows(fields)
+        queryset = self.project_queryset(self.fan_out(self.filter_queryset(self.get_queryset())), fields)
+        page = self.get_page(queryset)
         if page is not None:
-            data = self.get_serializer(page, many=True, fields=fields).data
-            return self.get_paginated_response(data)
+            self.apply_pending_total_amounts(page, fields)
+            return self.conditional_response(
+                self.get_paginated_validators(page, fields),
+                lambda: self.get_paginated_response(self.get_serializer(page, many=True, fields=fields).data),
+            )
         # no pagination
+        self.apply_pending_total_amounts(queryset, fields)
         data = self.get_serializer(queryset, many=True, fields=fields).data
         return Response(data, status=200)
 
+    def get_page(self, queryset):
+        """Paginate the queryset, None when the pagination is disabled with ?page_size=0."""
+        if is_pagination_disabled(self.request, self.paginator):
+            self._paginator = None
+        return self.paginate_queryset(queryset)
 
+    def list_rows(self, fields):
+        """List transactions read with values() and rendered by the fast path serializer."""
+        serializer = TransactionRowSerializer(fields)
+        ordering_columns = [field.lstrip("-") for field in getattr(self.paginator, "ordering", ())]
+        queryset = self.fan_out(self.filter_queryset(self.get_queryset())).values(*serializer.columns, *ordering_columns, *self.VALIDATOR_FIELDS)
+        page = self.get_page(queryset)
+        rows = list(page if page is not None else queryset)
+        if "total_amount" in serializer.fields:
+            TransactionService.apply_pending_total_amounts_to_rows(rows)
+        if page is not None:
+            return self.conditional_response(
+                self.get_paginated_validators(rows, fields),
+                lambda: self.get_paginated_response(serializer.many_to_representation(rows)),
+            )
+        return Response(serializer.many_to_representation(rows), status=200)
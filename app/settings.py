@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -47,6 +47,8 @@ DJANGO_APPS = [
 INSTALLED_APPS = DJANGO_APPS + LIBS + APPS
 
 MIDDLEWARE = [
+    'app.apps.base.middleware.MetricsMiddleware',
+    'app.apps.base.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -102,6 +104,41 @@ DATABASES = {
     }
 }
 
+# read replicas, an alias replica_<n> per host of DB_REPLICA_HOSTS with the credentials of default,
+# in the tests they mirror default
+for index, host in enumerate(config("DB_REPLICA_HOSTS", default="", cast=Csv()), start=1):
+    DATABASES[f"replica_{index}"] = {**DATABASES["default"], "HOST": host, "TEST": {"MIRROR": "default"}}
+
+# transaction shards, an alias shard_<n> per host/name of DB_SHARDS with the credentials of default, the name
+# defaults to DB_NAME. Shards can only be appended, the shard directory stores their position
+for index, shard in enumerate(config("DB_SHARDS", default="", cast=Csv()), start=1):
+    host, _, name = shard.partition("/")
+    DATABASES[f"shard_{index}"] = {**DATABASES["default"], "HOST": host, "NAME": name or DATABASES["default"]["NAME"]}
+
+DATABASE_ROUTERS = ["app.apps.transactions.routers.TransactionShardRouter", "app.apps.base.routers.PrimaryReplicaRouter"]
+
+# the reads of read only requests go to a replica, a client which wrote is pinned to the primary for STICKINESS seconds
+# to read its own writes, replicas lagging more than MAX_LAG seconds are skipped (0 disables the check), keep
+# STICKINESS above MAX_LAG, LAG_CHECK_INTERVAL is how often a process queries the lag of a replica
+DATABASE_ROUTING = {
+    "REPLICAS": [alias for alias in DATABASES if alias.startswith("replica_")],
+    "STICKINESS": config("DB_REPLICA_STICKINESS", default=10, cast=float),
+    "MAX_LAG": config("DB_REPLICA_MAX_LAG", default=5, cast=float),
+    "LAG_CHECK_INTERVAL": config("DB_REPLICA_LAG_CHECK_INTERVAL", default=1, cast=float),
+}
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/ref/settings/#caches
+
+# CACHE_BACKEND is a django cache backend such as django.core.cache.backends.redis.RedisCache, with CACHE_LOCATION
+# redis://<host>:6379, the default LocMemCache is per process
+CACHES = {
+    "default": {
+        "BACKEND": config("CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache", cast=str),
+        "LOCATION": config("CACHE_LOCATION", default="", cast=str),
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -143,4 +180,59 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-BASE_URL = config("BASE_URL", default="http://127.0.0.1:8000/transactions/api/v1", cast=str)
\ No newline at end of file
+BASE_URL = config("BASE_URL", default="http://127.0.0.1:8000/transactions/api/v1", cast=str)
+
+# Metrics
+
+# per request latency, SQL query count and SQL time, and the transaction service counters, served at /metrics
+METRICS_ENABLED = config("METRICS_ENABLED", default=False, cast=bool)
+
+# Transactions
+
+# maximum number of transactions accepted by the batch endpoint
+TRANSACTIONS_BATCH_MAX_SIZE = config("TRANSACTIONS_BATCH_MAX_SIZE", default=10000, cast=int)
+
+# "direct" increments the total amount of ancestors in place, "deferred" appends pending deltas
+# which are folded into the total amounts by the rollup_total_amounts management command
+TRANSACTIONS_TOTAL_AMOUNT_MODE = config("TRANSACTIONS_TOTAL_AMOUNT_MODE", default="direct", cast=str)
+
+# read-through cache of retrieved transactions, an in-process LRU tier in front of a django cache backend tier,
+# the generation tokens invalidating the cached transactions are kept in the backend, which has to be shared by the
+# worker processes, the cache refuses to start on a LocMemCache backend. Every process keeps the tokens it read for
+# LOCAL_TTL seconds, how long it can serve a transaction another process wrote. Without a backend tier the tokens
+# are kept by the process, which is only correct with a single worker process
+TRANSACTIONS_CACHE = {
+    "ENABLED": config("TRANSACTIONS_CACHE_ENABLED", default=False, cast=bool),
+    "LOCAL_MAX_SIZE": config("TRANSACTIONS_CACHE_LOCAL_MAX_SIZE", default=10000, cast=int),
+    "LOCAL_TTL": config("TRANSACTIONS_CACHE_LOCAL_TTL", default=5, cast=float),
+    # alias of settings.CACHES, empty to disable the backend tier
+    "BACKEND": config("TRANSACTIONS_CACHE_BACKEND", default="default", cast=str),
+    "BACKEND_TTL": config("TRANSACTIONS_CACHE_BACKEND_TTL", default=300, cast=int),
+}
+
+# number of rows fetched from the database at a time by the streaming endpoints
+TRANSACTIONS_STREAM_CHUNK_SIZE = config("TRANSACTIONS_STREAM_CHUNK_SIZE", default=2000, cast=int)
+
+# asynchronous creation through POST /transactions/ingest/, the ingestions are queued in a table and created in
+# batches of BATCH_SIZE by the drain_ingestion_queue command, which waits up to LINGER seconds for a batch to fill,
+# without SYNCHRONOUS_COMMIT the ingest commit does not wait for the WAL flush on postgres, RETENTION is in seconds
+TRANSACTIONS_INGESTION = {
+    "ENABLED": config("TRANSACTIONS_INGESTION_ENABLED", default=False, cast=bool),
+    "BATCH_SIZE": config("TRANSACTIONS_INGESTION_BATCH_SIZE", default=500, cast=int),
+    "LINGER": config("TRANSACTIONS_INGESTION_LINGER", default=0.05, cast=float),
+    "SYNCHRONOUS_COMMIT": config("TRANSACTIONS_INGESTION_SYNCHRONOUS_COMMIT", default=True, cast=bool),
+    "RETENTION": config("TRANSACTIONS_INGESTION_RETENTION", default=86400, cast=int),
+}
+
+# every tree of transactions lives on one shard, default first, sharding is enabled by a second shard. The
+# shard of the transactions which are not on default is looked up in a directory on default, cached for
+# DIRECTORY_CACHE_TTL seconds per process, FAN_OUT_WORKERS is the number of shards queried in parallel by lists
+TRANSACTIONS_SHARDING = {
+    "SHARDS": ["default", *[alias for alias in DATABASES if alias.startswith("shard_")]],
+    "DIRECTORY_CACHE_SIZE": config("TRANSACTIONS_SHARD_DIRECTORY_CACHE_SIZE", default=100000, cast=int),
+    "DIRECTORY_CACHE_TTL": config("TRANSACTIONS_SHARD_DIRECTORY_CACHE_TTL", default=5, cast=float),
+    "FAN_OUT_WORKERS": config("TRANSACTIONS_SHARD_FAN_OUT_WORKERS", default=8, cast=int),
+}
+
+# render the list endpoint from values() rows with TransactionRowSerializer instead of TransactionReadSerializer
+TRANSACTIONS_FAST_SERIALIZER = config("TRANSACTIONS_FAST_SERIALIZER", default=False, cast=bool)
@@ -0,0 +1,187 @@
+"""Latency and SQL query count regression suite of the transaction API.
+
+Every operation is sent through the django test client, so the whole stack is measured: url
+routing, the view, the services and the database. For every operation the p50, p95 and p99
+latencies and the largest number of SQL queries of a request are recorded.
+
+The results are saved as two JSON baselines per database vendor. The query counts do not depend on
+the machine, their baseline is committed and a run fails with exit code 1 when it is missing or
+when an operation issues more queries than its baseline, or has none. The latencies depend on the
+machine, their baseline is optional and kept out of the repository, a run compared with one fails
+when a p95 grows more than --p95-threshold times.
+
+Usage:
+    python -m benchmarks.api --save-baseline
+    python -m benchmarks.api --iterations 50 --p95-threshold 1.5
+"""
+import argparse
+import json
+import os
+import sys
+from decimal import Decimal
+from benchmarks.utils import Timer, setup_django, test_database
+
+BASELINES_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+CHAIN_DEPTHS = (10, 100, 1000)
+TRANSACTION_TYPES = ("Food", "Rent", "Travel", "Salary")
+
+
+def build_chain(depth):
+    """Create a chain of transactions and return its leaf."""
+    from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+
+    leaf = None
+    for _ in range(depth):
+        leaf = TransactionRepository.create_transaction(amount=Decimal(1), total_amount=Decimal(1), transaction_type="bench", parent_transaction=leaf)
+    return leaf
+
+
+def create_rows(count):
+    """Create count root transactions spread over a few types."""
+    from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+
+    transactions = [
+        TransactionRepository.build_transaction(amount=Decimal(index % 100), total_amount=Decimal(index % 100), transaction_type=TRANSACTION_TYPES[index % len(TRANSACTION_TYPES)])
+        for index in range(count)
+    ]
+    TransactionRepository.bulk_create_transactions(transactions)
+
+
+def percentile(values, fraction):
+    """Get a percentile of sorted values."""
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def measure(client, connection, send, iterations):
+    """Send a request iterations times and return its latency percentiles in ms and its largest query count."""
+    from django.test.utils import CaptureQueriesContext
+
+    # the first request warms up the caches of django, DRF and the database
+    send(client, iterations)
+    latencies, queries = [], 0
+    for iteration in range(iterations):
+        with CaptureQueriesContext(connection) as captured, Timer() as timer:
+            response = send(client, iteration)
+        assert response.status_code < 400, f"{response.status_code}: {response.content[:200]}"
+        latencies.append(timer.elapsed * 1000)
+        queries = max(queries, len(captured))
+    latencies.sort()
+    return {
+        "p50_ms": round(percentile(latencies, 0.5), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "queries": queries,
+    }
+
+
+def get_operations(rows):
+    """Set up the data and return the operations, name to function sending one request."""
+    from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+    from django.urls import reverse
+
+    create_rows(rows)
+    flat_root = TransactionRepository.create_transaction(amount=Decimal(1), total_amount=Decimal(1), transaction_type="bench")
+    leaves = {depth: build_chain(depth) for depth in CHAIN_DEPTHS}
+    deep_page = max(1, rows // 100 - 1)
+    list_url = reverse("transactions-list")
+
+    def detail_url(transaction_id):
+        return reverse("transactions-detail", args=[transaction_id])
+
+    def create_under(parent):
+        return lambda client, iteration: client.post(list_url, {"amount": 1, "transaction_type": "bench", "parent_transaction": str(parent.id)}, format="json")
+
+    operations = {"create_flat": create_under(flat_root)}
+    operations.update({f"create_chain_{depth}": create_under(leaf) for depth, leaf in leaves.items()})
+    deepest_leaf = leaves[max(CHAIN_DEPTHS)]
+    operations[f"partial_update_chain_{max(CHAIN_DEPTHS)}"] = lambda client, iteration: client.patch(
+        detail_url(deepest_leaf.id), {"amount": iteration % 2 + 1}, format="json"
+    )
+    operations["list_first_page"] = lambda client, iteration: client.get(list_url + "?page_size=100")
+    operations["list_deep_page"] = lambda client, iteration: client.get(list_url + f"?page_size=100&page={deep_page}")
+    operations["list_filter_by_type"] = lambda client, iteration: client.get(list_url + "?page_size=100&transaction_type=Rent")
+    operations["retrieve_total_amount"] = lambda client, iteration: client.get(detail_url(deepest_leaf.root_id) + "?fields=total_amount")
+    return operations
+
+
+def compare_queries(results, baseline):
+    """Get the query count regressions of the results over the baseline, an operation without a baseline is one."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            regressions.append(f"{name}: {result['queries']} queries, no baseline")
+        elif result["queries"] > baseline[name]:
+            regressions.append(f"{name}: {result['queries']} queries, baseline {baseline[name]}")
+    return regressions
+
+
+def compare_latencies(results, baseline, p95_threshold):
+    """Get the p95 regressions of the results over the baseline."""
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is not None and result["p95_ms"] > expected["p95_ms"] * p95_threshold:
+            regressions.append(f"{name}: p95 {result['p95_ms']:.2f}ms, baseline {expected['p95_ms']:.2f}ms")
+    return regressions
+
+
+def save(path, data):
+    """Save a baseline as JSON."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(data, file, indent=2, sort_keys=True)
+        file.write("\n")
+    print(f"Saved the baseline to {path}")
+
+
+def load(path):
+    """Load a baseline, None when there is none."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000, help="Transactions created for the list operations.")
+    parser.add_argument("--iterations", type=int, default=30, help="Requests per operation.")
+    parser.add_argument("--queries-baseline", help="Query count baseline, benchmarks/baselines/queries_<database vendor>.json by default.")
+    parser.add_argument("--latency-baseline", help="Latency baseline, benchmarks/baselines/latency_<database vendor>.json by default.")
+    parser.add_argument("--save-baseline", action="store_true", help="Save the results as the baselines instead of comparing them.")
+    parser.add_argument("--p95-threshold", type=float, default=1.5, help="Largest allowed ratio of the p95 over its baseline.")
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework.test import APIClient
+
+    with test_database() as connection:
+        queries_path = args.queries_baseline or os.path.join(BASELINES_DIR, f"queries_{connection.vendor}.json")
+        latency_path = args.latency_baseline or os.path.join(BASELINES_DIR, f"latency_{connection.vendor}.json")
+        client = APIClient()
+        results = {name: measure(client, connection, send, args.iterations) for name, send in get_operations(args.rows).items()}
+
+    for name, result in results.items():
+        print(f"{name:>28}: p50 {result['p50_ms']:8.2f}ms  p95 {result['p95_ms']:8.2f}ms  p99 {result['p99_ms']:8.2f}ms  {result['queries']:3d} queries")
+    if args.save_baseline:
+        save(queries_path, {name: result["queries"] for name, result in results.items()})
+        save(latency_path, {name: {key: value for key, value in result.items() if key != "queries"} for name, result in results.items()})
+        return
+    queries_baseline = load(queries_path)
+    if queries_baseline is None:
+        print(f"No query count baseline at {queries_path}, run with --save-baseline and commit it")
+        sys.exit(1)
+    regressions = compare_queries(results, queries_baseline)
+    latency_baseline = load(latency_path)
+    if latency_baseline is None:
+        print(f"No latency baseline at {latency_path}, the latencies are not compared")
+    else:
+        regressions += compare_latencies(results, latency_baseline, args.p95_threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Throughput and latency of running servers under many concurrent clients.
+
+Meant to compare the WSGI deployment and the ASGI one with the async views, against the local
+postgres container. Start both servers with one worker each, for example -
+
+    gunicorn app.wsgi --workers 1 --threads 32 --bind 127.0.0.1:8001
+    uvicorn app.asgi:application --workers 1 --port 8002
+
+then point every client at a list or retrieve endpoint of each server -
+
+    python -m benchmarks.concurrency --clients 1000 --requests 20000 \\
+        http://127.0.0.1:8001/transactions/api/v1/transactions/?page_size=10 \\
+        http://127.0.0.1:8002/transactions/api/v1/async/transactions/?page_size=10
+
+Every client keeps one HTTP/1.1 connection open and sends its requests one after the other.
+The client only uses the standard library, so nothing has to be installed to run it.
+"""
+import argparse
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+
+async def request(reader, writer, host, target):
+    """Send a GET request on an open connection and return the status code."""
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n".encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    content_length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            content_length = int(value)
+    await reader.readexactly(content_length)
+    return int(status_line.split()[1])
+
+
+async def client(url, count, latencies, errors):
+    """Send count requests to url over one connection."""
+    parts = urlsplit(url)
+    target = parts.path + (f"?{parts.query}" if parts.query else "")
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    try:
+        for _ in range(count):
+            start = time.perf_counter()
+            status = await request(reader, writer, parts.netloc, target)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run(url, clients, requests):
+    """Run the clients against url and return the requests per second, the latencies and the errors."""
+    latencies, errors = [], []
+    counts = [requests // clients + (index < requests % clients) for index in range(clients)]
+    start = time.perf_counter()
+    results = await asyncio.gather(*(client(url, count, latencies, errors) for count in counts if count), return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    errors.extend(type(result).__name__ for result in results if isinstance(result, Exception))
+    return len(latencies) / elapsed, sorted(latencies), errors
+
+
+def percentile(values, fraction):
+    """Get a percentile of sorted values."""
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("urls", nargs="+", help="Endpoints to load, one run each.")
+    parser.add_argument("--clients", type=int, default=1000, help="Concurrent clients.")
+    parser.add_argument("--requests", type=int, default=10000, help="Requests per run.")
+    args = parser.parse_args()
+
+    for url in args.urls:
+        throughput, latencies, errors = asyncio.run(run(url, args.clients, args.requests))
+        print(
+            f"{url}\n  {throughput:10.1f} requests/s  p50 {percentile(latencies, 0.5) * 1000:.1f}ms"
+            f"  p99 {percentile(latencies, 0.99) * 1000:.1f}ms  errors {len(errors)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Insert throughput into a single hot tree, with the direct and the deferred total amount modes.
+
+Every writer thread inserts transactions under the leaf of one shared chain, or under one of
+--parents children of the leaf, so in the direct mode all the writers update the same ancestor
+rows. The writers only lock the parent they insert under, with --parents as large as --writers
+the deferred mode writes no row of the shared chain. Row lock contention only shows on postgres,
+SQLite serializes all the writers on the database lock, use --writers 1 there.
+
+Usage:
+    python -m benchmarks.hot_tree --writers 16 --inserts 200 --depth 20
+    python -m benchmarks.hot_tree --modes deferred --writers 16 --parents 16
+"""
+import argparse
+import threading
+from decimal import Decimal
+from benchmarks.utils import Timer, setup_django, test_database
+
+
+def build_chain(depth):
+    """Create a chain of transactions and return its leaf."""
+    from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+
+    leaf = None
+    for _ in range(depth):
+        leaf = TransactionRepository.create_transaction(amount=Decimal(0), total_amount=Decimal(0), transaction_type="bench", parent_transaction=leaf)
+    return leaf
+
+
+def insert(leaf, inserts, errors):
+    """Insert transactions under the leaf, in the calling thread."""
+    from django.db import connection
+    from app.apps.transactions.services.transaction_service import TransactionService
+
+    try:
+        for _ in range(inserts):
+            TransactionService.create_transaction({"amount": Decimal(1), "total_amount": Decimal(1), "transaction_type": "bench", "parent_transaction": leaf})
+    except Exception as error:
+        errors.append(error)
+    finally:
+        connection.close()
+
+
+def run(mode, writers, inserts, depth, parents=1):
+    """Run the benchmark for a total amount mode and return the inserts per second."""
+    from django.test import override_settings
+    from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+    from app.apps.transactions.services.transaction_service import TransactionService
+
+    with override_settings(TRANSACTIONS_TOTAL_AMOUNT_MODE=mode):
+        leaf = build_chain(depth)
+        targets = [leaf] if parents <= 1 else [
+            TransactionRepository.create_transaction(amount=Decimal(0), total_amount=Decimal(0), transaction_type="bench", parent_transaction=leaf)
+            for _ in range(parents)
+        ]
+        errors = []
+        threads = [threading.Thread(target=insert, args=(targets[writer % len(targets)], inserts, errors)) for writer in range(writers)]
+        with Timer() as timer:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        if errors:
+            raise errors[0]
+        with Timer() as rollup_timer:
+            TransactionService.rollup_total_amount_deltas()
+    leaf.refresh_from_db()
+    assert leaf.total_amount == writers * inserts, "total amount is not exact"
+    return writers * inserts / timer.elapsed, rollup_timer.elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--inserts", type=int, default=100, help="Inserts per writer.")
+    parser.add_argument("--depth", type=int, default=20, help="Depth of the hot chain.")
+    parser.add_argument("--parents", type=int, default=1, help="Children of the leaf the writers insert under, 1 inserts under the leaf.")
+    parser.add_argument("--modes", nargs="+", choices=("direct", "deferred"), default=("direct", "deferred"), help="Total amount modes to run.")
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        for mode in args.modes:
+            throughput, rollup_seconds = run(mode, args.writers, args.inserts, args.depth, args.parents)
+            print(f"{mode:>8}: {throughput:10.1f} inserts/s  (rollup {rollup_seconds:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Serialization and rendering time of a list page, with TransactionReadSerializer and with the
+TransactionRowSerializer fast path.
+
+Both paths read the same transactions from the database, the output of the fast path is checked to
+be byte for byte the same as the output of DRF.
+
+Usage:
+    python -m benchmarks.serializer --rows 10 100 10000 --repeat 20
+"""
+import argparse
+from decimal import Decimal
+from benchmarks.utils import Timer, setup_django, test_database
+
+
+def create_transactions(count):
+    """Create count transactions, half of them with a parent."""
+    from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+
+    transactions = []
+    for index in range(count):
+        parent = transactions[index // 2] if index % 2 else None
+        transactions.append(TransactionRepository.build_transaction(amount=Decimal("12.34"), total_amount=Decimal("56.78"), transaction_type="bench", parent_transaction=parent))
+    TransactionRepository.bulk_create_transactions(transactions)
+
+
+def drf_path(queryset, renderer):
+    """Serialize model instances with TransactionReadSerializer."""
+    from app.apps.transactions.serializers import TransactionReadSerializer
+
+    with Timer() as fetch_timer:
+        transactions = list(queryset.all())
+    with Timer() as serialize_timer:
+        data = TransactionReadSerializer(transactions, many=True).data
+    with Timer() as render_timer:
+        content = renderer.render(data)
+    return content, fetch_timer.elapsed, serialize_timer.elapsed, render_timer.elapsed
+
+
+def fast_path(queryset, renderer):
+    """Serialize values() rows with TransactionRowSerializer."""
+    from app.apps.transactions.serializers import TransactionRowSerializer
+
+    serializer = TransactionRowSerializer()
+    with Timer() as fetch_timer:
+        rows = list(queryset.values(*serializer.columns))
+    with Timer() as serialize_timer:
+        data = serializer.many_to_representation(rows)
+    with Timer() as render_timer:
+        content = renderer.render(data)
+    return content, fetch_timer.elapsed, serialize_timer.elapsed, render_timer.elapsed
+
+
+def run(path, queryset, repeat):
+    """Run a path repeat times and return its output and its best fetch, serialize and render times."""
+    from rest_framework.renderers import JSONRenderer
+
+    renderer = JSONRenderer()
+    results = [path(queryset, renderer) for _ in range(repeat)]
+    return results[0][0], *(min(result[index] for result in results) for index in range(1, 4))
+
+
+def format_times(name, fetch, serialize, render):
+    """Format the times of a path in milliseconds."""
+    return f"{name} fetch {fetch * 1000:8.2f}ms serialize {serialize * 1000:8.2f}ms render {render * 1000:7.2f}ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 100, 10000])
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per path, the best one is reported.")
+    args = parser.parse_args()
+
+    setup_django()
+    from app.apps.transactions.repositories.transactionrepo import TransactionRepository
+
+    with test_database():
+        create_transactions(max(args.rows))
+        for rows in args.rows:
+            queryset = TransactionRepository.get_all_queryset().order_by("-created_at", "-id")[:rows]
+            drf_content, *drf_times = run(drf_path, queryset, args.repeat)
+            fast_content, *fast_times = run(fast_path, queryset, args.repeat)
+            assert drf_content == fast_content, "the fast path output differs from DRF"
+            print(f"{rows:>6} rows: {format_times('drf', *drf_times)}  |  {format_times('fast', *fast_times)}  x{sum(drf_times) / sum(fast_times):.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Helpers shared by the benchmarks.
+
+Benchmarks run against a throwaway test database created from the configured DATABASES, so
+they can be pointed at the local postgres container or at a SQLite settings module with
+DJANGO_SETTINGS_MODULE.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+
+def setup_django():
+    """Configure django for a standalone script."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app.settings")
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """Create a test database for the duration of the benchmark."""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+class Timer:
+    """Measures the wall clock time of a block."""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.start